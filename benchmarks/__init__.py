@@ -0,0 +1,4 @@
+"""
+Бенчмарки и офлайн-заглушки для замеров производительности.
+Запуск из корня проекта: python -m benchmarks.<имя_модуля>
+"""
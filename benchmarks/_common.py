@@ -0,0 +1,31 @@
+"""
+Общие хелперы бенчмарков: направляют openai_client на локальную заглушку
+и уводят логи во временную папку, чтобы не трогать logs/ проекта.
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def use_fake_openai(base_url: str, logs_dir: Path | None = None) -> Path:
+    """
+    Настраивает openai_client на заглушку (base_url) и временную папку логов.
+    Возвращает путь к папке логов.
+    """
+    os.environ.setdefault("OPENAI_API_KEY", "sk-fake")
+    os.environ["OPENAI_BASE_URL"] = base_url
+    import homework_store
+    import openai_client
+    import usage_logger
+
+    logs_dir = logs_dir or Path(tempfile.mkdtemp(prefix="bench_logs_"))
+    openai_client._client = None
+    openai_client._async_client = None
+    usage_logger.configure_usage_logger("csv", logs_dir / "usage.csv")
+    homework_store.configure_results_store(logs_dir / homework_store.RESULTS_FILENAME)
+    return logs_dir
@@ -0,0 +1,59 @@
+"""
+Бенчмарк: N параллельных пользователей через async_chat_completion против
+последовательных вызовов chat_completion (как раньше блокировал бот).
+
+Запуск: python -m benchmarks.bench_async_concurrency --users 20 --latency 0.5
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+
+async def _run_async(users: int) -> float:
+    import openai_client
+
+    # Прогрев: создание клиента и первое соединение не входят в замер
+    await openai_client.async_chat_completion([{"role": "user", "content": "warmup"}])
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        openai_client.async_chat_completion([{"role": "user", "content": f"Привет от {i}"}])
+        for i in range(users)
+    ))
+    elapsed = time.perf_counter() - start
+    await openai_client.close_async_client()
+    return elapsed
+
+
+def _run_sync(users: int) -> float:
+    import openai_client
+
+    start = time.perf_counter()
+    for i in range(users):
+        openai_client.chat_completion([{"role": "user", "content": f"Привет от {i}"}])
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        use_fake_openai(server.base_url)
+        _run_sync(1)  # прогрев
+        one = _run_sync(1)
+        seq = _run_sync(args.users)
+        conc = asyncio.run(_run_async(args.users))
+
+    print(f"Задержка заглушки: {args.latency:.2f} с, пользователей: {args.users}")
+    print(f"  1 запрос (sync):                 {one:.2f} с")
+    print(f"  {args.users} запросов последовательно (sync): {seq:.2f} с")
+    print(f"  {args.users} запросов параллельно (async):    {conc:.2f} с  (x{conc / one:.2f} от одного)")
+
+
+if __name__ == "__main__":
+    main()
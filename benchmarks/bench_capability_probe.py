@@ -0,0 +1,69 @@
+"""
+Бенчмарк: модель отклоняет temperature (заглушка с --reject-temperature).
+Без кэша возможностей каждый вызов — два запроса (400 + повтор без temperature),
+с кэшем — проба только в первом вызове. Проверяется и сохранение в файл:
+новый экземпляр кэша, прочитавший файл, не делает пробу вовсе.
+
+Запуск: python -m benchmarks.bench_capability_probe --calls 20 --latency 0.1
+"""
+import argparse
+import time
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+
+def _run(calls: int, remember: bool) -> float:
+    import openai_client
+    from model_capabilities import configure_model_capabilities
+
+    configure_model_capabilities()
+    start = time.perf_counter()
+    for i in range(calls):
+        if not remember:
+            configure_model_capabilities()  # как раньше: о прошлых отказах ничего не известно
+        openai_client.chat_completion([{"role": "user", "content": f"Вопрос {i}"}])
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.1)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency, reject_temperature=True) as server:
+        logs_dir = use_fake_openai(server.base_url)
+        import openai_client
+        from model_capabilities import configure_model_capabilities, get_model_capabilities
+
+        _run(1, remember=False)  # прогрев соединения
+        before = server.stats()["requests_total"]
+        forget = _run(args.calls, remember=False)
+        forget_requests = server.stats()["requests_total"] - before
+
+        before = server.stats()["requests_total"]
+        remember = _run(args.calls, remember=True)
+        remember_requests = server.stats()["requests_total"] - before
+        stats = get_model_capabilities().stats()
+
+        path = logs_dir / "model_capabilities.json"
+        configure_model_capabilities(path)
+        openai_client.chat_completion([{"role": "user", "content": "сохранить"}])
+        configure_model_capabilities(path)  # «перезапуск»: кэш читается из файла
+        before = server.stats()["requests_total"]
+        openai_client.chat_completion([{"role": "user", "content": "после перезапуска"}])
+        persisted_requests = server.stats()["requests_total"] - before
+
+    print(f"Задержка заглушки: {args.latency:.2f} с, вызовов: {args.calls}")
+    print(f"  без кэша возможностей: {forget:.2f} с, запросов к API: {forget_requests}")
+    print(f"  с кэшем:               {remember:.2f} с, запросов к API: {remember_requests}")
+    print(
+        f"  счётчики: попаданий {stats['probe_hits']}, промахов {stats['probe_misses']}, "
+        f"найдено неподдерживаемых: {stats['unsupported_found']}"
+    )
+    print(f"  после перезапуска с файлом: запросов на вызов {persisted_requests}")
+
+
+if __name__ == "__main__":
+    main()
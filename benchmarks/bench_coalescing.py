@@ -0,0 +1,123 @@
+"""
+Бенчмарк объединения одинаковых запросов в полёте (single_flight): N пользователей
+одновременно запускают промпты ДЗ (1 и 2 по очереди) через заглушку OpenAI,
+которая считает запросы.
+
+- до: OPENAI_COALESCE_REQUESTS = False — по запросу к модели на пользователя;
+- после: OPENAI_COALESCE_REQUESTS = True — одинаковые запросы в полёте идут одним, ответ получают все.
+Проверяется учёт usage: в usage.csv по строке на пользователя, сумма токенов в логе
+равна токенам запросов, реально ушедших к модели. Отдельно — потоки (chat_completion)
+и отмена ведущего запроса: остальные всё равно получают ответ.
+
+Запуск: python -m benchmarks.bench_coalescing --users 50 --latency 0.5
+"""
+import argparse
+import asyncio
+import csv
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+
+async def _burst(users: int) -> list[dict]:
+    from openai_client import async_run_homework_prompt, close_async_client
+
+    try:
+        return await asyncio.gather(*(async_run_homework_prompt(1 + i % 2) for i in range(users)))
+    finally:
+        await close_async_client()
+
+
+async def _cancel_leader(followers: int) -> int:
+    """Отменяет первый (ведущий) вызов; возвращает, сколько остальных получили ответ."""
+    from openai_client import async_chat_completion, close_async_client
+
+    messages = [{"role": "user", "content": "одинаковый вопрос"}]
+    try:
+        leader = asyncio.ensure_future(async_chat_completion(messages))
+        await asyncio.sleep(0)
+        rest = [asyncio.ensure_future(async_chat_completion(messages)) for _ in range(followers)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        results = await asyncio.gather(*rest, return_exceptions=True)
+        return sum(1 for r in results if isinstance(r, tuple) and r[0])
+    finally:
+        await close_async_client()
+
+
+def _usage_rows(logs_dir: Path) -> list[dict[str, str]]:
+    from usage_logger import shutdown_usage_logger
+
+    shutdown_usage_logger()
+    with open(logs_dir / "usage.csv", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def _run(server: FakeOpenAIServer, users: int, coalesce: bool) -> None:
+    import openai_client
+    from single_flight import configure_single_flight
+
+    logs_dir = use_fake_openai(server.base_url)
+    openai_client.OPENAI_COALESCE_REQUESTS = coalesce
+    flight = configure_single_flight()
+    before = server.stats()["requests_total"]
+    start = time.perf_counter()
+    outs = asyncio.run(_burst(users))
+    elapsed = time.perf_counter() - start
+    upstream = server.stats()["requests_total"] - before
+
+    rows = _usage_rows(logs_dir)
+    logged = sum(int(r["total_tokens"]) for r in rows)
+    # Объединённым вызовам возвращается usage ведущего (coalesced) — его токены уже посчитаны
+    charged = [o["usage"]["total_tokens"] for o in outs if not o["usage"].get("coalesced")]
+    answers = {(1 + i % 2, str(o["result"])) for i, o in enumerate(outs)}
+    print(
+        f"  {'после' if coalesce else 'до':<6} запросов к модели {upstream}, время {elapsed:.2f} с, "
+        f"разных ответов на {len({p for p, _ in answers})} промпта: {len(answers)}, "
+        f"объединено {flight.followers}"
+    )
+    print(
+        f"         usage.csv: строк {len(rows)}/{users}, токенов {logged} "
+        f"(не объединённых вызовов {len(charged)}, их токенов {sum(charged)})"
+    )
+
+
+def _threads(server: FakeOpenAIServer, threads: int) -> None:
+    from openai_client import chat_completion
+    from single_flight import configure_single_flight
+
+    use_fake_openai(server.base_url)
+    flight = configure_single_flight()
+    before = server.stats()["requests_total"]
+    messages = [{"role": "user", "content": "вопрос из потока"}]
+    with ThreadPoolExecutor(threads) as pool:
+        results = list(pool.map(lambda _: chat_completion(messages), range(threads)))
+    upstream = server.stats()["requests_total"] - before
+    print(
+        f"Потоки: {threads} одинаковых chat_completion — запросов к модели {upstream}, "
+        f"ответов {sum(1 for text, _ in results if text)}/{threads}, объединено {flight.followers}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5, help="задержка ответа заглушки, с")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency, chunk_delay=0.0, seed=1) as server:
+        print(f"{args.users} пользователей одновременно запускают промпты ДЗ 1 и 2, задержка модели {args.latency} с")
+        _run(server, args.users, coalesce=False)
+        _run(server, args.users, coalesce=True)
+        _threads(server, args.threads)
+        use_fake_openai(server.base_url)
+        got = asyncio.run(_cancel_leader(args.users - 1))
+        print(f"Отмена ведущего вызова: ответ получили {got}/{args.users - 1} остальных")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Бенчмарк хранилищ контекста (CONTEXT_BACKEND): memory, sqlite (WAL) и sqlite без WAL.
+
+Для каждого хранилища на N пользователях (по умолчанию 100k, в памяти держится
+не больше MAX_CONTEXT_USERS — остальные вытесняются и подгружаются с диска):
+- append: append_messages по пользователям по кругу (время на вызов, с отложенной записью);
+- flush: дописывание очереди на диск;
+- get: select_context по тем же пользователям (горячие — из памяти, холодные — с диска);
+- restart: select_context после «перезапуска» (память пуста, всё читается с диска).
+
+Запуск: python -m benchmarks.bench_context_backends --users 100000 --rounds 3
+"""
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+import context_manager
+
+
+def _bench(kind: str, path: Path | None, users: int, rounds: int, reads: int, **kwargs) -> dict[str, float]:
+    context_manager.configure_context_backend(kind, path, **kwargs)
+    rng = random.Random(1)
+    start = time.perf_counter()
+    for r in range(rounds):
+        for user_id in range(users):
+            context_manager.append_messages(
+                user_id,
+                {"role": "user", "content": f"Вопрос {r} пользователя {user_id}"},
+                {"role": "assistant", "content": f"Ответ {r}: пейте воду каждый час."},
+            )
+    append = time.perf_counter() - start
+
+    start = time.perf_counter()
+    context_manager.get_context_backend().flush()
+    flush = time.perf_counter() - start
+
+    sample = [rng.randrange(users) for _ in range(reads)]
+    start = time.perf_counter()
+    found = sum(1 for user_id in sample if context_manager.select_context(user_id))
+    get = time.perf_counter() - start
+
+    # «Перезапуск»: то же хранилище, пустая память
+    context_manager.configure_context_backend(kind, path, **kwargs)
+    start = time.perf_counter()
+    restored = sum(1 for user_id in sample if context_manager.select_context(user_id))
+    restart = time.perf_counter() - start
+    context_manager.close_context_backend()
+    return {
+        "append_us": append / (users * rounds) * 1e6,
+        "flush_s": flush,
+        "get_us": get / reads * 1e6,
+        "found": found / reads,
+        "restart_get_us": restart / reads * 1e6,
+        "restored": restored / reads,
+        "size_mb": path.stat().st_size / 1024 / 1024 if path and path.exists() else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=3, help="пар сообщений на пользователя")
+    parser.add_argument("--reads", type=int, default=20_000, help="выборочных чтений контекста")
+    parser.add_argument(
+        "--memory-users", type=int, default=context_manager.MAX_CONTEXT_USERS,
+        help="пользователей в памяти (MAX_CONTEXT_USERS); = --users — без вытеснения",
+    )
+    args = parser.parse_args()
+    context_manager.MAX_CONTEXT_USERS = args.memory_users
+    tmp = Path(tempfile.mkdtemp(prefix="bench_context_"))
+
+    print(
+        f"Пользователей: {args.users} (в памяти до {args.memory_users}), "
+        f"пар сообщений на пользователя: {args.rounds}, чтений: {args.reads}"
+    )
+    print(
+        f"{'хранилище':>12} | {'append, мкс':>11} | {'flush, с':>8} | {'get, мкс':>8} | "
+        f"{'найдено':>7} | {'после перезапуска, мкс':>22} | {'восст.':>6} | {'файл, МБ':>8}"
+    )
+    variants = [
+        ("memory", "memory", None, {}),
+        ("sqlite-wal", "sqlite", tmp / "wal.sqlite3", {"wal": True}),
+        ("sqlite", "sqlite", tmp / "nowal.sqlite3", {"wal": False}),
+    ]
+    for label, kind, path, kwargs in variants:
+        r = _bench(kind, path, args.users, args.rounds, args.reads, **kwargs)
+        print(
+            f"{label:>12} | {r['append_us']:>11.2f} | {r['flush_s']:>8.2f} | {r['get_us']:>8.2f} | "
+            f"{r['found']:>6.0%} | {r['restart_get_us']:>22.2f} | {r['restored']:>5.0%} | {r['size_mb']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Бенчмарк сжатия длинных диалогов (CONTEXT_SUMMARY_*): токены промпта на ход и сохранность
+раннего факта на длинных диалогах: обрезка по числу сообщений, по бюджету токенов и сжатие.
+
+Модель сжатия — заглушка: переносит в краткое содержание строки с «фактами» (здесь — имя
+пользователя из первого сообщения) и первые слова остальных реплик, с задержкой --summary-latency,
+чтобы было видно, что ответ её не ждёт (сжатие дожидается между раундами ходов —
+в живом чате пауза между сообщениями пользователя дольше запроса сжатия).
+
+Запуск: python -m benchmarks.bench_context_summary --users 20 --turns 100
+"""
+import argparse
+import time
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+import context_manager
+from percentiles import summarize
+from token_counter import count_message_tokens
+
+_FACT = "Меня зовут Аня, я пью кофе по утрам."
+
+
+def _stub_summarizer(latency: float):
+    def summarize_stub(previous: str | None, messages: list[dict]) -> tuple[str, dict[str, int]]:
+        time.sleep(latency)
+        facts = [previous] if previous else []
+        facts += [m["content"] for m in messages if "зовут" in m["content"]]
+        topics = [m["content"].split()[0] for m in messages if m["role"] == "user"]
+        # Как у модели с max_tokens: краткое содержание не растёт бесконечно
+        summary = " ".join((" ".join(facts) + " Обсуждали: " + ", ".join(topics[-5:]) + ".").split()[:60])
+        return summary, {"prompt_tokens": sum(count_message_tokens(m) for m in messages), "completion_tokens": 40}
+
+    return summarize_stub
+
+
+def _run(users: int, turns: int, mode: str, compact: bool, latency: float) -> dict:
+    context_manager.CONTEXT_MODE = mode
+    context_manager.configure_context_backend("memory")
+    context_manager.CONTEXT_SUMMARY_ENABLED = compact
+    context_manager.configure_summarizer(_stub_summarizer(latency))
+    prompt_tokens: list[int] = []
+    turn_times: list[float] = []
+    for turn in range(turns):
+        for user_id in range(users):
+            text = _FACT if turn == 0 else f"Вопрос{turn} про воду и режим дня, что посоветуешь?"
+            user_message = {"role": "user", "content": text}
+            start = time.perf_counter()
+            context = context_manager.select_context(user_id)
+            messages = [*context, user_message]
+            context_manager.append_messages(
+                user_id, user_message, {"role": "assistant", "content": f"Ответ на вопрос {turn}: пейте воду."}
+            )
+            turn_times.append(time.perf_counter() - start)
+            prompt_tokens.append(sum(count_message_tokens(m) for m in messages))
+        # Между ходами одного пользователя в живом чате проходит больше, чем длится сжатие
+        context_manager.wait_for_summaries()
+    remembered = sum(
+        1 for user_id in range(users)
+        if any("Аня" in m["content"] for m in context_manager.select_context(user_id))
+    )
+    return {
+        "tokens": summarize(prompt_tokens),
+        "turn_us": summarize(t * 1e6 for t in turn_times),
+        "remembered": remembered,
+        "stats": context_manager.get_stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--summary-latency", type=float, default=0.05, help="задержка заглушки модели сжатия, с")
+    args = parser.parse_args()
+
+    print(
+        f"Пользователей: {args.users}, ходов: {args.turns}, лимит истории: {context_manager.MAX_CONTEXT_MESSAGES} "
+        f"сообщений или {context_manager.context_token_budget()} токенов (CONTEXT_MODE=tokens)"
+    )
+    variants = (
+        ("messages", "messages", False),
+        ("tokens", "tokens", False),
+        ("сжатие", "messages", True),
+    )
+    for label, mode, compact in variants:
+        r = _run(args.users, args.turns, mode, compact, args.summary_latency)
+        t = r["tokens"]
+        st = r["stats"]
+        print(
+            f"  {label:>8}: токенов промпта на ход p50 {t['p50']:.0f}, p99 {t['p99']:.0f}, макс {t['max']:.0f}; "
+            f"ход p99 {r['turn_us']['p99']:.0f} мкс; факт из 1-го сообщения помнят: {r['remembered']}/{args.users}"
+        )
+        if compact:
+            print(
+                f"              сжатий {st['compactions']}, свёрнуто сообщений {st['messages_folded']}, "
+                f"сэкономлено токенов против полной истории (оценка) {st['tokens_saved']}, токенов на сжатие "
+                f"{st['summary_prompt_tokens']} + {st['summary_completion_tokens']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Бенчмарк: токены промпта на каждый ход при обрезке по числу сообщений
+(CONTEXT_MODE = "messages") и по бюджету токенов (CONTEXT_MODE = "tokens")
+на синтетических длинных диалогах с редкими большими вставками текста.
+
+Запуск: python -m benchmarks.bench_context_tokens --turns 200 --users 20
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+import context_manager
+from token_counter import count_message_tokens
+
+_WORDS = (
+    "вода привычка офис план шаг утро обед вечер напоминание бутылка стакан "
+    "water habit office plan step reminder bottle glass morning lunch"
+).split()
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def _conversation(rng: random.Random, turns: int) -> list[tuple[str, str]]:
+    """Пары (вопрос, ответ): в основном короткие, примерно каждый 15-й вопрос — длинная вставка."""
+    pairs = []
+    for _ in range(turns):
+        question_words = rng.randint(800, 2000) if rng.random() < 1 / 15 else rng.randint(5, 30)
+        pairs.append((_phrase(rng, question_words), _phrase(rng, rng.randint(30, 150))))
+    return pairs
+
+
+def _simulate(mode: str, conversations: list[list[tuple[str, str]]]) -> tuple[list[int], list[int], float]:
+    """Возвращает (токены промпта по ходам, сообщений истории по ходам, секунд на выбор контекста)."""
+    context_manager.CONTEXT_MODE = mode
+    context_manager._context.clear()
+    context_manager._total_bytes = 0
+    prompt_tokens: list[int] = []
+    history_sizes: list[int] = []
+    select_time = 0.0
+    for user_id, conversation in enumerate(conversations):
+        for question, answer in conversation:
+            user_message = {"role": "user", "content": question}
+            start = time.perf_counter()
+            reserved = count_message_tokens(user_message)
+            context = context_manager.select_context(user_id, reserved_tokens=reserved)
+            select_time += time.perf_counter() - start
+            messages = [*context, user_message]
+            # Считаем отправляемые токены заново, независимо от кэша хранилища
+            prompt_tokens.append(sum(count_message_tokens(m) for m in messages))
+            history_sizes.append(len(context))
+            context_manager.append_messages(user_id, user_message, {"role": "assistant", "content": answer})
+    return prompt_tokens, history_sizes, select_time
+
+
+def _report(name: str, prompt_tokens: list[int], history_sizes: list[int], select_time: float) -> None:
+    p95 = statistics.quantiles(prompt_tokens, n=100)[94]
+    print(
+        f"  {name:<10} токенов/ход: среднее {statistics.mean(prompt_tokens):7.0f}, p95 {p95:7.0f}, "
+        f"макс {max(prompt_tokens):6d}, всего {sum(prompt_tokens):9d} | "
+        f"сообщений истории: среднее {statistics.mean(history_sizes):5.1f} | "
+        f"выбор контекста: {select_time / len(prompt_tokens) * 1e6:.1f} мкс/ход"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    conversations = [_conversation(rng, args.turns) for _ in range(args.users)]
+    print(
+        f"Диалогов: {args.users}, ходов: {args.turns}, MAX_CONTEXT_MESSAGES={context_manager.MAX_CONTEXT_MESSAGES}, "
+        f"бюджет токенов={context_manager.context_token_budget()}"
+    )
+    for mode in ("messages", "tokens"):
+        _report(mode, *_simulate(mode, conversations))
+
+
+if __name__ == "__main__":
+    main()
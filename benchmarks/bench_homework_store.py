@@ -0,0 +1,85 @@
+"""
+Бенчмарк: стоимость сохранения одного результата ДЗ в зависимости от числа уже
+сохранённых. «До» — прежняя схема (прочитать весь JSON-список, дописать, перезаписать
+с indent=2), «после» — HomeworkResultsStore (одна строка JSONL).
+
+Запуск: python -m benchmarks.bench_homework_store --sizes 0,1000,10000,100000
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+from homework_store import HomeworkResultsStore
+
+
+def _entry(i: int) -> dict:
+    return {
+        "prompt_id": 1 + i % 2,
+        "datetime": f"2025-01-{1 + i % 28:02d} 12:{i % 60:02d}:00",
+        "usage": {"prompt_tokens": 250, "completion_tokens": 120, "total_tokens": 370},
+        "parsed": True,
+        "result": {"title": "План", "steps": ["Шаг 1", "Шаг 2", "Шаг 3"], "notes": ["Заметка"]},
+    }
+
+
+def _legacy_save(path: Path, entry: dict) -> None:
+    """Копия прежнего openai_client._save_homework_result (read-modify-write)."""
+    data = []
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    data.append(entry)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="0,1000,10000,100000")
+    parser.add_argument("--saves", type=int, default=20, help="замеряемых сохранений на точку")
+    parser.add_argument("--legacy-max", type=int, default=10000, help="не гонять прежнюю схему выше этого размера")
+    args = parser.parse_args()
+    sizes = [int(x) for x in args.sizes.split(",")]
+    tmp = Path(tempfile.mkdtemp(prefix="bench_hw_"))
+
+    print(f"{'сохранено':>10} | {'JSONL, мс/сохр.':>16} | {'JSON-список, мс/сохр.':>22}")
+    for size in sizes:
+        jsonl_path = tmp / f"results_{size}.jsonl"
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            for i in range(size):
+                f.write(json.dumps(_entry(i), ensure_ascii=False) + "\n")
+        store = HomeworkResultsStore(jsonl_path)
+        start = time.perf_counter()
+        for i in range(args.saves):
+            store.append(_entry(size + i))
+        jsonl_ms = (time.perf_counter() - start) / args.saves * 1000
+        store.close()
+
+        legacy_cell = "—"
+        if size <= args.legacy_max:
+            legacy_path = tmp / f"results_{size}.json"
+            with open(legacy_path, "w", encoding="utf-8") as f:
+                json.dump([_entry(i) for i in range(size)], f, ensure_ascii=False, indent=2)
+            start = time.perf_counter()
+            for i in range(args.saves):
+                _legacy_save(legacy_path, _entry(size + i))
+            legacy_cell = f"{(time.perf_counter() - start) / args.saves * 1000:.3f}"
+        print(f"{size:>10} | {jsonl_ms:>16.3f} | {legacy_cell:>22}")
+
+    # Поиск по индексу на самом большом файле
+    store = HomeworkResultsStore(tmp / f"results_{sizes[-1]}.jsonl")
+    start = time.perf_counter()
+    store.find(prompt_id=1, since="2025-01-05", until="2025-01-05")
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    found = store.find(prompt_id=1, since="2025-01-05", until="2025-01-05")
+    again = time.perf_counter() - start
+    print(f"find(prompt_id=1, день): {len(found)} записей, построение индекса {first * 1000:.1f} мс, повторно {again * 1000:.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
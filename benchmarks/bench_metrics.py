@@ -0,0 +1,79 @@
+"""
+Бенчмарк накладных расходов metrics: стоимость timer()/inc() на вызов при выключенных
+и включённых метриках, время отрисовки Prometheus-текста и JSON-снимка, проверка
+HTTP-эндпоинта /metrics на свободном порту (port=0).
+
+Запуск: python -m benchmarks.bench_metrics --calls 1000000
+"""
+import argparse
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+import metrics
+
+
+def _per_call_ns(calls: int) -> dict[str, float]:
+    start = time.perf_counter()
+    for _ in range(calls):
+        pass
+    baseline = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        with metrics.timer("bench"):
+            pass
+    timer = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        metrics.inc("bench")
+    inc = time.perf_counter() - start
+    return {
+        "timer_ns": (timer - baseline) / calls * 1e9,
+        "inc_ns": (inc - baseline) / calls * 1e9,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1_000_000)
+    parser.add_argument("--stages", type=int, default=10, help="этапов в экспорте")
+    args = parser.parse_args()
+
+    print(f"Вызовов: {args.calls}")
+    for enabled in (False, True):
+        metrics.configure_metrics(enabled)
+        r = _per_call_ns(args.calls)
+        print(
+            f"  метрики {'включены ' if enabled else 'выключены'}: "
+            f"timer {r['timer_ns']:>6.0f} нс/вызов, inc {r['inc_ns']:>6.0f} нс/вызов"
+        )
+
+    for i in range(args.stages):
+        for _ in range(2000):
+            metrics.observe(f"stage_{i}", 0.01 * (i + 1))
+    start = time.perf_counter()
+    text = metrics.render_prometheus()
+    render = time.perf_counter() - start
+    path = Path(tempfile.mkdtemp(prefix="bench_metrics_")) / "metrics.json"
+    start = time.perf_counter()
+    metrics.dump_json(path)
+    dump = time.perf_counter() - start
+    print(
+        f"  экспорт {args.stages} этапов: Prometheus {render * 1000:.2f} мс ({len(text)} байт), "
+        f"JSON {dump * 1000:.2f} мс ({path.stat().st_size} байт)"
+    )
+
+    server = metrics.start_http_server(0, host="127.0.0.1")
+    with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics", timeout=5) as resp:
+        body = resp.read().decode("utf-8")
+    server.shutdown()
+    print(f"  GET /metrics: {resp.status}, строк {len(body.splitlines())}, первая: {body.splitlines()[0]}")
+
+
+if __name__ == "__main__":
+    main()
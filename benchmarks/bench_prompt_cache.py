@@ -0,0 +1,90 @@
+"""
+Бенчмарк кэша промптов провайдера: длинные диалоги через async_chat_completion
+с system prompt, заглушка OpenAI отдаёт cached_tokens как настоящий API
+(совпавшее начало запроса блоками по 128 токенов, от 1024 токенов).
+
+- до: история — последние MAX_CONTEXT_MESSAGES сообщений; когда буфер заполнен,
+  начало истории сдвигается на каждом ходу, и кэш промптов не срабатывает;
+- после: CONTEXT_PREFIX_STEP — начало истории выровнено, запрос несколько ходов
+  начинается одинаково.
+Итоги — из usage.csv через usage_report: входные токены, из них из кэша, доля и стоимость
+(цена входа из кэша — MODEL_PRICES_PER_1M_TOKENS).
+
+Запуск: python -m benchmarks.bench_prompt_cache --users 20 --turns 30 --step 10
+"""
+import argparse
+import asyncio
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+SYSTEM = (
+    "Ты — вежливый помощник по здоровым привычкам для офисных сотрудников. Отвечай по делу, "
+    "коротко и без медицинских диагнозов. "
+) * 6
+
+
+async def _dialog(user_id: int, turns: int) -> None:
+    from context_manager import append_messages, select_context
+    from openai_client import async_chat_completion
+    from token_counter import count_message_tokens
+
+    for turn in range(turns):
+        user_message = {"role": "user", "content": f"Пользователь {user_id}, вопрос {turn}: как не забывать пить воду?"}
+        context = select_context(user_id, reserved_tokens=count_message_tokens(user_message))
+        text, _ = await async_chat_completion([*context, user_message], system_message=SYSTEM)
+        append_messages(user_id, user_message, {"role": "assistant", "content": text})
+
+
+async def _run_dialogs(first_user: int, users: int, turns: int) -> None:
+    from openai_client import close_async_client
+
+    try:
+        await asyncio.gather(*(_dialog(first_user + i, turns) for i in range(users)))
+    finally:
+        await close_async_client()
+
+
+def _run(server: FakeOpenAIServer, args: argparse.Namespace, step: int, first_user: int) -> None:
+    import context_manager
+    from usage_logger import shutdown_usage_logger
+    from usage_report import build_report
+
+    logs_dir = use_fake_openai(server.base_url)
+    context_manager.CONTEXT_PREFIX_STEP = step
+    asyncio.run(_run_dialogs(first_user, args.users, args.turns))
+    shutdown_usage_logger()
+    report = build_report([logs_dir / "usage.csv"], summary_path=None)
+    t = report["totals"]
+    label = f"после (шаг {step})" if step else "до"
+    print(
+        f"  {label:<14} запросов {t['requests']}, вход {t['prompt_tokens']} токенов "
+        f"({t['prompt_tokens'] / t['requests']:.0f} на запрос), из кэша {t['cached_tokens']} "
+        f"({t['cached_share']:.0%}), стоимость ${t['cost_usd']:.4f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--step", type=int, default=10, help="CONTEXT_PREFIX_STEP для «после»")
+    parser.add_argument("--reply-words", type=int, default=150, help="слов в ответе заглушки")
+    parser.add_argument("--min-tokens", type=int, default=1024, help="минимум совпавшего начала для кэша")
+    args = parser.parse_args()
+
+    from config import MAX_CONTEXT_MESSAGES
+
+    print(
+        f"{args.users} диалогов по {args.turns} ходов, история до {MAX_CONTEXT_MESSAGES} сообщений, "
+        f"ответ ~{args.reply_words} слов"
+    )
+    with FakeOpenAIServer(
+        latency=0.0, chunk_delay=0.0, reply_words=args.reply_words, seed=1, prompt_cache_min_tokens=args.min_tokens,
+    ) as server:
+        _run(server, args, step=0, first_user=1)
+        _run(server, args, step=args.step, first_user=1 + args.users)
+
+
+if __name__ == "__main__":
+    main()
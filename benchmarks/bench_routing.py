@@ -0,0 +1,145 @@
+"""
+Бенчмарк выбора модели и хеджирования: смесь запросов бота (короткие и длинные ходы
+диалога, прогоны ДЗ) через заглушку OpenAI, у моделей которой разные профили задержки
+(model_profiles: базовая задержка, разброс и хвост — доля очень медленных ответов).
+
+- до: одна модель OPENAI_MODEL на всё;
+- маршруты: OPENAI_ROUTING_ENABLED — короткие ходы к быстрой модели, длинные и ДЗ — к своим;
+- маршруты + хеджирование: OPENAI_HEDGE_ENABLED — запасной запрос после p95 модели;
+- деградация: быстрая модель отвечает 500 на долю запросов (повторы планировщика выключены,
+  чтобы ошибки доходили до вызывающего) — со статистикой моделей маршрут уходит
+  на следующую модель, без неё (порог ошибок 100%) — нет.
+Для каждого прогона — p50/p95/p99 времени ответа по видам запросов, ошибки, запросы
+по моделям и стоимость (usage.csv через usage_report).
+
+Запуск: python -m benchmarks.bench_routing --chat 500 --homework 60 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+from collections.abc import Awaitable
+from typing import Any
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+PROFILES = {
+    "gpt-4o-mini": {"latency": 0.5, "jitter": 0.15, "slow_rate": 0.04, "slow_latency": 2.5},
+    "gpt-4.1-nano": {"latency": 0.15, "jitter": 0.05, "slow_rate": 0.04, "slow_latency": 2.0},
+    "gpt-4.1-mini": {"latency": 0.6, "jitter": 0.15, "slow_rate": 0.04, "slow_latency": 2.5},
+}
+LONG_CONTEXT = "Пользователь подробно описывает свой рабочий день и привычки. " * 80  # ~1200 токенов
+
+
+async def _timed(kind: str, coro: Awaitable[Any], results: dict[str, list[float]], errors: dict[str, int]) -> None:
+    start = time.perf_counter()
+    try:
+        await coro
+    except Exception:
+        errors[kind] = errors.get(kind, 0) + 1
+        return
+    results.setdefault(kind, []).append(time.perf_counter() - start)
+
+
+async def _workload(args: argparse.Namespace) -> tuple[dict[str, list[float]], dict[str, int]]:
+    from openai_client import async_chat_completion, async_run_homework_prompt, close_async_client
+
+    results: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    limit = asyncio.Semaphore(args.concurrency)
+
+    async def one(i: int) -> None:
+        async with limit:
+            if i < args.homework:
+                await _timed("ДЗ", async_run_homework_prompt(1 + i % 2, use_cache=False), results, errors)
+            elif i % 5 == 0:
+                messages = [
+                    {"role": "user", "content": LONG_CONTEXT},
+                    {"role": "user", "content": f"Вопрос {i}: что поменять в первую очередь?"},
+                ]
+                await _timed("длинный ход", async_chat_completion(messages, use_cache=False), results, errors)
+            else:
+                messages = [{"role": "user", "content": f"Вопрос {i}: как не забывать пить воду?"}]
+                await _timed("короткий ход", async_chat_completion(messages, use_cache=False), results, errors)
+
+    total = args.chat + args.homework
+    # ДЗ вперемешку с диалогом, а не первыми
+    order = sorted(range(total), key=lambda i: (i * 7919) % total)
+    try:
+        await asyncio.gather(*(one(i) for i in order))
+    finally:
+        await close_async_client()
+    return results, errors
+
+
+def _run(server: FakeOpenAIServer, args: argparse.Namespace, label: str, routing: bool, hedge: bool, **router: float) -> None:
+    import openai_client
+    from model_router import configure_model_router
+    from percentiles import summarize
+    from request_scheduler import configure_request_scheduler
+    from usage_logger import shutdown_usage_logger
+    from usage_report import build_report
+
+    logs_dir = use_fake_openai(server.base_url)
+    openai_client.OPENAI_ROUTING_ENABLED = routing
+    openai_client.OPENAI_HEDGE_ENABLED = hedge
+    configure_request_scheduler(max_retries=args.retries)
+    router_obj = configure_model_router(**router)
+    before = dict(server.stats()["requests_by_model"])
+    start = time.perf_counter()
+    results, errors = asyncio.run(_workload(args))
+    elapsed = time.perf_counter() - start
+    shutdown_usage_logger()
+    by_model = {
+        model: count - before.get(model, 0)
+        for model, count in sorted(server.stats()["requests_by_model"].items())
+        if count - before.get(model, 0)
+    }
+    cost = build_report([logs_dir / "usage.csv"], summary_path=None)["totals"]["cost_usd"]
+    stats = router_obj.stats()
+
+    print(f"  {label}: {elapsed:.1f} с, стоимость ${cost:.4f}")
+    for kind in ("короткий ход", "длинный ход", "ДЗ"):
+        s = summarize(results.get(kind, []))
+        print(
+            f"    {kind:<13} p50 {s['p50']:.2f} с, p95 {s['p95']:.2f} с, p99 {s['p99']:.2f} с, "
+            f"ошибок {errors.get(kind, 0)}"
+        )
+    print(f"    запросов к моделям: {', '.join(f'{m} {n}' for m, n in by_model.items())}")
+    if hedge:
+        print(f"    запасных запросов {stats['hedges']} (выиграли {stats['hedge_wins']}, сверх бюджета {stats['hedges_denied']})")
+    if routing:
+        print(f"    в обход первой модели маршрута: {stats['fallbacks']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chat", type=int, default=500, help="ходов диалога (каждый пятый — длинный)")
+    parser.add_argument("--homework", type=int, default=60, help="прогонов ДЗ")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--retries", type=int, default=4, help="повторов планировщика (кроме «деградации»)")
+    parser.add_argument("--degraded-error-rate", type=float, default=0.5, help="доля 500 у быстрой модели в «деградации»")
+    args = parser.parse_args()
+
+    print(f"{args.chat} ходов диалога и {args.homework} прогонов ДЗ, параллельно {args.concurrency}; профили моделей:")
+    for model, profile in PROFILES.items():
+        print(
+            f"  {model}: {profile['latency']} ± {profile['jitter']} с, "
+            f"{profile['slow_rate']:.0%} ответов за {profile['slow_latency']} с"
+        )
+    with FakeOpenAIServer(chunk_delay=0.0, seed=1, model_profiles=PROFILES) as server:
+        _run(server, args, "до (одна модель)", routing=False, hedge=False)
+        _run(server, args, "маршруты", routing=True, hedge=False)
+        _run(server, args, "маршруты + хеджирование", routing=True, hedge=True)
+
+    degraded = {**PROFILES, "gpt-4.1-nano": {**PROFILES["gpt-4.1-nano"], "error_rate": args.degraded_error_rate}}
+    print(f"Деградация: gpt-4.1-nano отвечает 500 на {args.degraded_error_rate:.0%} запросов, без повторов")
+    args.retries = 0
+    with FakeOpenAIServer(chunk_delay=0.0, seed=2, model_profiles=degraded) as server:
+        _run(server, args, "маршруты без статистики", routing=True, hedge=False, max_error_rate=1.0)
+        _run(server, args, "маршруты со статистикой", routing=True, hedge=False)
+        _run(server, args, "со статистикой + хеджирование", routing=True, hedge=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Бенчмарк холодного запуска точек входа (каждый замер — новый процесс python):
+
+1. cli.py: сразу exit — SDK openai не должен загружаться (до: импорт cli тянул openai);
+2. cli.py: время до первого ответа модели (заглушка OpenAI), сюда входит загрузка SDK;
+3. main.py без BOT_TOKEN: ошибка конфигурации до импорта aiogram и openai;
+4. main.py --webhook (webhook.run_webhook): время до ответа /healthz.
+Для сравнения — python -c pass и импорт SDK openai / aiogram отдельно.
+Выводятся минимум и медиана по --repeat запускам.
+
+Запуск: python -m benchmarks.bench_startup --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections.abc import Callable
+
+from benchmarks._common import ROOT
+from benchmarks.fake_openai_server import FakeOpenAIServer, _free_port
+from benchmarks.fake_telegram import FAKE_BOT_TOKEN
+
+
+def _env(**overrides: str) -> dict[str, str]:
+    env = dict(os.environ, OPENAI_API_KEY="sk-fake", BOT_TOKEN=FAKE_BOT_TOKEN, PYTHONUNBUFFERED="1")
+    env.update(overrides)
+    return env
+
+
+def _run(args: list[str], env: dict[str, str], stdin: str = "") -> float:
+    """Время от запуска процесса до его завершения."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, *args], cwd=ROOT, env=env, input=stdin, capture_output=True, text=True)
+    return time.perf_counter() - start
+
+
+def _cli_first_answer(base_url: str) -> float:
+    """Время от запуска cli.py до строки с токенами первого ответа."""
+    logs_dir = tempfile.mkdtemp(prefix="bench_logs_")
+    code = (
+        "from pathlib import Path; from benchmarks._common import use_fake_openai; "
+        f"use_fake_openai({base_url!r}, Path({logs_dir!r})); import cli; cli.main([])"
+    )
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=ROOT, env=_env(),
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    assert proc.stdin is not None and proc.stdout is not None
+    proc.stdin.write("привет\n")
+    proc.stdin.flush()
+    elapsed = float("nan")
+    for line in proc.stdout:
+        if "[Токены" in line:
+            elapsed = time.perf_counter() - start
+            break
+    proc.stdin.write("exit\n")
+    proc.stdin.close()
+    proc.wait(30)
+    return elapsed
+
+
+def _webhook_ready() -> float:
+    """Время от запуска run_webhook до ответа GET /healthz."""
+    port = _free_port()
+    code = f"from webhook import run_webhook; run_webhook(host='127.0.0.1', port={port})"
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code], cwd=ROOT, env=_env(),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    elapsed = float("nan")
+    try:
+        while proc.poll() is None and time.perf_counter() - start < 60:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as resp:
+                    if resp.status == 200:
+                        elapsed = time.perf_counter() - start
+                        break
+            except OSError:
+                time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait(60)
+    return elapsed
+
+
+def _measure(fn: Callable[[], float], repeat: int) -> tuple[float, float]:
+    times = [fn() for _ in range(repeat)]
+    return min(times), statistics.median(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа заглушки OpenAI")
+    args = parser.parse_args()
+
+    rows: list[tuple[str, Callable[[], float]]] = [
+        ("python -c pass", lambda: _run(["-c", "pass"], _env())),
+        ("import openai (SDK)", lambda: _run(["-c", "import openai"], _env())),
+        ("import aiogram.types", lambda: _run(["-c", "import aiogram.types"], _env())),
+        ("cli.py: сразу exit", lambda: _run(["cli.py"], _env(), stdin="exit\n")),
+        ("main.py без BOT_TOKEN: ошибка конфига", lambda: _run(["main.py"], _env(BOT_TOKEN=""))),
+        ("main.py --webhook: до /healthz", _webhook_ready),
+    ]
+    with FakeOpenAIServer(latency=args.latency, chunk_delay=0.0) as server:
+        rows.insert(4, ("cli.py: до первого ответа", lambda: _cli_first_answer(server.base_url)))
+        print(f"Холодный запуск, {args.repeat} запусков: минимум / медиана")
+        for name, fn in rows:
+            best, median = _measure(fn, args.repeat)
+            print(f"  {name:<40} {best * 1000:7.0f} / {median * 1000:7.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Бенчмарк проверки JSON-ответов ДЗ (structured_output): заглушка с --malformed-json-rate
+отдаёт часть ответов в ```json, с текстом вокруг, лишними запятыми, строкой вместо списка,
+без ключа или обрезанными.
+
+- до: json.loads(text) — каждый такой ответ потерян (parsed=False), спасти его можно
+  только платным перезапуском;
+- после: локальное исправление, повтор запроса — только для неисправимых и в пределах бюджета.
+Выводится доля исправленных локально, число повторов против перезапусков «до»,
+токены на прогон и время разбора одного ответа.
+
+Запуск: python -m benchmarks.bench_structured_output --runs 200 --malformed-rate 0.3
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeOpenAIServer
+
+
+def _parse_cost_us(text: str, schema: dict | None, number: int = 20_000) -> float:
+    from structured_output import parse_structured
+
+    start = time.perf_counter()
+    for _ in range(number):
+        parse_structured(text, schema)
+    return (time.perf_counter() - start) / number * 1e6
+
+
+async def _run(runs: int, concurrency: int) -> list[dict]:
+    from openai_client import async_run_homework_prompt, close_async_client
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int) -> dict:
+        async with semaphore:
+            return await async_run_homework_prompt(1 + i % 2, use_cache=False)
+
+    try:
+        return await asyncio.gather(*(one(i) for i in range(runs)))
+    finally:
+        await close_async_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--malformed-rate", type=float, default=0.3, help="доля испорченных ответов заглушки")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency, malformed_json_rate=args.malformed_rate, seed=1) as server:
+        use_fake_openai(server.base_url)
+        from structured_output import repair_stats
+
+        outs = asyncio.run(_run(args.runs, args.concurrency))
+        requests = server.stats()["requests_total"]
+
+    stats = repair_stats()
+    not_strict = stats["runs"] - stats["valid"]
+    tokens = sum(o["usage"].get("total_tokens", 0) for o in outs)
+    print(f"Прогонов: {stats['runs']}, доля испорченных ответов заглушки: {args.malformed_rate:.0%}, запросов к API: {requests}")
+    print(f"  до:    без исправления не годились {not_strict} ответов ({not_strict / stats['runs']:.0%}) — столько платных перезапусков")
+    print(
+        f"  после: исправлено локально {stats['repaired']} ({stats['repaired_rate']:.0%}), "
+        f"повторов запроса {stats['retries']} (успешных {stats['retried_ok']}), "
+        f"не удалось {stats['failed']}, бюджет исчерпан {stats['budget_exhausted']} раз"
+    )
+    print(f"  токенов на прогон (с повторами): {tokens / len(outs):.0f}")
+
+    from prompt_registry import get_prompt_registry
+
+    schema = get_prompt_registry().get(1).schema
+    reply = {"title": "План", "steps": ["Шаг один.", "Шаг два."], "notes": ["Заметка."]}
+    text = json.dumps(reply, ensure_ascii=False)
+    fenced = "```json\n" + text + "\n```"
+    prose = "Вот план:\n" + text + "\nУдачи!"
+    print(
+        f"  разбор ответа: валидный {_parse_cost_us(text, schema):.1f} мкс, "
+        f"в ```json {_parse_cost_us(fenced, schema):.1f} мкс, с текстом вокруг {_parse_cost_us(prose, schema):.1f} мкс"
+    )
+
+
+if __name__ == "__main__":
+    main()
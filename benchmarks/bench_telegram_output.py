@@ -0,0 +1,245 @@
+"""
+Бенчмарк вывода в Telegram (telegram_output):
+
+1. деление длинных ответов: синтетические ответы с Markdown и блоками кода ```;
+   до — обрезка до 4000 символов (часть ответа терялась молча, блок кода мог остаться
+   незакрытым), после — split_message: части ≤ 4096 (UTF-16), блоки кода закрыты в каждой
+   части, ни одно слово не потеряно; время деления одного ответа;
+2. отправка под нагрузкой: N чатов одновременно запускают промпт ДЗ (статус, текст
+   промпта, длинный результат, «результат сохранён») через заглушку Bot API с лимитами
+   Telegram (--global-rate сообщений/с на бота, --chat-rate в секунду на чат с запасом
+   --chat-burst); 429 — TelegramRetryAfter, как от настоящего API.
+   До — последовательные message.answer (429 прерывает обработчик, остальное теряется),
+   после — очередь ChatSender. Выводятся запросы к API, 429, потерянные сообщения и время.
+
+Запуск: python -m benchmarks.bench_telegram_output --chats 100
+"""
+import argparse
+import asyncio
+import importlib
+import math
+import random
+import time
+from typing import Any
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+_WORDS = ("модель", "ответ", "*важно*", "_пример_", "`код`", "контекст.", "токены", "запрос,", "Telegram")
+STATUS = "Запускаю промпт #1, подожди..."
+SAVED = "Результат сохранён в logs/homework\\_results.jsonl"
+
+
+def _synthetic_reply(rng: random.Random, size: int) -> str:
+    """Ответ модели: абзацы с разметкой вперемешку с блоками кода."""
+    blocks: list[str] = []
+    while sum(map(len, blocks)) < size:
+        if rng.random() < 0.3:
+            lines = [f"    result_{i} = compute({i}, factor=2)  # шаг {i}" for i in range(rng.randint(5, 120))]
+            blocks.append(f"```{rng.choice(('python', 'json', ''))}\n" + "\n".join(lines) + "\n```")
+        else:
+            blocks.append(" ".join(rng.choice(_WORDS) for _ in range(rng.randint(20, 200))))
+    return "\n\n".join(blocks)
+
+
+def _old_fit(text: str) -> str:
+    """Прежний bot._fit_message."""
+    return text[:3997] + "..." if len(text) > 4000 else text
+
+
+def _fences_closed(text: str) -> bool:
+    return sum(1 for line in text.split("\n") if line.startswith("```")) % 2 == 0
+
+
+def _words_kept(original: str, parts: list[str]) -> bool:
+    received = iter(" ".join(parts).split())
+    return all(word in received for word in original.split())
+
+
+def bench_split(replies: int, seed: int) -> None:
+    from telegram_output import split_message, tg_len
+
+    rng = random.Random(seed)
+    texts = [_synthetic_reply(rng, rng.randint(2_000, 20_000)) for _ in range(replies)]
+    long_texts = [t for t in texts if len(t) > 4000]
+    lost = sum(len(t) - 3997 for t in long_texts)
+    open_fence = sum(1 for t in long_texts if not _fences_closed(_old_fit(t)))
+    print(f"Деление ответов: {replies} ответов 2–20 тыс. символов, длиннее 4000: {len(long_texts)}")
+    print(
+        f"  до:    обрезка — потеряно {lost} символов ({lost / sum(map(len, texts)):.0%} текста), "
+        f"незакрытый блок кода в {open_fence} ответах"
+    )
+
+    for parse_mode in (None, "Markdown"):
+        parts_total = max_len = bad_fences = lost_words = 0
+        start = time.perf_counter()
+        results = [split_message(t, parse_mode=parse_mode) for t in texts]
+        elapsed = time.perf_counter() - start
+        for text, parts in zip(texts, results):
+            parts_total += len(parts)
+            max_len = max(max_len, *(tg_len(p) for p in parts))
+            bad_fences += sum(1 for p in parts if not _fences_closed(p))
+            lost_words += not _words_kept(text, parts)
+        print(
+            f"  после ({parse_mode or 'без разметки'}): частей {parts_total}, самая длинная {max_len}, "
+            f"незакрытых блоков кода {bad_fences}, ответов с потерянными словами {lost_words}, "
+            f"{elapsed / replies * 1e6:.0f} мкс на ответ"
+        )
+
+
+class FakeBotApi:
+    """
+    Bot API с лимитами Telegram: общее ведро и ведро на чат; при превышении —
+    TelegramRetryAfter. Сообщения длиннее 4096 — TelegramBadRequest.
+    """
+
+    def __init__(self, global_rate: float, chat_rate: float, chat_burst: int, rtt: float) -> None:
+        from request_scheduler import TokenBucket
+
+        self.global_bucket = TokenBucket(global_rate * 60, capacity=global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.rtt = rtt
+        self._chats: dict[int, Any] = {}
+        self.calls = 0
+        self.flood = 0
+        self.received: dict[int, list[str]] = {}
+
+    def _take(self, bucket: Any, now: float) -> float:
+        delay = bucket.reserve(1, now)
+        if delay:
+            bucket.refund(1)
+        return delay
+
+    async def send(self, chat_id: int, text: str) -> None:
+        from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+        from aiogram.methods import SendMessage
+        from request_scheduler import TokenBucket
+        from telegram_output import tg_len
+
+        self.calls += 1
+        await asyncio.sleep(self.rtt)
+        method = SendMessage(chat_id=chat_id, text=text[:10])
+        if tg_len(text) > 4096:
+            raise TelegramBadRequest(method, "Bad Request: message is too long")
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate * 60, capacity=self.chat_burst)
+        now = time.monotonic()
+        delay = self._take(bucket, now)
+        if not delay:
+            delay = self._take(self.global_bucket, now)
+            if delay:
+                bucket.refund(1)
+        if delay:
+            self.flood += 1
+            raise TelegramRetryAfter(method, "Too Many Requests: retry later", max(1, math.ceil(delay)))
+        self.received.setdefault(chat_id, []).append(text)
+
+
+class _Chat:
+    def __init__(self, chat_id: int) -> None:
+        self.id = chat_id
+
+
+class ApiMessage:
+    """Входящее сообщение: answer() уходит в FakeBotApi."""
+
+    def __init__(self, api: FakeBotApi, chat_id: int) -> None:
+        self.api = api
+        self.chat = _Chat(chat_id)
+
+    async def answer(self, text: str, **kwargs: Any) -> "ApiMessage":
+        await self.api.send(self.chat.id, text)
+        return self
+
+
+async def _old_flow(message: ApiMessage, prompt: str, body: str, latency: float) -> None:
+    """Прежний handle_homework_prompt_choice: ответы по одному, обрезка результата."""
+    await message.answer(STATUS)
+    await message.answer(prompt, parse_mode="Markdown")
+    await asyncio.sleep(latency)
+    if len(body) > 4000:
+        body = body[:3980] + "\n...\n```"
+    await message.answer(body, parse_mode="Markdown")
+    await message.answer("Результат сохранён в logs/homework_results.jsonl")
+
+
+async def _new_flow(message: ApiMessage, prompt: str, body: str, latency: float) -> None:
+    from telegram_output import get_chat_sender
+
+    sender = get_chat_sender()
+    sender.submit(message, STATUS, parse_mode="Markdown", status=True)
+    sender.submit(message, prompt, parse_mode="Markdown")
+    await asyncio.sleep(latency)
+    sender.submit(message, body, parse_mode="Markdown")
+    await sender.send(message, SAVED, parse_mode="Markdown")
+
+
+async def _run_flow(flow: Any, args: argparse.Namespace, prompt: str, body: str) -> tuple[FakeBotApi, float, int]:
+    api = FakeBotApi(args.global_rate, args.chat_rate, args.chat_burst, args.rtt)
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(
+        *(flow(ApiMessage(api, chat_id), prompt, body, args.latency) for chat_id in range(1, args.chats + 1)),
+        return_exceptions=True,
+    )
+    failed = sum(1 for o in outcomes if isinstance(o, BaseException))
+    return api, time.perf_counter() - start, failed
+
+
+async def bench_send(args: argparse.Namespace) -> None:
+    importlib.import_module("aiogram.methods")  # импорт aiogram — не в замер
+
+    from telegram_output import configure_chat_sender
+
+    rng = random.Random(args.seed)
+    prompt = "*Промпт:*\n\n" + " ".join(rng.choice(_WORDS[:2] + _WORDS[5:]) for _ in range(120))
+    body = "*Промпт:* План\n*Валидный JSON:* да\n\n" + "```json\n" + "\n".join(
+        f'  "step_{i}": "Шаг номер {i}: подробное описание действия",' for i in range(args.result_lines)
+    ) + "\n```"
+    print(
+        f"\nОтправка: {args.chats} чатов одновременно, результат {len(body)} символов, "
+        f"лимиты заглушки: {args.global_rate:g}/с на бота, {args.chat_rate:g}/с на чат (запас {args.chat_burst})"
+    )
+
+    api, elapsed, failed = await _run_flow(_old_flow, args, prompt, body)
+    expected = 4 * args.chats
+    delivered = sum(len(v) for v in api.received.values())
+    print(
+        f"  до:    запросов {api.calls}, 429: {api.flood}, прервано обработчиков {failed}, "
+        f"доставлено {delivered}/{expected} сообщений, результат обрезан, {elapsed:.2f} с"
+    )
+
+    sender = configure_chat_sender()
+    api, elapsed, failed = await _run_flow(_new_flow, args, prompt, body)
+    complete = sum(
+        1 for texts in api.received.values()
+        if texts and texts[-1].endswith(SAVED) and "".join(texts).count("step_") == args.result_lines
+    )
+    stats = sender.stats()
+    print(
+        f"  после: запросов {api.calls}, 429: {api.flood}, прервано обработчиков {failed}, "
+        f"чатов с полным результатом {complete}/{args.chats}, частей результата "
+        f"{len(api.received.get(1, [])) - 1 if api.received else 0}, объединено {stats['merged']}, "
+        f"пропущено статусов {stats['dropped_status']}, {elapsed:.2f} с"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replies", type=int, default=300, help="ответов для деления")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--result-lines", type=int, default=250, help="строк JSON в результате ДЗ")
+    parser.add_argument("--latency", type=float, default=0.3, help="ответ модели, с")
+    parser.add_argument("--rtt", type=float, default=0.03, help="запрос к Bot API, с")
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--chat-burst", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    bench_split(args.replies, args.seed)
+    asyncio.run(bench_send(args))
+
+
+if __name__ == "__main__":
+    main()
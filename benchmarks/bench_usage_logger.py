@@ -0,0 +1,70 @@
+"""
+Микробенчмарк: накладные расходы записи usage на один запрос.
+«До» — прежняя схема (mkdir + exists + open(..., "a") + одна строка на вызов),
+«после» — record_usage() в очередь с фоновой записью пачками.
+
+Запуск: python -m benchmarks.bench_usage_logger --calls 20000
+"""
+import argparse
+import csv
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+from usage_logger import USAGE_COLUMNS, UsageLogger, make_sink
+
+_USAGE = {"prompt_tokens": 120, "completion_tokens": 80, "total_tokens": 200}
+
+
+def _legacy_log_usage(path: Path, run_id: int) -> None:
+    """Копия прежнего openai_client._log_usage_to_file (без print/logging)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_exists = path.exists()
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if not file_exists:
+            writer.writerow(USAGE_COLUMNS)
+        writer.writerow([
+            run_id,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "gpt-4o-mini",
+            0.2,
+            _USAGE["prompt_tokens"],
+            _USAGE["completion_tokens"],
+            _USAGE["total_tokens"],
+        ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+    tmp = Path(tempfile.mkdtemp(prefix="bench_usage_"))
+
+    legacy_path = tmp / "legacy" / "usage.csv"
+    start = time.perf_counter()
+    for i in range(args.calls):
+        _legacy_log_usage(legacy_path, i + 1)
+    legacy = time.perf_counter() - start
+
+    print(f"Вызовов: {args.calls}")
+    print(f"  до (open/append на вызов): {legacy / args.calls * 1e6:8.2f} мкс/вызов")
+    for fmt in ("csv", "jsonl", "sqlite"):
+        usage_logger = UsageLogger(make_sink(fmt, tmp / fmt / f"usage.{fmt}"))
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            usage_logger.record("gpt-4o-mini", 0.2, _USAGE)
+        on_path = time.perf_counter() - start
+        usage_logger.close()
+        total = time.perf_counter() - start
+        print(
+            f"  после, {fmt:<6} (очередь):   {on_path / args.calls * 1e6:8.2f} мкс/вызов на пути запроса, "
+            f"с учётом фоновой записи {total / args.calls * 1e6:6.2f} мкс, пачек: {usage_logger.batches_written}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Бенчмарк отчёта по usage (usage_report): синтетический usage.csv на N строк (по умолчанию
+2M, ~90 МБ), затем
+- full: потоковый отчёт по всему CSV (строк/с, прирост пикового RSS процесса);
+- compact: сворачивание CSV в сводку SQLite;
+- incremental: отчёт по сводке + дописанному после неё хвосту (--tail строк);
+- rotate: --compact --rotate и отчёт после ротации.
+Итоги всех отчётов должны совпадать.
+
+Запуск: python -m benchmarks.bench_usage_report --rows 2000000 --days 60
+"""
+import argparse
+import csv
+import random
+import resource
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from benchmarks._common import ROOT  # noqa: F401  (добавляет корень проекта в sys.path)
+
+from usage_logger import USAGE_COLUMNS
+from usage_report import build_report, compact
+
+_MODELS = ["gpt-4o-mini", "gpt-4o-mini", "gpt-4o-mini", "gpt-4o", "gpt-4.1-mini", "o3-mini"]
+_TEMPERATURES = ["0.7", "0.7", "0.2", "default"]
+
+
+def _write_rows(path: Path, rows: int, start: datetime, days: int, seed: int, run_id: int = 1) -> None:
+    rng = random.Random(seed)
+    new = not path.exists()
+    span = days * 86400
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(USAGE_COLUMNS)
+        batch = []
+        for i in range(rows):
+            ts = start + timedelta(seconds=span * i // rows)
+            prompt = 0 if rng.random() < 0.05 else rng.randint(30, 3000)
+            completion = 0 if not prompt else rng.randint(1, 400)
+            cached = prompt // 128 * 128 if prompt >= 1024 and rng.random() < 0.5 else 0
+            batch.append((
+                run_id + i, ts.strftime("%Y-%m-%d %H:%M:%S"), rng.choice(_MODELS), rng.choice(_TEMPERATURES),
+                prompt, completion, prompt + completion, cached, 0,
+            ))
+            if len(batch) >= 10_000:
+                writer.writerows(batch)
+                batch.clear()
+        writer.writerows(batch)
+
+
+def _max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--tail", type=int, default=20_000, help="строк, дописанных после сворачивания")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="bench_usage_report_"))
+    usage = tmp / "usage.csv"
+    summary = tmp / "usage_summary.sqlite3"
+    start_day = datetime(2026, 1, 1)
+    t0 = time.perf_counter()
+    _write_rows(usage, args.rows, start_day, args.days, seed=1)
+    size_mb = usage.stat().st_size / 1024 / 1024
+    print(f"CSV: {args.rows} строк, {size_mb:.1f} МБ, {args.days} дней (сгенерирован за {time.perf_counter() - t0:.1f} с)")
+
+    rss_before = _max_rss_mb()
+    full = build_report([usage], by=("model", "day"))
+    rss_growth = _max_rss_mb() - rss_before
+    print(
+        f"  full:        {full['elapsed_s']:>7.2f} с, {full['csv_rows_read'] / full['elapsed_s']:>9.0f} строк/с, "
+        f"прирост пикового RSS {rss_growth:.1f} МБ, групп {len(full['groups'])}"
+    )
+
+    t0 = time.perf_counter()
+    result = compact([usage], summary)
+    print(
+        f"  compact:     {time.perf_counter() - t0:>7.2f} с, строк {result['rows']}, "
+        f"сводка {summary.stat().st_size / 1024 / 1024:.1f} МБ"
+    )
+
+    _write_rows(usage, args.tail, start_day + timedelta(days=args.days), 1, seed=2, run_id=args.rows + 1)
+    expected = build_report([usage], by=("model", "day"))
+    incremental = build_report([usage], by=("model", "day"), summary_path=summary)
+    print(
+        f"  incremental: {incremental['elapsed_s']:>7.2f} с, из CSV прочитано {incremental['csv_rows_read']} строк "
+        f"(полный отчёт: {expected['elapsed_s']:.2f} с)"
+    )
+
+    compact([usage], summary, rotate=True)
+    rotated = build_report([usage], by=("model", "day"), summary_path=summary)
+    print(f"  rotate:      {rotated['elapsed_s']:>7.2f} с, usage.csv после ротации: {'есть' if usage.exists() else 'нет'}")
+
+    same = (
+        expected["totals"] == incremental["totals"] == rotated["totals"]
+        and expected["groups"] == incremental["groups"] == rotated["groups"]
+        and expected["percentiles"] == incremental["percentiles"] == rotated["percentiles"]
+    )
+    t = expected["totals"]
+    print(
+        f"  итоги совпадают: {'да' if same else 'НЕТ'} — запросов {t['requests']}, токенов {t['total_tokens']}, "
+        f"из кэша {t['cache_hits']}, стоимость ${t['cost_usd']:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Бенчмарк: пачки сообщений от многих пользователей одновременно через bot.handle_text
+(фиктивные сообщения Telegram, заглушка OpenAI с разбросом задержки).
+
+Проверяется, что история каждого пользователя упорядочена (вопросы в порядке отправки,
+за каждым — ответ на него), и что пользователи не ждут друг друга: время прогона
+близко к K последовательным ответам, а не к N × K. Для сравнения --no-serialize
+отключает очередь по пользователю (как было до KeyedLimiter).
+
+Запуск: python -m benchmarks.bench_user_bursts --users 200 --burst 5 --latency 0.2 --jitter 0.15
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeServerProcess
+from benchmarks.fake_telegram import FakeMessage, TelegramLog, disable_send_limits, use_fake_bot_token
+
+
+def _check_order(user_id: int, burst: int) -> bool:
+    """История = [вопрос 0, ответ, вопрос 1, ответ, ...] ровно в порядке отправки."""
+    from context_manager import get_context
+
+    history = list(get_context(user_id))
+    expected = [f"u{user_id}-m{i}" for i in range(burst)]
+    questions = [m["content"] for m in history if m["role"] == "user"]
+    roles = [m["role"] for m in history]
+    return questions == expected and roles == ["user", "assistant"] * burst
+
+
+async def _run(users: int, burst: int, serialize: bool, max_concurrency: int) -> tuple[float, dict]:
+    import bot
+    from openai_client import close_async_client
+    from user_locks import KeyedLimiter
+
+    bot.user_limiter = KeyedLimiter(max_concurrency, serialize=serialize)
+    log = TelegramLog()
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        bot.handle_text(FakeMessage(f"u{user_id}-m{i}", user_id, log))
+        for user_id in range(1, users + 1)
+        for i in range(burst)
+    ))
+    elapsed = time.perf_counter() - start
+    await close_async_client()
+    return elapsed, bot.user_limiter.stats()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--burst", type=int, default=5, help="сообщений подряд от каждого пользователя (≤ 10)")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.15)
+    parser.add_argument("--max-concurrency", type=int, default=64, help="BOT_MAX_CONCURRENT_MESSAGES")
+    parser.add_argument("--no-serialize", action="store_true", help="без очереди по пользователю")
+    args = parser.parse_args()
+
+    use_fake_bot_token()
+    disable_send_limits()
+    server_args = ["--latency", str(args.latency), "--jitter", str(args.jitter), "--chunk-delay", "0", "--seed", "1"]
+    with FakeServerProcess(server_args) as server:
+        use_fake_openai(server.base_url)
+        import context_manager
+        from request_scheduler import configure_request_scheduler
+
+        configure_request_scheduler(max_in_flight=0)
+        elapsed, stats = asyncio.run(_run(args.users, args.burst, not args.no_serialize, args.max_concurrency))
+        ordered = sum(1 for user_id in range(1, args.users + 1) if _check_order(user_id, args.burst))
+        ctx = context_manager.get_stats()
+
+    total = args.users * args.burst
+    print(
+        f"Пользователей: {args.users}, сообщений подряд: {args.burst}, всего: {total}, "
+        f"очередь по пользователю: {'нет' if args.no_serialize else 'да'}, "
+        f"одновременно не больше: {args.max_concurrency or '∞'}"
+    )
+    print(f"  время: {elapsed:.2f} с ({total / elapsed:.1f} сообщений/с)")
+    print(f"  нижняя граница: {args.burst} ответов подряд ≈ {args.burst * args.latency:.2f} с")
+    print(f"  упорядоченная история: {ordered}/{args.users} пользователей, сообщений в памяти: {ctx['messages']}")
+    print(
+        f"  лимитер: макс. одновременно {stats['max_active']}, макс. ожидающих {stats['max_waiting']}, "
+        f"замков после прогона {stats['keys']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Бенчмарк режима webhook: aiohttp-сервер webhook.make_app, заглушка OpenAI (отдельный процесс)
+и заглушка Telegram Bot API (sendMessage/editMessageText), на которые aiogram шлёт ответы.
+
+1. intake: N пользователей × K сообщений POST-запросами фиктивных апдейтов одновременно
+   (не больше --connections соединений, как max_connections у Telegram): задержка
+   подтверждения (200/503) и время до полной обработки всех апдейтов;
+2. shutdown: ещё пачка апдейтов и сразу остановка сервера — все принятые апдейты
+   должны быть доработаны (ответы отправлены) до закрытия.
+
+--shards N: апдейты раздаются N процессам-обработчикам (shards.ShardRouter, как
+main.py --workers N); после остановки проверяется, что общий usage.csv содержит по строке
+на апдейт и ни одна строка не испорчена одновременной записью.
+
+Запуск: python -m benchmarks.bench_webhook --users 300 --messages 3 --latency 0.3
+Обратное давление: --queue-size 50 --enqueue-timeout 0 (часть апдейтов получит 503).
+Процессы: python -m benchmarks.bench_webhook --shards 4
+"""
+import argparse
+import asyncio
+import csv
+import functools
+import logging
+import time
+from pathlib import Path
+from typing import Any
+
+from aiohttp import ClientSession, TCPConnector, web
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import FakeServerProcess
+from benchmarks.fake_telegram import FAKE_BOT_TOKEN, disable_send_limits, use_fake_bot_token
+
+
+class FakeBotApi:
+    """Заглушка Bot API: отвечает на sendMessage/editMessageText валидным Message и считает вызовы."""
+
+    def __init__(self) -> None:
+        self.calls: dict[str, int] = {}
+        self._message_ids = 0
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        data = await request.post()
+        chat_id = int(data.get("chat_id", 0))
+        if method in ("sendMessage", "editMessageText"):
+            self._message_ids += 1
+            result: Any = {
+                "message_id": int(data.get("message_id", self._message_ids)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": data.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+
+def _update(update_id: int, user_id: int, text: str) -> dict[str, Any]:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"},
+            "text": text,
+        },
+    }
+
+
+async def _start(app: web.Application) -> tuple[web.AppRunner, str]:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"http://{host}:{port}"
+
+
+async def _post_all(url: str, updates: list[dict[str, Any]], connections: int) -> tuple[list[float], dict[int, int]]:
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    async with ClientSession(connector=TCPConnector(limit=connections)) as session:
+
+        async def post(update: dict[str, Any]) -> None:
+            start = time.perf_counter()
+            async with session.post(url, json=update) as resp:
+                await resp.read()
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(post(u) for u in updates))
+    return latencies, statuses
+
+
+def _init_shard(openai_url: str, api_url: str, logs_dir: Path, shard: int) -> None:
+    """worker_init процесса-обработчика: те же заглушки и общая папка логов."""
+    logging.basicConfig(level=logging.WARNING)
+    import config
+    from request_scheduler import configure_request_scheduler
+
+    config.TELEGRAM_API_URL = api_url
+    use_fake_openai(openai_url, logs_dir)
+    configure_request_scheduler(max_in_flight=0)
+    disable_send_limits()
+
+
+def _check_usage_csv(path: Path) -> tuple[int, int]:
+    """(строк данных, испорченных строк) в общем usage.csv."""
+    rows = bad = 0
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        for row in reader:
+            rows += 1
+            if len(row) != len(header) or not row[4].isdigit():
+                bad += 1
+    return rows, bad
+
+
+async def _run(args: argparse.Namespace, openai_url: str, logs_dir: Path) -> None:
+    from aiogram import Bot
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+
+    import bot as bot_module
+
+    logging.getLogger().setLevel(logging.WARNING)
+    from percentiles import summarize
+    from shards import ShardRouter
+    from webhook import UpdateQueue, make_app
+
+    fake_api = FakeBotApi()
+    api_runner, api_url = await _start(fake_api.app())
+    bot = Bot(FAKE_BOT_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(api_url)))
+    if args.shards > 1:
+        queue: Any = ShardRouter(
+            args.shards,
+            maxsize=args.queue_size,
+            enqueue_timeout=args.enqueue_timeout,
+            worker_init=functools.partial(_init_shard, openai_url, api_url, logs_dir),
+        )
+        on_closed = None
+    else:
+        queue = UpdateQueue(
+            lambda update: bot_module.dp.feed_raw_update(bot, update),
+            workers=args.workers,
+            maxsize=args.queue_size,
+            enqueue_timeout=args.enqueue_timeout,
+        )
+        on_closed = bot_module.close_resources
+    app = make_app(bot, bot_module.dp, queue, path="/webhook", secret="", webhook_url=None, on_closed=on_closed)
+    runner, base_url = await _start(app)
+    url = f"{base_url}/webhook"
+
+    warmup = 0
+    if args.shards > 1:
+        # Процессы-обработчики импортируют aiogram и бота — не включаем это в замер intake
+        warmup = args.shards
+        await _post_all(url, [_update(-user_id, user_id, "Прогрев") for user_id in range(1, warmup + 1)], 1)
+        while queue.stats()["processed"] < warmup:
+            await asyncio.sleep(0.05)
+
+    updates = [
+        _update(i * args.users + user_id, user_id, f"Сообщение {i} от {user_id}")
+        for i in range(args.messages)
+        for user_id in range(1, args.users + 1)
+    ]
+    start = time.perf_counter()
+    latencies, statuses = await _post_all(url, updates, args.connections)
+    acked = time.perf_counter() - start
+    while queue.stats()["processed"] + queue.stats()["failed"] < queue.stats()["accepted"]:
+        await asyncio.sleep(0.05)
+    done = time.perf_counter() - start
+    ack = summarize(latencies)
+    stats = queue.stats()
+    print(
+        f"Апдейтов: {len(updates)} ({args.users} пользователей × {args.messages}), "
+        f"процессов: {max(1, args.shards)}, обработчиков: {args.workers}, "
+        f"очередь: {args.queue_size}, соединений: {args.connections}"
+    )
+    print(
+        f"  intake: все подтверждены за {acked:.2f} с ({len(updates) / acked:.0f} апдейтов/с), "
+        f"подтверждение p50 {ack['p50'] * 1000:.1f} / p99 {ack['p99'] * 1000:.1f} мс, ответы HTTP: {statuses}"
+    )
+    print(
+        f"  обработка: все принятые обработаны за {done:.2f} с ({(stats['processed'] - warmup) / done:.0f} апдейтов/с), "
+        f"макс. очередь {stats.get('max_queue_depth', '-')}, ошибок {stats['failed']}, отклонено {stats['rejected']}"
+    )
+
+    # Остановка сразу после приёма пачки: принятое должно быть доработано до закрытия
+    tail = [_update(10_000_000 + user_id, user_id, "Последний вопрос") for user_id in range(1, args.users + 1)]
+    sent_before = fake_api.calls.get("sendMessage", 0)
+    _, tail_statuses = await _post_all(url, tail, args.connections)
+    pending = queue.stats()["accepted"] - queue.stats()["processed"] - queue.stats()["failed"]
+    start = time.perf_counter()
+    await runner.cleanup()
+    stopped = time.perf_counter() - start
+    stats = queue.stats()
+    print(
+        f"  shutdown: принято {tail_statuses.get(200, 0)}, в работе при остановке {pending}, "
+        f"остановка за {stopped:.2f} с, доработано: "
+        f"{'да' if stats['processed'] + stats['failed'] == stats['accepted'] else 'НЕТ'}, "
+        f"новых sendMessage: {fake_api.calls.get('sendMessage', 0) - sent_before}"
+    )
+    print(f"  Bot API: {fake_api.calls}")
+    await api_runner.cleanup()
+    rows, bad = _check_usage_csv(logs_dir / "usage.csv")
+    print(f"  usage.csv: строк {rows} (ожидалось {stats['processed']}), испорченных {bad}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=3, help="сообщений от каждого пользователя")
+    parser.add_argument("--latency", type=float, default=0.3, help="задержка заглушки OpenAI, с")
+    parser.add_argument("--workers", type=int, default=128, help="WEBHOOK_WORKERS")
+    parser.add_argument("--queue-size", type=int, default=1000, help="WEBHOOK_QUEUE_SIZE")
+    parser.add_argument("--enqueue-timeout", type=float, default=1.0, help="WEBHOOK_ENQUEUE_TIMEOUT_SECONDS")
+    parser.add_argument("--connections", type=int, default=40, help="одновременных POST (max_connections)")
+    parser.add_argument("--shards", type=int, default=1, help="процессов-обработчиков (main.py --workers)")
+    args = parser.parse_args()
+
+    use_fake_bot_token()
+    disable_send_limits()
+    server_args = ["--latency", str(args.latency), "--jitter", "0.1", "--chunk-delay", "0", "--seed", "1"]
+    with FakeServerProcess(server_args) as server:
+        logs_dir = use_fake_openai(server.base_url)
+        from request_scheduler import configure_request_scheduler
+
+        configure_request_scheduler(max_in_flight=0)
+        asyncio.run(_run(args, server.base_url, logs_dir))
+
+
+if __name__ == "__main__":
+    main()
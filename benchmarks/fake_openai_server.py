@@ -0,0 +1,475 @@
+"""
+Локальная заглушка OpenAI Chat Completions API для офлайн-бенчмарков.
+Отвечает на POST /v1/chat/completions с настраиваемой задержкой (фиксированная + разброс),
+длиной ответа, долей ошибок 500 и 429 (с Retry-After); поддерживает потоковые
+ответы (SSE при "stream": true) с usage последним чанком. С reject_temperature
+отвечает 400 на запросы с temperature, как модели без поддержки этого параметра.
+С malformed_json_rate часть ответов ДЗ приходит «как у живой модели»: в ```json,
+с текстом вокруг, с лишними запятыми, строкой вместо списка, без ключа или обрезанной.
+Кэш промптов — как у OpenAI: начало запроса блоками по 128 токенов, совпавшее с прошлыми
+запросами, от prompt_cache_min_tokens (1024) — в usage.prompt_tokens_details.cached_tokens.
+Хвост задержек — slow_rate/slow_latency (доля очень медленных ответов); model_profiles
+задаёт свои задержку, разброс, долю ошибок и хвост для отдельных моделей (поле "model" запроса).
+
+Запуск отдельно: python -m benchmarks.fake_openai_server --port 8765 --latency 0.5
+"""
+import argparse
+import hashlib
+import json
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+_WORDS = (
+    "пей воду каждый час поставь бутылку на стол напоминание в телефоне "
+    "стакан утром после обеда перерыв привычка шаг план простой"
+).split()
+
+
+# Виды испорченного JSON: первые четыре исправляются локально, последние два — только повтором
+_MALFORMED_KINDS = ("fences", "prose", "trailing_commas", "string_steps", "missing_key", "truncated")
+_CACHE_BLOCK_CHARS = 128 * 4  # блок кэша промптов: 128 токенов при ~4 символах на токен
+_CACHE_MAX_BLOCKS = 1_000_000
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return  # клиент закрыл соединение, не дождавшись ответа (отменённый запрос)
+        super().handle_error(request, client_address)
+
+
+class FakeOpenAIServer:
+    """HTTP-сервер в фоновом потоке, имитирующий /v1/chat/completions."""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.5,
+        chunk_delay: float = 0.02,
+        jitter: float = 0.0,
+        reply_words: int = 2,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: int | None = None,
+        reject_temperature: bool = False,
+        malformed_json_rate: float = 0.0,
+        prompt_cache_min_tokens: int = 1024,
+        slow_rate: float = 0.0,
+        slow_latency: float = 0.0,
+        model_profiles: dict[str, dict[str, float]] | None = None,
+    ) -> None:
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.jitter = jitter
+        self.reply_words = reply_words
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.reject_temperature = reject_temperature
+        self.malformed_json_rate = malformed_json_rate
+        self.prompt_cache_min_tokens = prompt_cache_min_tokens
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.model_profiles = model_profiles or {}
+        self.requests_by_model: dict[str, int] = {}
+        self._cache_blocks: set[str] = set()
+        self.prompt_tokens_total = 0
+        self.cached_tokens_total = 0
+        self.requests_total = 0
+        self.requests_served = 0
+        self.errors_served = 0
+        self.rate_limited = 0
+        self.bad_requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._make_handler())
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "requests_total": self.requests_total,
+            "requests_served": self.requests_served,
+            "errors_served": self.errors_served,
+            "rate_limited": self.rate_limited,
+            "bad_requests": self.bad_requests,
+            "prompt_tokens": self.prompt_tokens_total,
+            "cached_tokens": self.cached_tokens_total,
+            "requests_by_model": dict(self.requests_by_model),
+        }
+
+    def _pick_outcome(self, model: str) -> tuple[str, float]:
+        """("ok" | "rate_limit" | "error", задержка) для очередного запроса (с профилем модели)."""
+        profile = self.model_profiles.get(model, {})
+        latency = profile.get("latency", self.latency)
+        jitter = profile.get("jitter", self.jitter)
+        error_rate = profile.get("error_rate", self.error_rate)
+        slow_rate = profile.get("slow_rate", self.slow_rate)
+        with self._lock:
+            self.requests_total += 1
+            self.requests_by_model[model] = self.requests_by_model.get(model, 0) + 1
+            roll = self._rng.random()
+            delay = max(0.0, latency + self._rng.uniform(-jitter, jitter))
+            if self._rng.random() < slow_rate:
+                delay = profile.get("slow_latency", self.slow_latency)
+        if roll < self.rate_limit_rate:
+            return "rate_limit", 0.0
+        if roll < self.rate_limit_rate + error_rate:
+            return "error", delay
+        return "ok", delay
+
+    def _make_handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+                pass
+
+            def do_GET(self) -> None:  # noqa: N802
+                if self.path.rstrip("/") == "/stats":
+                    self._send_json(200, server.stats())
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self) -> None:  # noqa: N802
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                if server.reject_temperature and "temperature" in payload:
+                    with server._lock:
+                        server.requests_total += 1
+                        server.bad_requests += 1
+                    self._send_json(
+                        400,
+                        {
+                            "error": {
+                                "message": "Unsupported value: 'temperature' does not support "
+                                f"{payload['temperature']} with this model. Only the default (1) value is supported.",
+                                "type": "invalid_request_error",
+                                "param": "temperature",
+                                "code": "unsupported_value",
+                            }
+                        },
+                    )
+                    return
+                outcome, delay = server._pick_outcome(str(payload.get("model", "")))
+                if outcome == "rate_limit":
+                    with server._lock:
+                        server.rate_limited += 1
+                    self._send_json(
+                        429,
+                        {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                        {"Retry-After": f"{server.retry_after:g}"},
+                    )
+                    return
+                time.sleep(delay)
+                if outcome == "error":
+                    with server._lock:
+                        server.errors_served += 1
+                    self._send_json(500, {"error": {"message": "Internal error (fake)", "type": "server_error"}})
+                    return
+                with server._lock:
+                    server.requests_served += 1
+                completion = server.build_completion(payload)
+                if payload.get("stream"):
+                    self._send_stream(completion, payload)
+                else:
+                    self._send_json(200, completion)
+
+            def _send_stream(self, completion: dict[str, Any], payload: dict[str, Any]) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                base = {k: completion[k] for k in ("id", "created", "model")}
+                base["object"] = "chat.completion.chunk"
+                text = completion["choices"][0]["message"]["content"]
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    piece = word if i == 0 else " " + word
+                    chunk = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(server.chunk_delay)
+                final = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    usage_chunk = {**base, "choices": [], "usage": completion["usage"]}
+                    self.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def _send_json(self, status: int, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+                raw = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(raw)
+
+        return Handler
+
+    def _reply_text(self) -> str:
+        if self.reply_words <= 2:
+            return "Ответ заглушки."
+        with self._lock:
+            words = [self._rng.choice(_WORDS) for _ in range(self.reply_words)]
+        return " ".join(words).capitalize() + "."
+
+    def _json_reply(self) -> str:
+        """Запросы ДЗ: ответ в формате {"title", "steps", "notes"} из prompts.json (иногда испорченный)."""
+        reply = {"title": "План заглушки", "steps": ["Шаг один.", "Шаг два."], "notes": ["Заметка."]}
+        text = json.dumps(reply, ensure_ascii=False)
+        with self._lock:
+            if self._rng.random() >= self.malformed_json_rate:
+                return text
+            kind = self._rng.choice(_MALFORMED_KINDS)
+        if kind == "fences":
+            return f"```json\n{json.dumps(reply, ensure_ascii=False, indent=2)}\n```"
+        if kind == "prose":
+            return f"Вот план на день:\n{text}\nУдачи!"
+        if kind == "trailing_commas":
+            return text.replace('"]', '",]').replace("]}", "],}")
+        if kind == "string_steps":
+            return json.dumps({**reply, "steps": " ".join(reply["steps"])}, ensure_ascii=False)
+        if kind == "missing_key":
+            return json.dumps({"title": reply["title"], "steps": reply["steps"]}, ensure_ascii=False)
+        return text[: len(text) // 2]  # truncated
+
+    def _cached_tokens(self, messages: list[dict[str, Any]], prompt_tokens: int) -> int:
+        """Сколько токенов начала запроса совпало с прошлыми запросами (целыми блоками)."""
+        serialized = "".join(f"{m.get('role')}\n{m.get('content') or ''}\n" for m in messages)
+        digest = hashlib.sha1()
+        blocks = []
+        for start in range(0, len(serialized) - _CACHE_BLOCK_CHARS + 1, _CACHE_BLOCK_CHARS):
+            digest.update(serialized[start:start + _CACHE_BLOCK_CHARS].encode("utf-8"))
+            blocks.append(digest.hexdigest())
+        with self._lock:
+            hit = 0
+            while hit < len(blocks) and blocks[hit] in self._cache_blocks:
+                hit += 1
+            if len(self._cache_blocks) > _CACHE_MAX_BLOCKS:
+                self._cache_blocks.clear()
+            self._cache_blocks.update(blocks)
+        cached = min(hit * 128, prompt_tokens)
+        return cached if cached >= self.prompt_cache_min_tokens else 0
+
+    def build_completion(self, payload: dict[str, Any]) -> dict[str, Any]:
+        """Формирует ответ в формате chat.completion с правдоподобным usage (~4 символа на токен)."""
+        messages = payload.get("messages") or []
+        prompt_chars = sum(len(str(m.get("content") or "")) for m in messages)
+        system = " ".join(str(m.get("content") or "") for m in messages if m.get("role") == "system")
+        if "JSON" in system:
+            text = self._json_reply()
+        else:
+            text = self._reply_text()
+        prompt_tokens = max(1, prompt_chars // 4)
+        completion_tokens = max(1, len(text) // 4)
+        cached_tokens = self._cached_tokens(messages, prompt_tokens)
+        with self._lock:
+            self.prompt_tokens_total += prompt_tokens
+            self.cached_tokens_total += cached_tokens
+        return {
+            "id": f"chatcmpl-fake-{self.requests_served}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake-model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            },
+        }
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+class FakeServerProcess:
+    """
+    Заглушка в отдельном процессе: клиент и сервер не делят GIL, и замеры
+    нагрузочного теста не искажаются работой сервера. stats() — через GET /stats.
+    """
+
+    def __init__(self, server_args: list[str]) -> None:
+        self.server_args = server_args
+        self.port = _free_port()
+        self._proc: subprocess.Popen | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self) -> "FakeServerProcess":
+        self._proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(self.port), *self.server_args],
+            cwd=str(Path(__file__).resolve().parent.parent),
+            stdout=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=0.2):
+                    return self
+            except OSError:
+                time.sleep(0.05)
+        self.stop()
+        raise RuntimeError("Заглушка OpenAI не запустилась")
+
+    def stats(self) -> dict[str, Any]:
+        with urllib.request.urlopen(f"http://127.0.0.1:{self.port}/stats", timeout=5) as resp:
+            return json.loads(resp.read())
+
+    def stop(self) -> None:
+        if self._proc is not None:
+            self._proc.terminate()
+            self._proc.wait(timeout=5)
+            self._proc = None
+
+    def __enter__(self) -> "FakeServerProcess":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_args_to_cli(args: argparse.Namespace) -> list[str]:
+    """Параметры заглушки из argparse обратно в аргументы командной строки (для FakeServerProcess)."""
+    cli = [
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--chunk-delay", str(args.chunk_delay), "--reply-words", str(args.reply_words),
+        "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+        "--retry-after", str(args.retry_after),
+    ]
+    if args.seed is not None:
+        cli += ["--seed", str(args.seed)]
+    if args.reject_temperature:
+        cli.append("--reject-temperature")
+    if args.malformed_json_rate:
+        cli += ["--malformed-json-rate", str(args.malformed_json_rate)]
+    cli += ["--prompt-cache-min-tokens", str(args.prompt_cache_min_tokens)]
+    if args.slow_rate:
+        cli += ["--slow-rate", str(args.slow_rate), "--slow-latency", str(args.slow_latency)]
+    if args.model_profiles:
+        cli += ["--model-profiles", args.model_profiles]
+    return cli
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Параметры заглушки — общие для самостоятельного запуска и нагрузочного теста."""
+    parser.add_argument("--latency", type=float, default=0.5, help="задержка ответа, сек")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, сек")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="пауза между чанками потока, сек")
+    parser.add_argument("--reply-words", type=int, default=2, help="слов в ответе")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After для 429, сек")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--reject-temperature", action="store_true", help="отвечать 400 на запросы с temperature"
+    )
+    parser.add_argument(
+        "--malformed-json-rate", type=float, default=0.0, help="доля испорченных JSON-ответов на запросы ДЗ"
+    )
+    parser.add_argument(
+        "--prompt-cache-min-tokens", type=int, default=1024, help="с какой длины совпавшего начала запроса — cached_tokens"
+    )
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="доля очень медленных ответов (хвост задержек)")
+    parser.add_argument("--slow-latency", type=float, default=0.0, help="задержка медленного ответа, сек")
+    parser.add_argument(
+        "--model-profiles", default=None,
+        help='JSON: профили моделей, например {"gpt-4.1-nano": {"latency": 0.1, "slow_rate": 0.05, "slow_latency": 2}}',
+    )
+
+
+def server_from_args(args: argparse.Namespace, host: str = "127.0.0.1", port: int = 0) -> FakeOpenAIServer:
+    return FakeOpenAIServer(
+        host,
+        port,
+        latency=args.latency,
+        chunk_delay=args.chunk_delay,
+        jitter=args.jitter,
+        reply_words=args.reply_words,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        reject_temperature=args.reject_temperature,
+        malformed_json_rate=args.malformed_json_rate,
+        prompt_cache_min_tokens=args.prompt_cache_min_tokens,
+        slow_rate=args.slow_rate,
+        slow_latency=args.slow_latency,
+        model_profiles=json.loads(args.model_profiles) if args.model_profiles else None,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Заглушка OpenAI Chat Completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    server = server_from_args(args, args.host, args.port)
+    print(f"Заглушка OpenAI: {server.base_url} (latency={args.latency}s)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Заглушки объектов Telegram для прогона обработчиков bot.py без сети:
+FakeMessage записывает все ответы и правки в общий журнал вместо вызовов Bot API.
+"""
+import os
+import time
+from typing import Any
+
+# Формально валидный токен: Bot(token=...) проверяет только формат
+FAKE_BOT_TOKEN = "123456:AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA"
+
+
+def use_fake_bot_token() -> None:
+    """Подставляет фиктивный BOT_TOKEN до импорта bot.py."""
+    os.environ.setdefault("BOT_TOKEN", FAKE_BOT_TOKEN)
+
+
+def disable_send_limits() -> None:
+    """
+    Заглушки Telegram не ограничивают частоту: лимиты очереди отправки (telegram_output)
+    выключаются, чтобы бенчмарк мерил обработку, а не паузы. Лимиты — в bench_telegram_output.
+    """
+    from telegram_output import configure_chat_sender
+
+    configure_chat_sender(global_per_second=0, chat_per_minute=0, group_per_minute=0)
+
+
+class FakeUser:
+    def __init__(self, user_id: int) -> None:
+        self.id = user_id
+
+
+class FakeChat:
+    def __init__(self, chat_id: int) -> None:
+        self.id = chat_id
+
+
+class TelegramLog:
+    """Журнал вызовов «Bot API»: (время, действие, chat_id, текст)."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[float, str, int, str]] = []
+
+    def add(self, action: str, chat_id: int, text: str) -> None:
+        self.calls.append((time.monotonic(), action, chat_id, text))
+
+    def count(self, action: str | None = None) -> int:
+        return sum(1 for c in self.calls if action is None or c[1] == action)
+
+
+class FakeMessage:
+    """Минимальный aiogram.types.Message: text, from_user, chat, answer(), edit_text()."""
+
+    def __init__(self, text: str, user_id: int, log: TelegramLog | None = None, message_id: int = 1) -> None:
+        self.text = text
+        self.message_id = message_id
+        self.from_user = FakeUser(user_id)
+        self.chat = FakeChat(user_id)
+        self.log = log if log is not None else TelegramLog()
+
+    async def answer(self, text: str, **kwargs: Any) -> "FakeMessage":
+        self.log.add("answer", self.chat.id, text)
+        return FakeMessage(text, self.from_user.id, self.log, self.message_id + 1)
+
+    async def edit_text(self, text: str, **kwargs: Any) -> "FakeMessage":
+        self.log.add("edit", self.chat.id, text)
+        self.text = text
+        return self
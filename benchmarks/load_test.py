@@ -0,0 +1,218 @@
+"""
+Нагрузочный тест против локальной заглушки OpenAI: воспроизводит диалоги из JSONL
+(строка: {"user_id": 1, "turns": ["сообщение", ...]}) через клиент (async_chat_completion
+с контекстом, как в боте) или через обработчик bot.handle_text с фиктивным Message.
+
+Отчёт: пропускная способность, перцентили задержки хода, рост памяти context_manager,
+объём записи логов.
+
+Запуск:
+  python -m benchmarks.load_test --users 200 --turns 10 --concurrency 100 --latency 0.3
+  python -m benchmarks.load_test --conversations convs.jsonl --target bot
+  python -m benchmarks.load_test --target bot --metrics   # + длительность этапов (metrics)
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any
+
+from benchmarks._common import use_fake_openai
+from benchmarks.fake_openai_server import (
+    FakeServerProcess,
+    add_server_arguments,
+    server_args_to_cli,
+    server_from_args,
+)
+from benchmarks.fake_telegram import FakeMessage, TelegramLog, disable_send_limits, use_fake_bot_token
+
+_PHRASES = [
+    "Как не забывать пить воду?",
+    "Сколько стаканов в день нужно?",
+    "А если я пью кофе, это считается?",
+    "Придумай напоминание на обед.",
+    "Сделай план короче.",
+    "Что делать, если я забыл утром?",
+]
+
+
+def generate_conversations(users: int, turns: int, seed: int = 1) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    return [
+        {"user_id": 1000 + u, "turns": [rng.choice(_PHRASES) for _ in range(turns)]}
+        for u in range(users)
+    ]
+
+
+def load_conversations(path: Path) -> list[dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _proc_io() -> dict[str, int]:
+    """Счётчики записи процесса из /proc/self/io (Linux); пусто на других ОС."""
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            return {k: int(v) for k, v in (line.split(": ") for line in f)}
+    except OSError:
+        return {}
+
+
+async def _client_turn(user_id: int, text: str) -> None:
+    from context_manager import append_messages, select_context
+    from openai_client import async_chat_completion
+    from token_counter import count_message_tokens
+
+    user_message = {"role": "user", "content": text}
+    context = select_context(user_id, reserved_tokens=count_message_tokens(user_message))
+    response_text, _ = await async_chat_completion([*context, user_message])
+    append_messages(user_id, user_message, {"role": "assistant", "content": response_text})
+
+
+async def _bot_turn(user_id: int, text: str, log: TelegramLog) -> None:
+    import bot
+
+    await bot.handle_text(FakeMessage(text, user_id, log))
+
+
+async def run_load(conversations: list[dict[str, Any]], target: str, concurrency: int) -> dict[str, Any]:
+    from openai_client import close_async_client
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    latencies: list[float] = []
+    errors = 0
+    log = TelegramLog()
+
+    async def replay(conversation: dict[str, Any]) -> None:
+        nonlocal errors
+        async with semaphore:
+            for text in conversation["turns"]:
+                start = time.perf_counter()
+                try:
+                    if target == "bot":
+                        await _bot_turn(conversation["user_id"], text, log)
+                    else:
+                        await _client_turn(conversation["user_id"], text)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(replay(c) for c in conversations))
+    elapsed = time.perf_counter() - start
+    await close_async_client()
+    return {
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "errors": errors,
+        "telegram_answers": log.count("answer"),
+        "telegram_edits": log.count("edit"),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=Path, help="JSONL с диалогами (иначе генерируются)")
+    parser.add_argument("--write-conversations", type=Path, help="сохранить сгенерированные диалоги в JSONL")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременно активных пользователей")
+    parser.add_argument("--target", choices=("client", "bot"), default="client")
+    parser.add_argument("--tracemalloc", action="store_true", help="замерить пик выделенной памяти Python")
+    parser.add_argument(
+        "--in-process-server", action="store_true",
+        help="заглушка в потоке этого процесса (по умолчанию — отдельный процесс, чтобы не делить GIL)",
+    )
+    parser.add_argument("--rpm", type=int, default=0, help="лимит планировщика: запросов в минуту (0 = нет)")
+    parser.add_argument("--tpm", type=int, default=0, help="лимит планировщика: токенов в минуту (0 = нет)")
+    parser.add_argument("--max-in-flight", type=int, default=32, help="лимит планировщика: одновременных запросов")
+    parser.add_argument("--max-retries", type=int, default=4, help="повторов при 429/5xx")
+    parser.add_argument("--metrics", action="store_true", help="включить metrics и вывести длительность этапов")
+    add_server_arguments(parser)
+    parser.set_defaults(latency=0.2)
+    args = parser.parse_args()
+
+    if args.conversations:
+        conversations = load_conversations(args.conversations)
+    else:
+        conversations = generate_conversations(args.users, args.turns)
+        if args.write_conversations:
+            with open(args.write_conversations, "w", encoding="utf-8") as f:
+                for c in conversations:
+                    f.write(json.dumps(c, ensure_ascii=False) + "\n")
+
+    use_fake_bot_token()
+    disable_send_limits()
+    server = server_from_args(args) if args.in_process_server else FakeServerProcess(server_args_to_cli(args))
+    with server:
+        logs_dir = use_fake_openai(server.base_url)
+        import context_manager
+        import metrics
+        import usage_logger
+        from percentiles import summarize
+        from request_scheduler import configure_request_scheduler
+
+        scheduler = configure_request_scheduler(
+            rpm=args.rpm, tpm=args.tpm, max_in_flight=args.max_in_flight, max_retries=args.max_retries
+        )
+
+        metrics.configure_metrics(args.metrics)
+        ctx_before = context_manager.get_stats()
+        io_before = _proc_io()
+        if args.tracemalloc:
+            tracemalloc.start()
+        result = asyncio.run(run_load(conversations, args.target, args.concurrency))
+        peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        ctx_after = context_manager.get_stats()
+        logger_obj = usage_logger.get_usage_logger()
+        usage_logger.shutdown_usage_logger()
+        io_after = _proc_io()
+        server_stats = server.stats()
+        sched = scheduler.stats()
+        snapshot = metrics.snapshot() if args.metrics else None
+
+    turns = len(result["latencies"])
+    lat = summarize(result["latencies"])
+    usage_path = logs_dir / "usage.csv"
+    print(f"Цель: {args.target}, пользователей: {len(conversations)}, ходов: {turns}, параллельно: {args.concurrency}")
+    print(f"  время: {result['elapsed']:.2f} с, пропускная способность: {turns / result['elapsed']:.1f} ходов/с, ошибок: {result['errors']}")
+    print(f"  задержка хода, с: p50 {lat['p50']:.3f}, p95 {lat['p95']:.3f}, p99 {lat['p99']:.3f}, макс {lat['max']:.3f}")
+    print(
+        f"  context_manager: пользователей {ctx_before['users']} -> {ctx_after['users']}, "
+        f"сообщений {ctx_before['messages']} -> {ctx_after['messages']}, "
+        f"байт {ctx_before['bytes']} -> {ctx_after['bytes']}"
+    )
+    if peak is not None:
+        print(f"  пик памяти Python (tracemalloc): {peak / 1024 / 1024:.1f} МБ")
+    print(
+        f"  usage-лог: записей {logger_obj.records_written}, пачек {logger_obj.batches_written}, "
+        f"размер {usage_path.stat().st_size if usage_path.exists() else 0} байт"
+    )
+    if io_before and io_after:
+        print(
+            f"  запись процесса: {io_after['wchar'] - io_before['wchar']} байт, "
+            f"вызовов write: {io_after['syscw'] - io_before['syscw']}"
+        )
+    if args.target == "bot":
+        print(f"  Telegram: отправок {result['telegram_answers']}, правок {result['telegram_edits']}")
+    print(
+        f"  планировщик: повторов {sched['retries']} (429: {sched['rate_limited']}), отказов {sched['failures']}, "
+        f"макс. очередь {sched['max_queue_depth']}, ожидание p50 {sched['wait_s']['p50']:.3f} / "
+        f"p99 {sched['wait_s']['p99']:.3f} с"
+    )
+    print(f"  заглушка: {server_stats}")
+    if snapshot is not None:
+        print("  этапы (metrics), мс:")
+        for stage, s in snapshot["stages"].items():
+            print(
+                f"    {stage:>18}: n {s['count']:>6}, p50 {s['p50'] * 1000:>8.2f}, "
+                f"p99 {s['p99'] * 1000:>8.2f}, сумма {s['sum_s']:.2f} с"
+            )
+        print(f"  счётчики: {snapshot['counters']}")
+
+
+if __name__ == "__main__":
+    main()
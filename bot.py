@@ -1,17 +1,49 @@
 """
 Telegram-бот на aiogram с подключением к OpenAI и контекстом диалога.
 """
+import asyncio
 import json
 import logging
+import time
 from typing import Any
 
 from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
 from aiogram.types import Message
 
-from config import BOT_TOKEN, MAX_CONTEXT_MESSAGES, OPENAI_MODEL, OPENAI_TEMPERATURE, validate_config
-from context_manager import append_messages, clear_context, get_context
-from openai_client import chat_completion, load_prompts, run_homework_prompt
+import metrics
+from config import (
+    BOT_MAX_CONCURRENT_MESSAGES,
+    CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT_SECONDS,
+    OPENAI_TEMPERATURE,
+    STREAM_EDIT_INTERVAL_SECONDS,
+    STREAM_EDIT_MIN_CHARS,
+    STREAM_RESPONSES,
+    TELEGRAM_API_URL,
+    TELEGRAM_MESSAGE_LIMIT,
+    validate_config,
+)
+from context_manager import (
+    append_messages,
+    clear_context,
+    close_context_backend,
+    select_context,
+    wait_for_summaries,
+)
+from model_router import describe_models
+from openai_client import (
+    async_chat_completion,
+    async_run_homework_prompt,
+    async_stream_chat_completion,
+    close_async_client,
+)
+from prompt_registry import get_prompt_registry
+from telegram_output import get_chat_sender, split_message
+from token_counter import count_message_tokens
+from usage_logger import shutdown_usage_logger
+from user_locks import KeyedLimiter
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,22 +52,98 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=BOT_TOKEN)
+_bot: Bot | None = None
 dp = Dispatcher()
 
 CLEAR_PHRASE = "очистить контекст"
+STREAM_PLACEHOLDER = "…"
+
+# Сообщения одного пользователя — по очереди (контекст не перемешивается), разных — параллельно
+user_limiter = KeyedLimiter(BOT_MAX_CONCURRENT_MESSAGES)
+
+
+def _collect_metrics() -> dict[str, float]:
+    stats = user_limiter.stats()
+    return {
+        "messages_active": stats["active"],
+        "messages_waiting": stats["waiting"],
+        "messages_handled_total": stats["handled"],
+    }
+
+
+metrics.register_collector("bot", _collect_metrics)
+
 
+def get_bot() -> Bot:
+    """
+    Общий Bot, создаётся при первом вызове — после validate_config: Bot(token=...)
+    проверяет формат токена, а HTTP-сессия нужна только для запросов к Bot API.
+    """
+    global _bot
+    if _bot is None:
+        from config import BOT_TOKEN
 
-def _trim_context(messages: list[dict[str, Any]], max_messages: int) -> list[dict[str, Any]]:
-    """Оставляет только последние max_messages сообщений (парами user+assistant)."""
-    if len(messages) <= max_messages:
-        return messages
-    return messages[-max_messages:]
+        _bot = Bot(
+            token=BOT_TOKEN,
+            session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None,
+        )
+    return _bot
+
+
+def _preview(text: str) -> str:
+    """Промежуточная правка потокового ответа: начало текста (итог делится на части в _reply)."""
+    if len(text) > TELEGRAM_MESSAGE_LIMIT - 100:
+        return text[:TELEGRAM_MESSAGE_LIMIT - 100] + " …"
+    return text + " …"
+
+
+async def _reply(message: Message, placeholder: Message | None, text: str) -> None:
+    """
+    Итоговый ответ: первая часть — правкой сообщения-заглушки (потоковый режим),
+    остальные части (или весь ответ без заглушки) — через очередь отправки чата.
+    """
+    sender = get_chat_sender()
+    parts = split_message(text)
+    with metrics.timer("telegram_send"):
+        if placeholder is not None and parts and await sender.edit(placeholder, parts[0]):
+            parts = parts[1:]
+        futures = [sender.submit(message, part) for part in parts]
+        if futures:
+            await futures[-1]  # части одного чата уходят по порядку
+
+
+async def _stream_to_message(placeholder: Message, messages: list[dict[str, Any]]) -> tuple[str, dict[str, int]]:
+    """
+    Получает ответ потоково и показывает его правками сообщения-заглушки:
+    не чаще STREAM_EDIT_INTERVAL_SECONDS и не меньше STREAM_EDIT_MIN_CHARS новых символов
+    за правку; правка пропускается, если лимит чата или общий лимит Telegram исчерпан
+    (очередь отправки, telegram_output). Итоговую правку делает вызывающий.
+    """
+    usage: dict[str, int] = {}
+    parts: list[str] = []
+    shown_len = 0
+    next_edit_at = time.monotonic() + STREAM_EDIT_INTERVAL_SECONDS
+    started = time.perf_counter()
+    async for delta in async_stream_chat_completion(messages, usage_out=usage):
+        if not parts:
+            metrics.observe("openai_first_chunk", time.perf_counter() - started)
+        parts.append(delta)
+        now = time.monotonic()
+        if now < next_edit_at:
+            continue
+        text = "".join(parts)
+        if len(text) - shown_len < STREAM_EDIT_MIN_CHARS:
+            continue
+        if await get_chat_sender().edit(placeholder, _preview(text), wait=False):
+            shown_len = len(text)
+        next_edit_at = time.monotonic() + STREAM_EDIT_INTERVAL_SECONDS
+    return "".join(parts).strip(), usage
 
 
 @dp.message(Command("start"))
 async def cmd_start(message: Message) -> None:
-    await message.answer(
+    await get_chat_sender().send(
+        message,
         "Привет! Я бот с GPT. Пиши мне сообщения — я буду отвечать с учётом контекста.\n"
         'Чтобы сбросить историю, напиши: "очистить контекст"'
     )
@@ -44,60 +152,38 @@ async def cmd_start(message: Message) -> None:
 @dp.message(Command("homework"))
 async def cmd_homework(message: Message) -> None:
     """Команда /homework: показывает задачу и список промптов."""
-    data = load_prompts()
-    task = data.get("homework_task", "")
-    lines = [f"*Задача:* {task}", "", "*Промпты:*"]
-    for p in data.get("prompts", []):
-        lines.append(f"  • {p.get('id')}: {p.get('name', '')}")
+    registry = get_prompt_registry()
+    lines = [f"*Задача:* {registry.homework_task}", "", "*Промпты:*"]
+    for p in registry.prompts():
+        lines.append(f"  • {p.id}: {p.name}")
     lines.append("")
     lines.append("Отправь номер промпта (1 или 2)")
-    await message.answer("\n".join(lines), parse_mode="Markdown")
-
-
-def _format_prompt_for_display(prompt_entry: dict[str, Any]) -> str:
-    """Собирает текст промпта для отображения (role, context, question, format, example)."""
-    role = (prompt_entry.get("role") or "").strip()
-    context = (prompt_entry.get("context") or "").strip()
-    question = (prompt_entry.get("question") or "").strip()
-    fmt = (prompt_entry.get("format") or "").strip()
-    parts = []
-    if role:
-        parts.append(f"*Роль:*\n{role}")
-    if fmt:
-        parts.append(f"*Формат:*\n{fmt}")
-    parts.append(f"*Контекст:*\n{context}")
-    parts.append(f"*Задача:*\n{question}")
-    if prompt_entry.get("example") is not None:
-        ex = json.dumps(prompt_entry["example"], ensure_ascii=False, indent=2)
-        parts.append(f"*Пример:*\n```json\n{ex}\n```")
-    text = "\n\n".join(parts)
-    if len(text) > 4000:
-        text = text[:3997] + "..."
-    return text
+    await get_chat_sender().send(message, "\n".join(lines), parse_mode="Markdown")
 
 
 @dp.message(F.text.regexp(r"^[12]$"))
 async def handle_homework_prompt_choice(message: Message) -> None:
     """Обработка выбора номера промпта (1 или 2) для ДЗ."""
+    sender = get_chat_sender()
     prompt_id = int(message.text.strip())
-    data = load_prompts()
-    prompt_entry = next((p for p in data.get("prompts", []) if p.get("id") == prompt_id), None)
+    prompt_entry = get_prompt_registry().get(prompt_id)
     if not prompt_entry:
-        await message.answer(f"Промпт с id={prompt_id} не найден.")
+        await sender.send(message, f"Промпт с id={prompt_id} не найден.")
         return
 
-    await message.answer(f"Запускаю промпт #{prompt_id}, подожди...")
-    prompt_text = _format_prompt_for_display(prompt_entry)
-    await message.answer(f"*Промпт:*\n\n{prompt_text}", parse_mode="Markdown")
+    # Не ждём отправки: запрос к модели идёт параллельно. Статус — без разметки, поэтому
+    # с текстом промпта (Markdown) в одно сообщение не объединяется
+    sender.submit(message, f"Запускаю промпт #{prompt_id}, подожди...", status=True)
+    sender.submit(message, f"*Промпт:*\n\n{prompt_entry.display_text}", parse_mode="Markdown")
 
     try:
-        out = run_homework_prompt(prompt_id)
+        out = await async_run_homework_prompt(prompt_id)
     except Exception as e:
         logger.exception("Ошибка при запуске промпта: %s", e)
-        await message.answer(f"Ошибка: {e}")
+        await sender.send(message, f"Ошибка: {e}")
         return
 
-    name = prompt_entry.get("name", "")
+    name = prompt_entry.name
     usage = out.get("usage", {})
     parsed = out.get("parsed", False)
     result = out.get("result", {})
@@ -106,18 +192,23 @@ async def handle_homework_prompt_choice(message: Message) -> None:
     body = (
         f"*Промпт:* {name}\n"
         f"*Валидный JSON:* {'да' if parsed else 'нет'}\n"
-        f"*Токены:* вход {usage.get('prompt_tokens', 0)}, выход {usage.get('completion_tokens', 0)}, всего {usage.get('total_tokens', 0)}\n\n"
+        f"*Токены:* вход {usage.get('prompt_tokens', 0)}, выход {usage.get('completion_tokens', 0)}, всего {usage.get('total_tokens', 0)}"
+        f"{' (общий запрос с другими пользователями)' if usage.get('coalesced') else ''}\n\n"
         f"```json\n{json_str}\n```"
     )
-    if len(body) > 4000:
-        body = body[:3980] + "\n...\n```"
-    await message.answer(body, parse_mode="Markdown")
-    await message.answer("Результат сохранён в logs/homework_results.json")
+    sender.submit(message, body, parse_mode="Markdown")
+    await sender.send(message, "Результат сохранён в logs/homework\\_results.jsonl", parse_mode="Markdown")
 
 
 @dp.message(F.text)
 async def handle_text(message: Message) -> None:
     user_id = message.from_user.id if message.from_user else 0
+    with metrics.timer("handle_text"):
+        async with user_limiter.hold(user_id):
+            await _handle_text(message, user_id)
+
+
+async def _handle_text(message: Message, user_id: int) -> None:
     text = (message.text or "").strip()
 
     if not text:
@@ -126,57 +217,86 @@ async def handle_text(message: Message) -> None:
     # Команда очистки контекста
     if text.lower() == CLEAR_PHRASE.lower():
         clear_context(user_id)
-        await message.answer("Контекст очищен. Можем начать диалог заново.")
+        await get_chat_sender().send(message, "Контекст очищен. Можем начать диалог заново.")
         return
 
-    # Собираем контекст и добавляем новое сообщение пользователя
-    context = get_context(user_id)
-    context = _trim_context(context, MAX_CONTEXT_MESSAGES)
-    messages: list[dict[str, Any]] = context + [{"role": "user", "content": text}]
+    # Собираем контекст (по числу сообщений или по бюджету токенов) и добавляем новое сообщение
+    user_message = {"role": "user", "content": text}
+    context = select_context(user_id, reserved_tokens=count_message_tokens(user_message))
+    messages: list[dict[str, Any]] = [*context, user_message]
 
+    placeholder: Message | None = None
     try:
-        response_text, usage = chat_completion(messages, model=OPENAI_MODEL)
+        if STREAM_RESPONSES:
+            with metrics.timer("telegram_send"):
+                placeholder = await get_chat_sender().send(message, STREAM_PLACEHOLDER, merge=False)
+        if placeholder is not None:
+            with metrics.timer("openai_call"):
+                response_text, usage = await _stream_to_message(placeholder, messages)
+        else:
+            with metrics.timer("openai_call"):
+                response_text, usage = await async_chat_completion(messages)
     except Exception as e:
+        metrics.inc("openai_errors")
         logger.exception("OpenAI error for user_id=%s: %s", user_id, e)
-        await message.answer(
-            "Произошла ошибка при обращении к OpenAI. Попробуйте позже или очистите контекст."
+        await _reply(
+            message,
+            placeholder,
+            "Произошла ошибка при обращении к OpenAI. Попробуйте позже или очистите контекст.",
         )
         return
 
     logger.info(
-        "user_id=%s | токены: вход=%s, выход=%s, всего=%s",
+        "user_id=%s | токены: вход=%s (из кэша %s), выход=%s, всего=%s",
         user_id,
         usage["prompt_tokens"],
+        usage.get("cached_tokens", 0),
         usage["completion_tokens"],
         usage["total_tokens"],
     )
 
     if not response_text.strip():
+        metrics.inc("empty_responses")
         logger.warning("Пустой ответ от модели для user_id=%s", user_id)
-        await message.answer(
-            "Модель вернула пустой ответ. Попробуйте переформулировать или напишите «очистить контекст»."
+        await _reply(
+            message,
+            placeholder,
+            "Модель вернула пустой ответ. Попробуйте переформулировать или напишите «очистить контекст».",
         )
         return
 
     # Обновляем контекст: добавляем сообщение пользователя и ответ ассистента
-    append_messages(
-        user_id,
-        {"role": "user", "content": text},
-        {"role": "assistant", "content": response_text},
-    )
+    with metrics.timer("context_update"):
+        append_messages(
+            user_id,
+            user_message,
+            {"role": "assistant", "content": response_text},
+        )
+
+    await _reply(message, placeholder, response_text)
 
-    # Telegram лимит длины сообщения ~4096
-    if len(response_text) > 4000:
-        response_text = response_text[:3997] + "..."
-    await message.answer(response_text)
+
+async def close_resources() -> None:
+    """
+    Закрывает клиент OpenAI, дожидается начатых сжатий контекста, дописывает usage-лог
+    и контекст на диск (polling и webhook).
+    """
+    await close_async_client()
+    wait_for_summaries(CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT_SECONDS)
+    shutdown_usage_logger()
+    close_context_backend()
 
 
 async def main() -> None:
+    """Режим long polling."""
     validate_config()
-    logger.info("Бот запущен, модель: %s, температура: %s", OPENAI_MODEL, OPENAI_TEMPERATURE)
-    await dp.start_polling(bot)
+    logger.info("Бот запущен, модель: %s, температура: %s", describe_models(), OPENAI_TEMPERATURE)
+    metrics.start_exporters()
+    try:
+        await dp.start_polling(get_bot())
+    finally:
+        await close_resources()
 
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
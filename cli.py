@@ -1,14 +1,25 @@
 """
 CLI для общения с OpenAI с тем же контекстом и логикой, что и бот.
 Запуск: python cli.py
+Пакетный прогон промптов ДЗ: python cli.py batch --prompts 1,2 --samples 50 --concurrency 8
+Отчёт по usage: python cli.py usage-report --by model,day [--compact]
+Отчёт о времени запуска (импорты, этапы): python cli.py --profile-startup [batch ...]
+SDK openai загружается при первом запросе к модели, а не при запуске.
 """
+import argparse
+import asyncio
 import json
 import logging
+import sys
+from pathlib import Path
 from typing import Any
 
-from config import MAX_CONTEXT_MESSAGES, OPENAI_MODEL, validate_config_openai
-from context_manager import append_messages, clear_context, get_context
-from openai_client import chat_completion, load_prompts, run_homework_prompt
+from config import CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT_SECONDS, STREAM_RESPONSES, validate_config_openai
+from context_manager import append_messages, clear_context, select_context, wait_for_summaries
+from model_router import describe_models
+from openai_client import chat_completion, run_homework_prompt, stream_chat_completion
+from prompt_registry import get_prompt_registry
+from token_counter import count_message_tokens
 
 logging.basicConfig(
     level=logging.WARNING,
@@ -22,21 +33,13 @@ CLEAR_PHRASE = "очистить контекст"
 EXIT_COMMANDS = ("exit", "quit", "выход")
 
 
-def _trim_context(messages: list[dict[str, Any]], max_messages: int) -> list[dict[str, Any]]:
-    """Оставляет только последние max_messages сообщений."""
-    if len(messages) <= max_messages:
-        return messages
-    return messages[-max_messages:]
-
-
 def run_homework_interactive() -> None:
     """Интерактивный режим для запуска промптов из prompts.json (ДЗ)."""
     print("=== ДЗ VPf03: Управляемый промпт ===\n")
-    data = load_prompts()
-    print("Задача:", data.get("homework_task", ""), "\n")
-    prompts = data.get("prompts", [])
-    for p in prompts:
-        print(f"  {p.get('id')}: {p.get('name', '')}")
+    registry = get_prompt_registry()
+    print("Задача:", registry.homework_task, "\n")
+    for p in registry.prompts():
+        print(f"  {p.id}: {p.name}")
     print("  0: Выход\n")
 
     while True:
@@ -56,12 +59,13 @@ def run_homework_interactive() -> None:
             print("Выход из режима ДЗ.\n")
             return
 
-        prompt_entry = next((p for p in prompts if p.get("id") == prompt_id), None)
-        if not prompt_entry:
+        prompt = get_prompt_registry().get(prompt_id)
+        if not prompt:
             print(f"Промпт с id={prompt_id} не найден.\n")
             continue
 
         # Вывод самого промпта
+        prompt_entry = prompt.raw
         role = (prompt_entry.get("role") or "").strip()
         context = (prompt_entry.get("context") or "").strip()
         question = (prompt_entry.get("question") or "").strip()
@@ -86,7 +90,7 @@ def run_homework_interactive() -> None:
             print(f"Ошибка: {e}\n")
             continue
 
-        name = prompt_entry.get("name", "")
+        name = prompt.name
         usage = out.get("usage", {})
         parsed = out.get("parsed", False)
         result = out.get("result", {})
@@ -96,12 +100,29 @@ def run_homework_interactive() -> None:
         print(f"Токены: вход {usage.get('prompt_tokens', 0)}, выход {usage.get('completion_tokens', 0)}, всего {usage.get('total_tokens', 0)}")
         print("Результат (JSON):")
         print(json.dumps(result, ensure_ascii=False, indent=2))
-        print("\nРезультат сохранён в logs/homework_results.json\n")
+        print("\nРезультат сохранён в logs/homework_results.jsonl\n")
+
+
+def _print_stream(messages: list[dict[str, Any]]) -> tuple[str, dict[str, int], bool]:
+    """Печатает ответ по мере генерации. Возвращает (текст, usage, было ли что-то напечатано)."""
+    usage: dict[str, int] = {}
+    parts: list[str] = []
+    for delta in stream_chat_completion(messages, usage_out=usage):
+        if not parts:
+            delta = delta.lstrip()
+            if not delta:
+                continue
+            print("Бот: ", end="", flush=True)
+        parts.append(delta)
+        print(delta, end="", flush=True)
+    if parts:
+        print()
+    return "".join(parts).strip(), usage, bool(parts)
 
 
 def run() -> None:
     validate_config_openai()
-    print(f"CLI-чат с OpenAI (модель: {OPENAI_MODEL})")
+    print(f"CLI-чат с OpenAI (модель: {describe_models()})")
     print('Введите сообщение. "очистить контекст" — сброс истории. "homework" — режим ДЗ. exit / quit / выход — выход.\n')
 
     while True:
@@ -127,15 +148,19 @@ def run() -> None:
             print("Контекст очищен.\n")
             continue
 
-        context = get_context(CLI_USER_ID)
-        context = _trim_context(context, MAX_CONTEXT_MESSAGES)
-        messages: list[dict[str, Any]] = context + [{"role": "user", "content": text}]
+        user_message = {"role": "user", "content": text}
+        context = select_context(CLI_USER_ID, reserved_tokens=count_message_tokens(user_message))
+        messages: list[dict[str, Any]] = [*context, user_message]
 
+        printed = False
         try:
-            response_text, usage = chat_completion(messages, model=OPENAI_MODEL)
+            if STREAM_RESPONSES:
+                response_text, usage, printed = _print_stream(messages)
+            else:
+                response_text, usage = chat_completion(messages)
         except Exception as e:
             logger.exception("Ошибка OpenAI: %s", e)
-            print("Ошибка при запросе к OpenAI. Попробуйте позже или очистите контекст.\n")
+            print("\nОшибка при запросе к OpenAI. Попробуйте позже или очистите контекст.\n")
             continue
 
         if not response_text.strip():
@@ -143,12 +168,118 @@ def run() -> None:
         else:
             append_messages(
                 CLI_USER_ID,
-                {"role": "user", "content": text},
+                user_message,
                 {"role": "assistant", "content": response_text},
             )
-            print(f"Бот: {response_text}")
+            if not printed:
+                print(f"Бот: {response_text}")
         print(f"  [Токены: вход {usage['prompt_tokens']}, выход {usage['completion_tokens']}, всего {usage['total_tokens']}]\n")
 
+    # Начатое сжатие контекста сохраняется до выхода (хранилище закрывается при завершении процесса)
+    wait_for_summaries(CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT_SECONDS)
+
+
+def run_batch_command(args: argparse.Namespace) -> None:
+    """Подкоманда batch: пакетный прогон промптов ДЗ со сводкой."""
+    from homework_batch import format_report, run_batch
+
+    validate_config_openai()
+    prompt_ids = [int(x) for x in args.prompts.split(",") if x.strip()]
+    for prompt_id in prompt_ids:
+        if get_prompt_registry().get(prompt_id) is None:
+            raise SystemExit(f"Промпт с id={prompt_id} не найден в prompts.json")
+    print(f"Прогон: промпты {prompt_ids}, по {args.samples} запусков, параллельно до {args.concurrency}\n")
+    report = asyncio.run(run_batch(prompt_ids, args.samples, args.concurrency))
+    print(format_report(report))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nСводка сохранена в {args.report}")
+    print("Результаты запусков сохранены в logs/homework_results.jsonl")
+
+
+def run_usage_report_command(args: argparse.Namespace) -> None:
+    """Подкоманда usage-report: сводка токенов и стоимости по logs/usage.csv."""
+    from usage_report import (
+        build_report,
+        compact,
+        default_summary_path,
+        default_usage_paths,
+        format_report,
+        load_prices,
+    )
+
+    paths = [Path(p) for p in args.paths] or default_usage_paths()
+    summary_path = Path(args.summary) if args.summary else default_summary_path()
+    if args.compact:
+        result = compact(paths, summary_path, rotate=args.rotate)
+        print(
+            f"Свёрнуто в {summary_path}: файлов {result['files']}, строк {result['rows']} "
+            f"({result['bytes'] / 1024 / 1024:.1f} МБ), битых {result['bad_rows']}"
+        )
+        for rotated in result["rotated"]:
+            print(f"Файл переименован: {rotated}")
+        print()
+        if not args.paths:
+            paths = default_usage_paths()  # с только что переименованными
+    try:
+        report = build_report(
+            paths,
+            by=tuple(d.strip() for d in args.by.split(",") if d.strip()),
+            since=args.since,
+            until=args.until,
+            summary_path=None if args.no_summary else summary_path,
+            prices=load_prices(Path(args.prices)) if args.prices else None,
+        )
+    except ValueError as e:
+        raise SystemExit(str(e))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nОтчёт сохранён в {args.json}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="CLI-чат с OpenAI и режим ДЗ")
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="не запускать CLI, а показать время запуска: этапы и самые долгие импорты",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    batch = subparsers.add_parser("batch", help="пакетный прогон промптов ДЗ")
+    batch.add_argument("--prompts", default="1,2", help="id промптов через запятую")
+    batch.add_argument("--samples", type=int, default=10, help="запусков на промпт")
+    batch.add_argument("--concurrency", type=int, default=4, help="одновременных запросов")
+    batch.add_argument("--report", help="сохранить сводку в JSON-файл")
+    report = subparsers.add_parser("usage-report", help="отчёт по usage: токены и стоимость")
+    report.add_argument("paths", nargs="*", help="CSV usage-лога (по умолчанию logs/usage.csv и logs/usage-ГГГГММДД-ЧЧММСС.csv)")
+    report.add_argument("--by", default="model", help="измерения через запятую: model, day, hour, temperature")
+    report.add_argument("--since", help="с дня ГГГГ-ММ-ДД включительно")
+    report.add_argument("--until", help="по день ГГГГ-ММ-ДД включительно")
+    report.add_argument("--summary", help="сводка SQLite (по умолчанию USAGE_SUMMARY_PATH / logs/usage_summary.sqlite3)")
+    report.add_argument("--no-summary", action="store_true", help="не использовать сводку, читать CSV целиком")
+    report.add_argument("--compact", action="store_true", help="сначала свернуть новые строки CSV в сводку")
+    report.add_argument("--rotate", action="store_true", help="с --compact: затем переименовать CSV (ротация)")
+    report.add_argument("--prices", help='JSON с ценами {"модель": [вход, выход, вход из кэша]}, $ за 1M токенов')
+    report.add_argument("--json", help="сохранить отчёт в JSON-файл")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.profile_startup:
+        from startup_profile import print_report
+
+        print_report("cli", [a for a in argv if a != "--profile-startup"])
+    elif args.command == "batch":
+        run_batch_command(args)
+    elif args.command == "usage-report":
+        run_usage_report_command(args)
+    else:
+        run()
+
 
 if __name__ == "__main__":
-    run()
+    main()
@@ -0,0 +1,228 @@
+"""
+Кэш ответов Chat Completions (включается в config: COMPLETION_CACHE_ENABLED).
+
+Ключ — SHA-256 от канонического JSON (model, messages, temperature, max_tokens).
+Два уровня: LRU в памяти (лимиты по числу записей и байтам) и необязательный
+SQLite на диске (COMPLETION_CACHE_DISK_PATH). У каждой записи TTL.
+Счётчики попаданий/промахов — в stats().
+"""
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import metrics
+from config import (
+    COMPLETION_CACHE_DISK_MAX_BYTES,
+    COMPLETION_CACHE_DISK_PATH,
+    COMPLETION_CACHE_MAX_BYTES,
+    COMPLETION_CACHE_MAX_ENTRIES,
+    COMPLETION_CACHE_TTL_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    model: str,
+    messages: list[dict[str, Any]],
+    temperature: float,
+    max_tokens: int,
+) -> str:
+    """Стабильный ключ запроса: одинаковые параметры и сообщения дают одинаковый хэш."""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _DiskTier:
+    """SQLite-таблица key -> (текст, usage) с TTL и вытеснением по суммарному размеру."""
+
+    def __init__(self, path: Path, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completion_cache ("
+            "key TEXT PRIMARY KEY, expires_at REAL, last_access REAL, size INTEGER, "
+            "text TEXT, usage TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cc_access ON completion_cache(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str, now: float) -> tuple[str, dict[str, int]] | None:
+        row = self._conn.execute(
+            "SELECT expires_at, text, usage FROM completion_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[0] < now:
+            with self._conn:
+                self._conn.execute("DELETE FROM completion_cache WHERE key = ?", (key,))
+            return None
+        with self._conn:
+            self._conn.execute("UPDATE completion_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[1], json.loads(row[2])
+
+    def put(self, key: str, text: str, usage: dict[str, int], expires_at: float, now: float) -> None:
+        size = len(text.encode("utf-8"))
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completion_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, expires_at, now, size, text, json.dumps(usage)),
+            )
+            self._conn.execute("DELETE FROM completion_cache WHERE expires_at < ?", (now,))
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM completion_cache").fetchone()[0]
+            if total > self.max_bytes:
+                # Удаляем давно не использованные, пока не уложимся в лимит
+                rows = self._conn.execute(
+                    "SELECT key, size FROM completion_cache ORDER BY last_access"
+                ).fetchall()
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM completion_cache WHERE key = ?", (old_key,))
+                    total -= old_size
+
+    def clear(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM completion_cache")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CompletionCache:
+    """LRU в памяти + необязательный дисковый уровень, TTL, лимиты по размеру, счётчики."""
+
+    def __init__(
+        self,
+        ttl: float = COMPLETION_CACHE_TTL_SECONDS,
+        max_entries: int = COMPLETION_CACHE_MAX_ENTRIES,
+        max_bytes: int = COMPLETION_CACHE_MAX_BYTES,
+        disk_path: Path | None = None,
+        disk_max_bytes: int = COMPLETION_CACHE_DISK_MAX_BYTES,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # key -> (expires_at, text, usage, size)
+        self._memory: OrderedDict[str, tuple[float, str, dict[str, int], int]] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = _DiskTier(disk_path, disk_max_bytes) if disk_path else None
+        self.hits = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _memory_put(self, key: str, text: str, usage: dict[str, int], expires_at: float) -> None:
+        size = len(text.encode("utf-8"))
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[3]
+        self._memory[key] = (expires_at, text, usage, size)
+        self._memory_bytes += size
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted[3]
+            self.evictions += 1
+
+    def get(self, key: str) -> tuple[str, dict[str, int]] | None:
+        """(текст, usage исходного запроса) или None, если записи нет или она устарела."""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[0] >= now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return item[1], item[2]
+                self._memory.pop(key)
+                self._memory_bytes -= item[3]
+            if self._disk is not None:
+                found = self._disk.get(key, now)
+                if found is not None:
+                    self.hits += 1
+                    self.disk_hits += 1
+                    self._memory_put(key, found[0], found[1], now + self.ttl)
+                    return found
+            self.misses += 1
+            return None
+
+    def put(self, key: str, text: str, usage: dict[str, int]) -> None:
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._memory_put(key, text, usage, expires_at)
+            if self._disk is not None:
+                try:
+                    self._disk.put(key, text, usage, expires_at, now)
+                except sqlite3.Error as e:
+                    logger.warning("Не удалось записать ответ в дисковый кэш: %s", e)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._disk is not None:
+                self._disk.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._memory),
+            "bytes": self._memory_bytes,
+            "evictions": self.evictions,
+        }
+
+
+_cache: CompletionCache | None = None
+
+
+def get_completion_cache() -> CompletionCache:
+    """Общий кэш ответов процесса."""
+    global _cache
+    if _cache is None:
+        disk_path = Path(COMPLETION_CACHE_DISK_PATH) if COMPLETION_CACHE_DISK_PATH else None
+        _cache = CompletionCache(disk_path=disk_path)
+    return _cache
+
+
+def configure_completion_cache(**kwargs: Any) -> CompletionCache:
+    """Заменяет общий кэш (другие лимиты, путь к диску) — например, для прогонов и бенчмарков."""
+    global _cache
+    _cache = CompletionCache(**kwargs)
+    return _cache
+
+
+def _collect_metrics() -> dict[str, float]:
+    if _cache is None:
+        return {}
+    stats = _cache.stats()
+    return {
+        "completion_cache_hits_total": stats["hits"],
+        "completion_cache_misses_total": stats["misses"],
+        "completion_cache_entries": stats["entries"],
+        "completion_cache_bytes": stats["bytes"],
+    }
+
+
+metrics.register_collector("completion_cache", _collect_metrics)
@@ -1,36 +1,158 @@
 """
 Конфигурация: секреты из .env, остальные настройки — здесь.
 В .env хранятся только BOT_TOKEN и OPENAI_API_KEY.
+.env читается при первом обращении к секрету (config.BOT_TOKEN, from config import ...),
+а не при импорте: команды, которым ключи не нужны, его не загружают.
 """
 import os
 from pathlib import Path
-
-from dotenv import load_dotenv
+from typing import Any
 
 env_path = Path(__file__).resolve().parent / ".env"
-load_dotenv(dotenv_path=env_path)
 
-# ---------- Из .env (только токены/ключи) ----------
-BOT_TOKEN: str = os.getenv("BOT_TOKEN", "")
-OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
+# ---------- Из .env (только токены/ключи; значения — через __getattr__ ниже) ----------
+BOT_TOKEN: str
+OPENAI_API_KEY: str
+WEBHOOK_SECRET: str  # необязательно: проверка заголовка X-Telegram-Bot-Api-Secret-Token
 
 # ---------- Настройки в config (редактировать здесь) ----------
 OPENAI_MODEL: str = "gpt-4o-mini"
 OPENAI_TEMPERATURE: float = 0.2  # 0.0–2.0: выше — случайнее, ниже — предсказуемее
 OPENAI_MAX_TOKENS: int = 1024  # макс. токенов в ответе модели (None = по умолчанию API)
 OPENAI_SYSTEM_MESSAGE: str = ""  # необязательный system prompt (пусто = не отправляем)
-MAX_CONTEXT_MESSAGES: int = 20
+OPENAI_BASE_URL: str | None = None  # None = api.openai.com (или переменная окружения OPENAI_BASE_URL)
+OPENAI_RPM_LIMIT: int = 0  # запросов в минуту (0 = без ограничения; лимит аккаунта — на странице Limits)
+OPENAI_TPM_LIMIT: int = 0  # токенов в минуту: оценка промпт + max_tokens, уточняется по usage (0 = без ограничения)
+OPENAI_MAX_IN_FLIGHT: int = 32  # одновременных запросов; остальные ждут в очереди (0 = без ограничения)
+OPENAI_MAX_RETRIES: int = 4  # повторов при 429/5xx/сетевых ошибках
+OPENAI_RETRY_BASE_SECONDS: float = 0.5  # задержка повтора: случайная от 0 до base * 2^попытка...
+OPENAI_RETRY_MAX_SECONDS: float = 30.0  # ...но не больше этого (Retry-After сервера учитывается)
+MODEL_CAPABILITIES_PATH: str | None = None  # например "logs/model_capabilities.json" — помнить неподдерживаемые параметры между запусками
+MAX_CONTEXT_MESSAGES: int = 20  # сообщений в истории одного пользователя (обрезка при записи)
+MAX_CONTEXT_USERS: int = 10_000  # пользователей с контекстом в памяти (сверх — вытесняются давно неактивные)
+CONTEXT_MAX_BYTES: int = 256 * 1024 * 1024  # общий лимит памяти под контексты
+CONTEXT_IDLE_TTL_SECONDS: int = 24 * 60 * 60  # контекст неактивного пользователя удаляется (0 = не удалять)
+CONTEXT_MODE: str = "messages"  # "messages" — по числу сообщений, "tokens" — по бюджету токенов
+CONTEXT_TOKEN_BUDGET: int = 3000  # токенов истории в запросе (режим "tokens")
+CONTEXT_MODEL_WINDOW: int = 128_000  # окно контекста модели; история + OPENAI_MAX_TOKENS в него укладываются
+CONTEXT_TOKENS_MAX_MESSAGES: int = 200  # жёсткий предел сообщений на пользователя в режиме "tokens"
+CONTEXT_PREFIX_STEP: int = 0  # история в запросе — с сообщения с номером, кратным шагу (чётное, напр. 10): начало запроса не меняется несколько ходов и идёт из кэша промптов (0 = выкл.)
+CONTEXT_SUMMARY_ENABLED: bool = False  # сворачивать старые сообщения длинного диалога в краткое содержание
+CONTEXT_SUMMARY_MODEL: str = "gpt-4o-mini"  # модель для сжатия (можно дешевле основной)
+CONTEXT_SUMMARY_TRIGGER_MESSAGES: int = 16  # сжимать, когда в истории столько сообщений (меньше MAX_CONTEXT_MESSAGES)...
+CONTEXT_SUMMARY_TRIGGER_TOKENS: int = 0  # ...или столько токенов (0 = не учитывать)
+CONTEXT_SUMMARY_KEEP_MESSAGES: int = 6  # последних сообщений остаются дословно
+CONTEXT_SUMMARY_MAX_TOKENS: int = 300  # длина краткого содержания
+CONTEXT_SUMMARY_RETRY_SECONDS: float = 60.0  # после ошибки сжатия следующая попытка для пользователя — не раньше, чем через столько секунд (удваивается при повторных ошибках)...
+CONTEXT_SUMMARY_RETRY_MAX_SECONDS: float = 3600.0  # ...но не дольше этого
+CONTEXT_SUMMARY_SHUTDOWN_TIMEOUT_SECONDS: float = 30.0  # при остановке бота/CLI незавершённые сжатия ждём не дольше
+CONTEXT_BACKEND: str = "memory"  # "memory" — только в памяти, "sqlite" — ещё и на диске (переживает перезапуск)
+CONTEXT_SQLITE_PATH: str | None = None  # None = logs/context.sqlite3
+CONTEXT_SQLITE_WAL: bool = True  # режим WAL: чтение не ждёт записи, несколько процессов на одном файле
+CONTEXT_FLUSH_BATCH_SIZE: int = 500  # контекст пишется на диск в фоне пачками по столько операций...
+CONTEXT_FLUSH_INTERVAL_SECONDS: float = 1.0  # ...или не реже чем раз в столько секунд
+TOKENIZER: str = "approx"  # "approx" — офлайн-оценка, "tiktoken" — если установлен
+
+BOT_MAX_CONCURRENT_MESSAGES: int = 64  # сообщений в обработке одновременно (разные пользователи); 0 = без ограничения
+BOT_MODE: str = "polling"  # "polling" — long polling, "webhook" — aiohttp-сервер (python main.py --webhook)
+WEBHOOK_URL: str | None = None  # публичный https-адрес, например "https://bot.example.com/webhook"; None = setWebhook не вызывается
+WEBHOOK_HOST: str = "0.0.0.0"
+WEBHOOK_PORT: int = 8080
+WEBHOOK_PATH: str = "/webhook"
+WEBHOOK_WORKERS: int = 128  # апдейтов в обработке одновременно (фоновые задачи; при --workers N — в каждом процессе)
+WEBHOOK_QUEUE_SIZE: int = 1000  # принятых, но ещё не разобранных апдейтов; при полной очереди — 503, Telegram повторит
+WEBHOOK_ENQUEUE_TIMEOUT_SECONDS: float = 1.0  # сколько запрос ждёт места в полной очереди
+WEBHOOK_DRAIN_TIMEOUT_SECONDS: float = 30.0  # при остановке: сколько дорабатывать очередь и начатые ответы
+WEBHOOK_MAX_CONNECTIONS: int = 40  # setWebhook: одновременных соединений от Telegram (1–100)
+BOT_WORKERS: int = 1  # процессов-обработчиков (python main.py --workers N): пользователи делятся между ними по user_id
+BOT_WORKER_QUEUE_SIZE: int = 1000  # апдейтов в очереди к одному процессу; при переполнении — 503 (webhook) или пауза getUpdates
+TELEGRAM_API_URL: str | None = None  # свой сервер Bot API, например "http://127.0.0.1:8081"; None = api.telegram.org
+TELEGRAM_MESSAGE_LIMIT: int = 4096  # символов в сообщении Telegram; длинный ответ делится на части (блоки кода не разрываются)
+TELEGRAM_GLOBAL_RATE_PER_SECOND: float = 30.0  # сообщений и правок в секунду на бота, во все чаты (лимит Telegram ~30)
+TELEGRAM_CHAT_RATE_PER_MINUTE: float = 60.0  # в один личный чат: ~1 в секунду...
+TELEGRAM_GROUP_RATE_PER_MINUTE: float = 20.0  # ...в группу — 20 в минуту
+TELEGRAM_CHAT_BURST: int = 3  # сообщений в чат подряд без паузы (части длинного ответа)
+TELEGRAM_SEND_MAX_RETRIES: int = 3  # повторов отправки после 429 от Telegram (с паузой retry_after)
+STREAM_RESPONSES: bool = True  # показывать ответ по мере генерации (бот — правками сообщения, CLI — печатью)
+STREAM_EDIT_INTERVAL_SECONDS: float = 1.0  # не чаще одной правки сообщения в чате за столько секунд
+STREAM_EDIT_MIN_CHARS: int = 40  # и не меньше стольких новых символов за правку
+COMPLETION_CACHE_ENABLED: bool = False  # кэшировать ответы на одинаковые запросы (model, messages, temperature, max_tokens)
+COMPLETION_CACHE_TTL_SECONDS: int = 60 * 60
+COMPLETION_CACHE_MAX_ENTRIES: int = 1000  # записей в памяти (LRU)
+COMPLETION_CACHE_MAX_BYTES: int = 16 * 1024 * 1024  # байт текста ответов в памяти
+COMPLETION_CACHE_DISK_PATH: str | None = None  # например "logs/completion_cache.sqlite3" (None = только память)
+COMPLETION_CACHE_DISK_MAX_BYTES: int = 256 * 1024 * 1024
+OPENAI_COALESCE_REQUESTS: bool = False  # одинаковые одновременные запросы к модели (например, один промпт ДЗ от многих) — одним запросом; все получат один и тот же ответ даже при temperature > 0
+OPENAI_ROUTING_ENABLED: bool = False  # выбирать модель по типу задачи и длине промпта (OPENAI_ROUTES) вместо одной OPENAI_MODEL
+# Модели маршрутов в порядке предпочтения: короткий ход диалога, длинный промпт, ответы ДЗ в JSON
+OPENAI_ROUTES: dict[str, tuple[str, ...]] = {
+    "chat": ("gpt-4.1-nano", "gpt-4o-mini"),
+    "chat_long": ("gpt-4o-mini", "gpt-4.1-mini"),
+    "homework": ("gpt-4.1-mini", "gpt-4o-mini"),
+}
+OPENAI_ROUTE_SMALL_PROMPT_TOKENS: int = 1000  # ход диалога с промптом до стольких токенов — маршрут "chat", длиннее — "chat_long"
+OPENAI_ROUTE_STATS_WINDOW_SECONDS: float = 300.0  # статистика моделей (время ответа, ошибки) — за последние столько секунд
+OPENAI_ROUTE_MIN_SAMPLES: int = 20  # до стольких замеров модель считается здоровой, а хеджирование ждёт OPENAI_HEDGE_DELAY_SECONDS
+OPENAI_ROUTE_MAX_ERROR_RATE: float = 0.2  # доля ошибок 429/5xx, при которой модель обходится (берётся следующая в маршруте)
+OPENAI_ROUTE_MAX_P95_SECONDS: float = 0.0  # p95 времени ответа, при котором модель обходится (0 = не учитывать)
+OPENAI_HEDGE_ENABLED: bool = False  # нет ответа дольше p95 модели — запасной запрос (бот, не потоковые ответы); первый ответ берётся, второй запрос отменяется
+OPENAI_HEDGE_DELAY_SECONDS: float = 5.0  # задержка запасного запроса, пока у модели мало замеров
+OPENAI_HEDGE_MIN_DELAY_SECONDS: float = 0.2  # но не раньше чем через столько секунд
+OPENAI_HEDGE_MAX_SHARE: float = 0.1  # запасных запросов — не больше этой доли (каждый может стоить токенов)
+PROMPTS_RELOAD_CHECK_SECONDS: float = 1.0  # как часто проверять, изменился ли prompts.json
+STRUCTURED_OUTPUT_MAX_RETRIES: int = 1  # повторных запросов на прогон ДЗ, если JSON не удалось исправить локально
+STRUCTURED_OUTPUT_RETRY_BUDGET: float = 0.1  # повторов — не больше этой доли прогонов ДЗ (платные перезапуски)
+USAGE_LOG_FORMAT: str = "csv"  # "csv" (logs/usage.csv), "jsonl" или "sqlite"
+USAGE_FLUSH_BATCH_SIZE: int = 100  # usage пишется на диск пачками по столько записей...
+USAGE_FLUSH_INTERVAL_SECONDS: float = 2.0  # ...или не реже чем раз в столько секунд
+USAGE_SUMMARY_PATH: str | None = None  # сводка usage для отчётов (cli.py usage-report --compact); None = logs/usage_summary.sqlite3
+# Цены моделей для отчёта по usage, $ за 1M токенов: (вход, выход[, вход из кэша промптов]);
+# ищется самый длинный совпадающий префикс имени
+MODEL_PRICES_PER_1M_TOKENS: dict[str, tuple[float, ...]] = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+METRICS_ENABLED: bool = False  # собирать метрики пути запроса (длительность этапов, счётчики)
+METRICS_PORT: int | None = None  # например 9108 — отдавать метрики Prometheus на http://0.0.0.0:PORT/metrics
+METRICS_JSON_PATH: str | None = None  # например "logs/metrics.json" — периодический JSON-снимок метрик
+METRICS_DUMP_INTERVAL_SECONDS: float = 60.0  # как часто перезаписывать JSON-снимок
+METRICS_PREFIX: str = "gpt_bot_"  # префикс имён метрик Prometheus
+
+
+_SECRETS = ("BOT_TOKEN", "OPENAI_API_KEY", "WEBHOOK_SECRET")
+_env_loaded = False
+
+
+def load_env() -> None:
+    """Читает .env в переменные окружения (один раз; уже заданные переменные не перезаписываются)."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv(dotenv_path=env_path)
+        _env_loaded = True
+
+
+def __getattr__(name: str) -> Any:
+    if name in _SECRETS:
+        load_env()
+        return os.getenv(name, "")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def validate_config() -> None:
     """Проверяет наличие обязательных переменных для Telegram-бота."""
-    if not BOT_TOKEN:
+    if not __getattr__("BOT_TOKEN"):
         raise ValueError("BOT_TOKEN не задан в .env")
-    if not OPENAI_API_KEY:
+    if not __getattr__("OPENAI_API_KEY"):
         raise ValueError("OPENAI_API_KEY не задан в .env")
 
 
 def validate_config_openai() -> None:
     """Проверяет наличие OpenAI API ключа (для CLI и др.)."""
-    if not OPENAI_API_KEY:
+    if not __getattr__("OPENAI_API_KEY"):
         raise ValueError("OPENAI_API_KEY не задан в .env")
@@ -1,34 +1,533 @@
 """
 Управление контекстом диалога пользователей (хранение в оперативной памяти).
+
+У каждого пользователя — кольцевой буфер (deque) на MAX_CONTEXT_MESSAGES сообщений:
+обрезка происходит при записи, а не при чтении. Пользователи хранятся в порядке
+последнего обращения (LRU); простаивающие дольше CONTEXT_IDLE_TTL_SECONDS и
+вытесняемые по лимитам MAX_CONTEXT_USERS / CONTEXT_MAX_BYTES удаляются.
+
+В режиме CONTEXT_MODE = "tokens" история ограничивается бюджетом токенов:
+число токенов считается один раз при записи и хранится рядом с сообщением.
+С CONTEXT_PREFIX_STEP начало истории в запросе выравнивается по номеру сообщения:
+запрос несколько ходов подряд начинается одинаково, и провайдер берёт этот префикс
+из кэша промптов (дешевле и быстрее).
+
+При CONTEXT_SUMMARY_ENABLED старые сообщения длинного диалога сворачиваются в краткое
+содержание: сжатие запускается в фоновом потоке (отдельный запрос к CONTEXT_SUMMARY_MODEL),
+ответ пользователю его не ждёт; результат применяется при следующем обращении к контексту.
+В запрос уходят краткое содержание (system) + последние сообщения.
+
+Память — рабочая копия; постоянное хранение задаётся CONTEXT_BACKEND (context_store):
+при "sqlite" новые сообщения пишутся на диск в фоне, а история пользователя, которого
+нет в памяти (перезапуск, вытеснение), подгружается при первом обращении.
 """
 import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from itertools import islice
 from typing import Any
 
+from config import (
+    CONTEXT_IDLE_TTL_SECONDS,
+    CONTEXT_MAX_BYTES,
+    CONTEXT_MODE,
+    CONTEXT_MODEL_WINDOW,
+    CONTEXT_PREFIX_STEP,
+    CONTEXT_SUMMARY_ENABLED,
+    CONTEXT_SUMMARY_KEEP_MESSAGES,
+    CONTEXT_SUMMARY_MAX_TOKENS,
+    CONTEXT_SUMMARY_MODEL,
+    CONTEXT_SUMMARY_RETRY_MAX_SECONDS,
+    CONTEXT_SUMMARY_RETRY_SECONDS,
+    CONTEXT_SUMMARY_TRIGGER_MESSAGES,
+    CONTEXT_SUMMARY_TRIGGER_TOKENS,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_TOKENS_MAX_MESSAGES,
+    MAX_CONTEXT_MESSAGES,
+    MAX_CONTEXT_USERS,
+    OPENAI_MAX_TOKENS,
+)
+import metrics
+from context_store import make_context_backend
+from token_counter import count_message_tokens, count_tokens
+
 logger = logging.getLogger(__name__)
 
-# user_id -> list of {"role": "user"|"assistant", "content": str}
-_context: dict[int, list[dict[str, Any]]] = {}
 
+class _UserContext:
+    """История одного пользователя: кольцевой буфер сообщений, их токены и учёт памяти."""
+
+    __slots__ = (
+        "messages", "tokens", "token_total", "nbytes", "last_access",
+        "appended", "summary", "summary_tokens", "folded_tokens", "compacting",
+        "summary_failures", "compact_after",
+    )
+
+    def __init__(self, max_messages: int) -> None:
+        # {"role": "user"|"assistant", "content": str}
+        self.messages: deque[dict[str, Any]] = deque(maxlen=max_messages)
+        # tokens[i] — закэшированное число токенов messages[i]
+        self.tokens: deque[int] = deque(maxlen=max_messages)
+        self.token_total = 0
+        self.nbytes = 0
+        self.last_access = time.monotonic()
+        # Сколько сообщений добавлено за всё время: номер самого старого в буфере = appended - len(messages)
+        self.appended = 0
+        # Краткое содержание свёрнутых сообщений и его токены; токены всех свёрнутых сообщений
+        self.summary: str | None = None
+        self.summary_tokens = 0
+        self.folded_tokens = 0
+        self.compacting = False
+        # Ошибки сжатия подряд и время (monotonic), раньше которого новую попытку не начинать
+        self.summary_failures = 0
+        self.compact_after = 0.0
+
+    def popleft(self) -> int:
+        """Удаляет самое старое сообщение, возвращает освобождённые байты."""
+        dropped = self.messages.popleft()
+        self.token_total -= self.tokens.popleft()
+        size = _message_size(dropped)
+        self.nbytes -= size
+        return size
+
+
+class ContextView(Sequence):
+    """
+    Представление контекста пользователя только для чтения — без копирования истории.
+    Использовать сразу после get_context (до следующего append_messages/clear_context).
+    """
+
+    __slots__ = ("_messages",)
 
-def get_context(user_id: int) -> list[dict[str, Any]]:
-    """Возвращает список сообщений контекста для пользователя."""
-    return _context.get(user_id, []).copy()
+    def __init__(self, messages: deque[dict[str, Any]] | tuple[()] = ()) -> None:
+        self._messages = messages
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return iter(self._messages)
+
+    def __getitem__(self, index: int | slice) -> Any:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._messages))
+            return list(islice(self._messages, start, stop, step))
+        return self._messages[index]
+
+    def __repr__(self) -> str:
+        return f"ContextView({list(self._messages)!r})"
+
+
+# user_id -> _UserContext, от давно не использованных к недавним
+_context: OrderedDict[int, _UserContext] = OrderedDict()
+_total_bytes = 0
+_evicted_users = 0
+_backend: Any = None
+
+
+def get_context_backend() -> Any:
+    """Хранилище контекста процесса (создаётся при первом обращении по CONTEXT_BACKEND)."""
+    global _backend
+    if _backend is None:
+        _backend = make_context_backend()
+    return _backend
+
+
+def configure_context_backend(kind: str, path: Any = None, **kwargs: Any) -> Any:
+    """
+    Заменяет хранилище (например, для бенчмарков). Предыдущее дописывается и закрывается,
+    контексты в памяти сбрасываются — как при перезапуске процесса.
+    """
+    global _backend, _total_bytes
+    if _backend is not None:
+        _backend.close()
+    _context.clear()
+    _total_bytes = 0
+    _backend = make_context_backend(kind, path, **kwargs)
+    return _backend
+
+
+def close_context_backend() -> None:
+    """Дописывает отложенные изменения контекста на диск (при остановке бота)."""
+    if _backend is not None:
+        _backend.close()
+
+
+def _message_size(message: dict[str, Any]) -> int:
+    """Оценка памяти, занятой сообщением (строка content + сам dict)."""
+    return sys.getsizeof(message.get("content") or "") + sys.getsizeof(message)
+
+
+def context_token_budget() -> int:
+    """
+    Бюджет токенов на историю: не больше CONTEXT_TOKEN_BUDGET и не больше
+    окна модели за вычетом места под ответ (OPENAI_MAX_TOKENS).
+    """
+    return max(0, min(CONTEXT_TOKEN_BUDGET, CONTEXT_MODEL_WINDOW - max(OPENAI_MAX_TOKENS, 0)))
+
+
+def _new_entry(user_id: int) -> _UserContext:
+    max_messages = CONTEXT_TOKENS_MAX_MESSAGES if CONTEXT_MODE == "tokens" else MAX_CONTEXT_MESSAGES
+    _context[user_id] = _UserContext(max_messages)
+    return _context[user_id]
+
+
+def _add_message(entry: _UserContext, message: dict[str, Any]) -> None:
+    """Дописывает сообщение в буфер (вытесняя самое старое при заполнении) и учитывает память."""
+    global _total_bytes
+    if len(entry.messages) == entry.messages.maxlen:
+        _total_bytes -= entry.popleft()
+    size = _message_size(message)
+    tokens = count_message_tokens(message)
+    entry.messages.append(message)
+    entry.tokens.append(tokens)
+    entry.token_total += tokens
+    entry.nbytes += size
+    entry.appended += 1
+    _total_bytes += size
+
+
+def _get_entry(user_id: int) -> _UserContext | None:
+    """Контекст из памяти; если его там нет — подгружается из хранилища (или None)."""
+    if _finished_summaries:
+        _apply_summaries()
+    entry = _context.get(user_id)
+    if entry is not None:
+        _context.move_to_end(user_id)
+    else:
+        backend = get_context_backend()
+        stored = backend.load(user_id)
+        summary = backend.load_summary(user_id)
+        if not stored and summary is None:
+            return None
+        entry = _new_entry(user_id)
+        if summary is not None:
+            _restore_summary(entry, summary)
+        for message in stored or ():
+            _add_message(entry, message)
+        logger.debug("Контекст загружен из хранилища для user_id=%s, сообщений: %s", user_id, len(entry.messages))
+        _evict(keep_user_id=user_id)
+    entry.last_access = time.monotonic()
+    return entry
+
+
+def _drop_user(user_id: int) -> None:
+    global _total_bytes
+    entry = _context.pop(user_id)
+    _total_bytes -= entry.nbytes
+
+
+def _evict(keep_user_id: int) -> None:
+    """Удаляет простаивающих пользователей (TTL) и вытесняет LRU при превышении лимитов."""
+    global _evicted_users
+    if CONTEXT_IDLE_TTL_SECONDS > 0:
+        deadline = time.monotonic() - CONTEXT_IDLE_TTL_SECONDS
+        while _context:
+            user_id, entry = next(iter(_context.items()))
+            if entry.last_access >= deadline or user_id == keep_user_id:
+                break
+            _drop_user(user_id)
+            _evicted_users += 1
+    while len(_context) > 1 and (
+        len(_context) > MAX_CONTEXT_USERS or _total_bytes > CONTEXT_MAX_BYTES
+    ):
+        user_id = next(iter(_context))
+        if user_id == keep_user_id:
+            break
+        _drop_user(user_id)
+        _evicted_users += 1
+        logger.debug("Контекст вытеснен для user_id=%s", user_id)
+
+
+def get_context(user_id: int) -> ContextView:
+    """Возвращает сообщения контекста пользователя (представление без копирования)."""
+    entry = _get_entry(user_id)
+    if entry is None:
+        return ContextView()
+    return ContextView(entry.messages)
 
 
 def append_messages(user_id: int, user_message: dict[str, Any], assistant_message: dict[str, Any]) -> None:
     """
     Добавляет пару сообщений (пользователь + ответ бота) в контекст и обрезает по лимиту.
     """
-    if user_id not in _context:
-        _context[user_id] = []
-    _context[user_id].append(user_message)
-    _context[user_id].append(assistant_message)
-    # Обрезка по MAX_CONTEXT_MESSAGES делается в bot при подготовке messages
-    logger.debug("Контекст обновлён для user_id=%s, сообщений: %s", user_id, len(_context[user_id]))
+    global _total_bytes
+    entry = _get_entry(user_id) or _new_entry(user_id)
+
+    for message in (user_message, assistant_message):
+        _add_message(entry, message)
+    # На диск — в фоне (для хранилища "memory" ничего не делает)
+    get_context_backend().append(user_id, [user_message, assistant_message])
+    if CONTEXT_SUMMARY_ENABLED:
+        _maybe_compact(user_id, entry)
+
+    if CONTEXT_MODE == "tokens":
+        budget = context_token_budget()
+        while entry.messages and entry.token_total > budget:
+            _total_bytes -= entry.popleft()
+
+    _evict(keep_user_id=user_id)
+    logger.debug("Контекст обновлён для user_id=%s, сообщений: %s", user_id, len(entry.messages))
+
+
+def select_context(user_id: int, reserved_tokens: int = 0) -> list[dict[str, Any]]:
+    """
+    Сообщения истории для запроса к модели.
+    В режиме "messages" — весь буфер (уже обрезан по MAX_CONTEXT_MESSAGES).
+    В режиме "tokens" — самые свежие сообщения, которые помещаются в бюджет
+    за вычетом reserved_tokens (новое сообщение, system prompt); токены не пересчитываются.
+    Если часть диалога свёрнута, первым идёт system-сообщение с кратким содержанием.
+    """
+    with metrics.timer("context_fetch"):
+        entry = _get_entry(user_id)
+    if entry is None:
+        return []
+    with metrics.timer("context_trim"):
+        return _select(entry, reserved_tokens)
+
+
+def _select(entry: _UserContext, reserved_tokens: int) -> list[dict[str, Any]]:
+    head: list[dict[str, Any]] = []
+    if entry.summary:
+        head = [_summary_message(entry.summary)]
+        reserved_tokens += entry.summary_tokens
+        _summary_stats["turns_with_summary"] += 1
+        _summary_stats["tokens_saved"] += max(0, entry.folded_tokens - entry.summary_tokens)
+    if CONTEXT_MODE != "tokens":
+        start = 0
+    else:
+        budget = context_token_budget() - reserved_tokens
+        used = 0
+        keep = 0
+        for tokens in reversed(entry.tokens):
+            if used + tokens > budget:
+                break
+            used += tokens
+            keep += 1
+        start = len(entry.messages) - keep
+    if CONTEXT_PREFIX_STEP > 1:
+        start = _aligned_start(entry, start)
+    if not start:
+        return [*head, *entry.messages]
+    selected = list(islice(entry.messages, start, None))
+    # История не должна начинаться с ответа ассистента без вопроса
+    if selected and selected[0].get("role") == "assistant":
+        selected = selected[1:]
+    return [*head, *selected]
+
+
+def _aligned_start(entry: _UserContext, start: int) -> int:
+    """
+    Сдвигает начало истории вперёд до сообщения с номером (за всё время), кратным
+    CONTEXT_PREFIX_STEP. Обычная обрезка сдвигает начало на каждом ходу, и префикс
+    запроса у провайдера не совпадает с прошлым; выровненное начало стоит на месте
+    CONTEXT_PREFIX_STEP / 2 ходов. Если после выравнивания ничего не остаётся — start.
+    """
+    oldest = entry.appended - len(entry.messages)
+    aligned = -(-(oldest + start) // CONTEXT_PREFIX_STEP) * CONTEXT_PREFIX_STEP - oldest
+    return aligned if aligned < len(entry.messages) else start
 
 
 def clear_context(user_id: int) -> None:
-    """Очищает контекст для указанного пользователя."""
+    """Очищает контекст для указанного пользователя (в памяти и в хранилище)."""
     if user_id in _context:
-        del _context[user_id]
-        logger.info("Контекст очищен для user_id=%s", user_id)
+        _drop_user(user_id)
+    get_context_backend().clear(user_id)
+    logger.info("Контекст очищен для user_id=%s", user_id)
+
+
+def get_stats() -> dict[str, int]:
+    """
+    Статистика хранилища: пользователей в памяти, сообщений, токенов, байт, вытеснено пользователей;
+    сжатие диалогов: сжатий, ошибок, свёрнуто сообщений, токенов в запросах к модели сжатия,
+    ходов с кратким содержанием и сэкономлено токенов промпта (оценка: свёрнутые минус краткое содержание).
+    """
+    return {
+        "users": len(_context),
+        "messages": sum(len(entry.messages) for entry in _context.values()),
+        "tokens": sum(entry.token_total for entry in _context.values()),
+        "bytes": _total_bytes,
+        "evicted_users": _evicted_users,
+        **_summary_stats,
+    }
+
+
+def _collect_metrics() -> dict[str, float]:
+    """Дешёвые показатели для экспорта метрик (get_stats проходит по всем пользователям)."""
+    backend_stats = get_context_backend().stats()
+    return {
+        "context_users": len(_context),
+        "context_bytes": _total_bytes,
+        "context_evicted_users_total": _evicted_users,
+        "context_compactions_total": _summary_stats["compactions"],
+        "context_backend_pending": backend_stats.get("pending", 0),
+    }
+
+
+metrics.register_collector("context", _collect_metrics)
+
+
+# ---------- Сжатие длинных диалогов ----------
+
+SUMMARY_PREFIX = "Краткое содержание предыдущей части диалога:\n"
+SUMMARY_INSTRUCTIONS = (
+    "Сожми диалог пользователя с ассистентом в краткое содержание на русском языке. "
+    "Сохрани факты о пользователе, его цели, договорённости и открытые вопросы; "
+    "без вступлений, не больше {words} слов."
+)
+
+# (user_id, entry, номер сообщения, до которого свёрнуто, краткое содержание или None при ошибке,
+#  токены свёрнутого, usage запроса сжатия)
+_finished_summaries: deque[tuple[int, _UserContext, int, str | None, int, dict[str, int]]] = deque()
+_summary_executor: ThreadPoolExecutor | None = None
+_summary_futures: set[Future] = set()
+_summary_futures_lock = threading.Lock()
+_summary_stats = {
+    "compactions": 0,
+    "compaction_errors": 0,
+    "messages_folded": 0,
+    "summary_prompt_tokens": 0,
+    "summary_completion_tokens": 0,
+    "turns_with_summary": 0,
+    "tokens_saved": 0,
+}
+
+
+def _summary_message(summary: str) -> dict[str, Any]:
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+
+def _default_summarizer(previous: str | None, messages: list[dict[str, Any]]) -> tuple[str, dict[str, int]]:
+    """Краткое содержание через Chat Completions (CONTEXT_SUMMARY_MODEL)."""
+    from openai_client import chat_completion
+
+    lines = [f"Ранее: {previous}"] if previous else []
+    for message in messages:
+        who = "Пользователь" if message.get("role") == "user" else "Ассистент"
+        lines.append(f"{who}: {message.get('content') or ''}")
+    return chat_completion(
+        [{"role": "user", "content": "\n".join(lines)}],
+        model=CONTEXT_SUMMARY_MODEL,
+        max_tokens=CONTEXT_SUMMARY_MAX_TOKENS,
+        system_message=SUMMARY_INSTRUCTIONS.format(words=max(30, CONTEXT_SUMMARY_MAX_TOKENS // 2)),
+        use_cache=False,
+    )
+
+
+_summarizer: Callable[[str | None, list[dict[str, Any]]], tuple[str, dict[str, int]]] = _default_summarizer
+
+
+def configure_summarizer(
+    summarizer: Callable[[str | None, list[dict[str, Any]]], tuple[str, dict[str, int]]] | None = None,
+) -> None:
+    """
+    Подменяет функцию сжатия (previous_summary, messages) -> (summary, usage) —
+    например, заглушкой в бенчмарках; None — снова запрос к модели.
+    """
+    global _summarizer
+    _summarizer = summarizer or _default_summarizer
+
+
+def _needs_compaction(entry: _UserContext) -> bool:
+    if entry.compacting or len(entry.messages) <= CONTEXT_SUMMARY_KEEP_MESSAGES:
+        return False
+    if entry.compact_after > time.monotonic():
+        return False  # недавно не удалось — не платим за повтор на каждом ходу
+    if CONTEXT_SUMMARY_TRIGGER_MESSAGES > 0 and len(entry.messages) >= CONTEXT_SUMMARY_TRIGGER_MESSAGES:
+        return True
+    return CONTEXT_SUMMARY_TRIGGER_TOKENS > 0 and entry.token_total >= CONTEXT_SUMMARY_TRIGGER_TOKENS
+
+
+def _maybe_compact(user_id: int, entry: _UserContext) -> None:
+    """Запускает фоновое сжатие старых сообщений, если история переросла порог."""
+    global _summary_executor
+    if not _needs_compaction(entry):
+        return
+    # Дословно остаются последние KEEP сообщений (чётное число — целые пары вопрос/ответ)
+    keep = CONTEXT_SUMMARY_KEEP_MESSAGES + CONTEXT_SUMMARY_KEEP_MESSAGES % 2
+    fold = len(entry.messages) - keep
+    folded = list(islice(entry.messages, 0, fold))
+    fold_end = entry.appended - len(entry.messages) + fold
+    entry.compacting = True
+    if _summary_executor is None:
+        _summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="context-summary")
+    future = _summary_executor.submit(_compact, user_id, entry, entry.summary, folded, fold_end)
+    with _summary_futures_lock:
+        _summary_futures.add(future)
+    future.add_done_callback(_forget_future)
+
+
+def _forget_future(future: Future) -> None:
+    with _summary_futures_lock:
+        _summary_futures.discard(future)
+
+
+def _compact(
+    user_id: int, entry: _UserContext, previous: str | None, folded: list[dict[str, Any]], fold_end: int
+) -> None:
+    """Фоновый поток: только запрос к модели; контекст меняется в _apply_summaries."""
+    try:
+        summary, usage = _summarizer(previous, folded)
+    except Exception as e:
+        logger.warning("Не удалось сжать контекст user_id=%s: %s", user_id, e)
+        _finished_summaries.append((user_id, entry, fold_end, None, 0, {}))
+        return
+    folded_tokens = sum(count_message_tokens(m) for m in folded)
+    _finished_summaries.append((user_id, entry, fold_end, summary.strip() or None, folded_tokens, usage))
+
+
+def _apply_summaries() -> None:
+    """Применяет готовые краткие содержания (в потоке, который работает с контекстом)."""
+    global _total_bytes
+    while _finished_summaries:
+        user_id, entry, fold_end, summary, folded_tokens, usage = _finished_summaries.popleft()
+        entry.compacting = False
+        _summary_stats["summary_prompt_tokens"] += usage.get("prompt_tokens", 0)
+        _summary_stats["summary_completion_tokens"] += usage.get("completion_tokens", 0)
+        if summary is None:
+            _summary_stats["compaction_errors"] += 1
+            entry.summary_failures += 1
+            backoff = CONTEXT_SUMMARY_RETRY_SECONDS * 2 ** (entry.summary_failures - 1)
+            entry.compact_after = time.monotonic() + min(backoff, CONTEXT_SUMMARY_RETRY_MAX_SECONDS)
+            continue
+        entry.summary_failures = 0
+        entry.compact_after = 0.0
+        if _context.get(user_id) is not entry:
+            continue  # контекст очищен или вытеснен, пока шло сжатие
+        dropped = 0
+        while entry.messages and entry.appended - len(entry.messages) < fold_end:
+            _total_bytes -= entry.popleft()
+            dropped += 1
+        entry.summary = summary
+        entry.summary_tokens = count_tokens(summary) + count_message_tokens(_summary_message(""))
+        entry.folded_tokens += folded_tokens
+        _summary_stats["compactions"] += 1
+        _summary_stats["messages_folded"] += dropped
+        # Несвёрнутые — сообщения после fold_end (в том числе уже вытесненные из буфера)
+        get_context_backend().save_summary(user_id, summary, entry.folded_tokens, entry.appended - fold_end)
+        logger.debug("Контекст user_id=%s сжат: свёрнуто %s сообщений", user_id, dropped)
+
+
+def _restore_summary(entry: _UserContext, stored: dict[str, Any]) -> None:
+    """Краткое содержание из хранилища (свёрнутые сообщения хранилище уже не возвращает)."""
+    entry.summary = stored.get("summary") or None
+    entry.summary_tokens = count_tokens(entry.summary or "") + count_message_tokens(_summary_message(""))
+    entry.folded_tokens = int(stored.get("folded_tokens") or 0)
+
+
+def wait_for_summaries(timeout: float | None = None) -> None:
+    """
+    Дожидается фоновых сжатий (не дольше timeout секунд) и применяет их —
+    при остановке бота и CLI до закрытия хранилища, в тестах и бенчмарках.
+    """
+    with _summary_futures_lock:
+        pending = list(_summary_futures)
+    if pending:
+        _, not_done = wait(pending, timeout=timeout)
+        if not_done:
+            logger.warning("Не дождались сжатия контекста: %s запросов ещё выполняются", len(not_done))
+    _apply_summaries()
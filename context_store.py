@@ -0,0 +1,303 @@
+"""
+Хранилища контекста диалогов для context_manager (CONTEXT_BACKEND в config).
+
+- "memory" — только оперативная память процесса (как раньше): перезапуск стирает диалоги.
+- "sqlite" — история дублируется в SQLite (по желанию в режиме WAL). Запись отложенная:
+  append() лишь ставит операцию в очередь, фоновый поток пишет пачками одной транзакцией,
+  поэтому ответ пользователю не ждёт диска. load() читает историю пользователя при первом
+  обращении к нему (после перезапуска или вытеснения из памяти); если для него в очереди
+  есть незаписанные операции, очередь сначала дописывается.
+
+На диске у пользователя хранится не больше keep_messages последних сообщений. Краткое содержание
+свёрнутой части диалога (context_manager, CONTEXT_SUMMARY_*) хранится отдельно — по строке
+на пользователя в context_summaries вместе с границей свёртки (id последнего свёрнутого
+сообщения): обрезка хвоста его не удаляет, а load() не возвращает свёрнутые сообщения.
+"""
+import atexit
+import json
+import logging
+import sqlite3
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any
+
+from config import (
+    CONTEXT_BACKEND,
+    CONTEXT_FLUSH_BATCH_SIZE,
+    CONTEXT_FLUSH_INTERVAL_SECONDS,
+    CONTEXT_MODE,
+    CONTEXT_SQLITE_PATH,
+    CONTEXT_SQLITE_WAL,
+    CONTEXT_TOKENS_MAX_MESSAGES,
+    MAX_CONTEXT_MESSAGES,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryContextBackend:
+    """Без постоянного хранения: загружать нечего, запись — no-op."""
+
+    name = "memory"
+
+    def load(self, user_id: int) -> list[dict[str, Any]] | None:
+        return None
+
+    def append(self, user_id: int, messages: list[dict[str, Any]]) -> None:
+        pass
+
+    def load_summary(self, user_id: int) -> dict[str, Any] | None:
+        return None
+
+    def save_summary(self, user_id: int, summary: str, folded_tokens: int, kept: int) -> None:
+        pass
+
+    def clear(self, user_id: int) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": self.name}
+
+
+class SqliteContextBackend:
+    """SQLite с отложенной записью: очередь операций и фоновый поток, как у usage-лога."""
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path: Path,
+        keep_messages: int,
+        wal: bool = CONTEXT_SQLITE_WAL,
+        batch_size: int = CONTEXT_FLUSH_BATCH_SIZE,
+        flush_interval: float = CONTEXT_FLUSH_INTERVAL_SECONDS,
+    ) -> None:
+        self.path = path
+        self.keep_messages = max(1, keep_messages)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._writer = self._connect(wal)
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS context_messages ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, message TEXT NOT NULL)"
+        )
+        self._writer.execute("CREATE INDEX IF NOT EXISTS ix_context_user ON context_messages(user_id, id)")
+        # folded_until — id последнего свёрнутого сообщения: сообщения до него включительно не загружаются
+        self._writer.execute(
+            "CREATE TABLE IF NOT EXISTS context_summaries ("
+            "user_id INTEGER PRIMARY KEY, summary TEXT NOT NULL, "
+            "folded_tokens INTEGER NOT NULL, folded_until INTEGER NOT NULL)"
+        )
+        self._writer.commit()
+        # Чтение — отдельным соединением: в WAL не ждёт транзакций потока записи
+        self._reader = self._connect(wal)
+        self._read_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # ("append", user_id, [сообщения]) | ("summary", user_id, {...}) | ("clear", user_id, None)
+        self._queue: deque[tuple[str, int, Any]] = deque()
+        self._pending: dict[int, int] = {}
+        self._pending_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.loads = 0
+        self.ops_written = 0
+        self.batches_written = 0
+        self._thread = threading.Thread(target=self._worker, name="context-writer", daemon=True)
+        self._thread.start()
+
+    def _connect(self, wal: bool) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        if wal:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    # ---------- Очередь записи ----------
+
+    def _enqueue(self, op: str, user_id: int, payload: Any) -> None:
+        with self._pending_lock:
+            self._pending[user_id] = self._pending.get(user_id, 0) + 1
+        self._queue.append((op, user_id, payload))
+        if len(self._queue) >= self.batch_size:
+            with self._cond:
+                self._cond.notify()
+
+    def append(self, user_id: int, messages: list[dict[str, Any]]) -> None:
+        """Ставит сообщения в очередь записи. Диск не трогает."""
+        self._enqueue("append", user_id, messages)
+
+    def save_summary(self, user_id: int, summary: str, folded_tokens: int, kept: int) -> None:
+        """
+        Ставит в очередь краткое содержание. kept — сколько последних сообщений пользователя
+        (к этому моменту уже поставленных в очередь) не свёрнуто; остальные свёрнуты.
+        """
+        self._enqueue("summary", user_id, {"summary": summary, "folded_tokens": folded_tokens, "kept": kept})
+
+    def clear(self, user_id: int) -> None:
+        self._enqueue("clear", user_id, None)
+
+    def pending(self) -> int:
+        """Операций в очереди, ещё не записанных на диск."""
+        return len(self._queue)
+
+    def _write_batch(self, batch: list[tuple[str, int, Any]]) -> None:
+        touched: set[int] = set()
+        with self._writer:
+            for op, user_id, payload in batch:
+                if op == "clear":
+                    self._writer.execute("DELETE FROM context_messages WHERE user_id = ?", (user_id,))
+                    self._writer.execute("DELETE FROM context_summaries WHERE user_id = ?", (user_id,))
+                    touched.discard(user_id)
+                    continue
+                if op == "summary":
+                    self._write_summary(user_id, payload)
+                    continue
+                self._writer.executemany(
+                    "INSERT INTO context_messages (user_id, message) VALUES (?, ?)",
+                    ((user_id, json.dumps(m, ensure_ascii=False)) for m in payload or ()),
+                )
+                touched.add(user_id)
+            # Храним только хвост истории, который может понадобиться
+            for user_id in touched:
+                self._writer.execute(
+                    "DELETE FROM context_messages WHERE user_id = ? AND id < ("
+                    "SELECT MIN(id) FROM (SELECT id FROM context_messages WHERE user_id = ? "
+                    "ORDER BY id DESC LIMIT ?))",
+                    (user_id, user_id, self.keep_messages),
+                )
+
+    def _write_summary(self, user_id: int, summary: dict[str, Any]) -> None:
+        """Краткое содержание и граница свёртки; свёрнутые сообщения больше не нужны."""
+        row = self._writer.execute(
+            "SELECT id FROM context_messages WHERE user_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+            (user_id, summary["kept"]),
+        ).fetchone()
+        if row is None:
+            # Свёрнутых сообщений на диске уже нет (обрезаны) — граница прежняя
+            previous = self._writer.execute(
+                "SELECT folded_until FROM context_summaries WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            folded_until = previous[0] if previous else 0
+        else:
+            folded_until = row[0]
+        self._writer.execute(
+            "INSERT OR REPLACE INTO context_summaries (user_id, summary, folded_tokens, folded_until) "
+            "VALUES (?, ?, ?, ?)",
+            (user_id, summary["summary"], summary["folded_tokens"], folded_until),
+        )
+        self._writer.execute(
+            "DELETE FROM context_messages WHERE user_id = ? AND id <= ?", (user_id, folded_until)
+        )
+
+    def _drain(self) -> None:
+        with self._write_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    batch.append(self._queue.popleft())
+                try:
+                    self._write_batch(batch)
+                    self.ops_written += len(batch)
+                    self.batches_written += 1
+                except sqlite3.Error as e:
+                    logger.warning("Не удалось записать контекст (%s операций): %s", len(batch), e, exc_info=True)
+                with self._pending_lock:
+                    for _, user_id, _ in batch:
+                        left = self._pending.get(user_id, 0) - 1
+                        if left > 0:
+                            self._pending[user_id] = left
+                        else:
+                            self._pending.pop(user_id, None)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self._drain()
+            if closed:
+                return
+
+    def flush(self) -> None:
+        """Синхронно дописывает очередь на диск."""
+        self._drain()
+
+    # ---------- Чтение ----------
+
+    def load(self, user_id: int) -> list[dict[str, Any]] | None:
+        """Последние keep_messages несвёрнутых сообщений пользователя или None, если их нет."""
+        if user_id in self._pending:
+            self._drain()
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT message FROM context_messages WHERE user_id = ? AND id > COALESCE("
+                "(SELECT folded_until FROM context_summaries WHERE user_id = ?), 0) "
+                "ORDER BY id DESC LIMIT ?",
+                (user_id, user_id, self.keep_messages),
+            ).fetchall()
+        self.loads += 1
+        if not rows:
+            return None
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def load_summary(self, user_id: int) -> dict[str, Any] | None:
+        """{"summary", "folded_tokens"} пользователя или None, если диалог не сжимался."""
+        if user_id in self._pending:
+            self._drain()
+        with self._read_lock:
+            row = self._reader.execute(
+                "SELECT summary, folded_tokens FROM context_summaries WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"summary": row[0], "folded_tokens": row[1]}
+
+    def close(self) -> None:
+        """Останавливает поток записи, дописывает очередь и закрывает соединения."""
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        self._drain()
+        with self._write_lock:
+            self._writer.close()
+        with self._read_lock:
+            self._reader.close()
+        logger.info("Хранилище контекста закрыто, записано операций: %s", self.ops_written)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": self.name,
+            "pending": self.pending(),
+            "loads": self.loads,
+            "ops_written": self.ops_written,
+            "batches_written": self.batches_written,
+        }
+
+
+def default_keep_messages() -> int:
+    """Сколько сообщений пользователя имеет смысл хранить (тот же предел, что и в памяти)."""
+    return CONTEXT_TOKENS_MAX_MESSAGES if CONTEXT_MODE == "tokens" else MAX_CONTEXT_MESSAGES
+
+
+def make_context_backend(kind: str = CONTEXT_BACKEND, path: Path | None = None, **kwargs: Any) -> Any:
+    """Создаёт хранилище по имени ("memory" / "sqlite")."""
+    if kind == "memory":
+        return MemoryContextBackend()
+    if kind == "sqlite":
+        path = path or (Path(CONTEXT_SQLITE_PATH) if CONTEXT_SQLITE_PATH else Path.cwd() / "logs" / "context.sqlite3")
+        backend = SqliteContextBackend(path, kwargs.pop("keep_messages", default_keep_messages()), **kwargs)
+        atexit.register(backend.close)
+        return backend
+    raise ValueError(f"Неизвестное хранилище контекста: {kind!r} (ожидается memory или sqlite)")
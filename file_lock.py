@@ -0,0 +1,32 @@
+"""
+Эксклюзивная блокировка файла между процессами: дописывание логов (usage, результаты ДЗ)
+из нескольких процессов-обработчиков (python main.py --workers N) без перемешивания строк.
+"""
+import os
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import IO, Any
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+@contextmanager
+def file_lock(f: IO[Any]) -> Iterator[None]:
+    """Эксклюзивная блокировка файла между процессами."""
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
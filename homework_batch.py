@@ -0,0 +1,95 @@
+"""
+Пакетный прогон промптов ДЗ: каждый промпт × N запусков с ограниченной параллельностью.
+Результаты сохраняются в хранилище ДЗ (logs/homework_results.jsonl) по мере готовности,
+в конце — сводка по каждому промпту: доля валидного JSON, доля исправленных локально
+и повторов запроса (structured_output), перцентили токенов и задержки.
+
+Запуск: python cli.py batch --prompts 1,2 --samples 50 --concurrency 8
+Офлайн: OPENAI_BASE_URL=http://127.0.0.1:8765/v1 (заглушка python -m benchmarks.fake_openai_server).
+"""
+import asyncio
+import logging
+import time
+from typing import Any
+
+from openai_client import async_run_homework_prompt, close_async_client
+from percentiles import summarize
+
+logger = logging.getLogger(__name__)
+
+
+async def _run_one(prompt_id: int, semaphore: asyncio.Semaphore) -> dict[str, Any]:
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            out = await async_run_homework_prompt(prompt_id, use_cache=False)
+        except Exception as e:
+            logger.warning("Запуск промпта #%s завершился ошибкой: %s", prompt_id, e)
+            return {"prompt_id": prompt_id, "ok": False, "error": str(e), "latency": time.perf_counter() - start}
+        return {
+            "prompt_id": prompt_id,
+            "ok": True,
+            "parsed": out.get("parsed", False),
+            "repaired": bool(out.get("repairs")),
+            "retries": out.get("retries", 0),
+            "usage": out.get("usage", {}),
+            "latency": time.perf_counter() - start,
+        }
+
+
+def summarize_runs(runs: list[dict[str, Any]]) -> dict[int, dict[str, Any]]:
+    """Сводка по промптам: запуски, ошибки, доля валидного JSON и исправленных, повторы, перцентили."""
+    report: dict[int, dict[str, Any]] = {}
+    by_prompt: dict[int, list[dict[str, Any]]] = {}
+    for run in runs:
+        by_prompt.setdefault(run["prompt_id"], []).append(run)
+    for prompt_id, items in sorted(by_prompt.items()):
+        ok = [r for r in items if r["ok"]]
+        parsed = sum(1 for r in ok if r["parsed"])
+        report[prompt_id] = {
+            "runs": len(items),
+            "errors": len(items) - len(ok),
+            "json_ok_rate": parsed / len(ok) if ok else 0.0,
+            "repaired_rate": sum(1 for r in ok if r["repaired"]) / len(ok) if ok else 0.0,
+            "retries": sum(r["retries"] for r in ok),
+            "latency_s": summarize(r["latency"] for r in ok),
+            "prompt_tokens": summarize(r["usage"].get("prompt_tokens", 0) for r in ok),
+            "completion_tokens": summarize(r["usage"].get("completion_tokens", 0) for r in ok),
+            "total_tokens": summarize(r["usage"].get("total_tokens", 0) for r in ok),
+        }
+    return report
+
+
+async def run_batch(prompt_ids: list[int], samples: int, concurrency: int) -> dict[int, dict[str, Any]]:
+    """Запускает каждый промпт samples раз, не больше concurrency запросов одновременно."""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    tasks = [_run_one(prompt_id, semaphore) for prompt_id in prompt_ids for _ in range(samples)]
+    runs: list[dict[str, Any]] = []
+    try:
+        for done, future in enumerate(asyncio.as_completed(tasks), start=1):
+            runs.append(await future)
+            if done % max(1, len(tasks) // 10) == 0:
+                logger.info("Готово %s/%s", done, len(tasks))
+    finally:
+        await close_async_client()
+    return summarize_runs(runs)
+
+
+def format_report(report: dict[int, dict[str, Any]]) -> str:
+    """Текстовая таблица сводки для вывода в терминал."""
+    lines = [
+        f"{'промпт':>6} | {'запусков':>8} | {'ошибок':>6} | {'JSON ок':>7} | {'исправлено':>10} | {'повторов':>8} | "
+        f"{'задержка p50/p95/p99, с':>24} | {'токены всего p50/p95/p99':>24} | {'выход p50/p95':>13}"
+    ]
+    for prompt_id, r in report.items():
+        lat = r["latency_s"]
+        tot = r["total_tokens"]
+        comp = r["completion_tokens"]
+        lines.append(
+            f"{prompt_id:>6} | {r['runs']:>8} | {r['errors']:>6} | {r['json_ok_rate']:>6.0%} | "
+            f"{r['repaired_rate']:>9.0%} | {r['retries']:>8} | "
+            f"{lat['p50']:>7.2f} /{lat['p95']:>6.2f} /{lat['p99']:>6.2f} | "
+            f"{tot['p50']:>7.0f} /{tot['p95']:>6.0f} /{tot['p99']:>6.0f} | "
+            f"{comp['p50']:>5.0f} /{comp['p95']:>5.0f}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,198 @@
+"""
+Хранилище результатов ДЗ: append-only JSONL (logs/homework_results.jsonl).
+
+Каждый запуск — одна строка, дописываемая одним write() под блокировкой
+(потоки — threading.Lock, процессы — блокировка файла), поэтому стоимость
+сохранения не зависит от объёма истории и параллельные запуски не теряют данные.
+Старый logs/homework_results.json (JSON-список) переносится при первом обращении;
+load_results()/export_json() отдают данные в прежнем формате списка.
+Поиск по prompt_id и datetime идёт по индексу смещений строк в памяти.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import IO, Any
+
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+RESULTS_FILENAME = "homework_results.jsonl"
+LEGACY_FILENAME = "homework_results.json"
+
+
+class HomeworkResultsStore:
+    """Append-only JSONL с индексом смещений по prompt_id и datetime."""
+
+    def __init__(self, path: Path, legacy_path: Path | None = None) -> None:
+        self.path = path
+        self.legacy_path = legacy_path
+        self._lock = threading.Lock()
+        self._file: IO[bytes] | None = None
+        self._migrated = False
+        # Индекс: смещения строк, отсортированные по datetime (строки "%Y-%m-%d %H:%M:%S")
+        self._indexed_size = 0
+        self._by_datetime: list[tuple[str, int]] = []
+        self._by_prompt: dict[Any, list[tuple[str, int]]] = {}
+
+    # ---------- Запись ----------
+
+    def _open(self) -> IO[bytes]:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._migrate_legacy()
+            self._file = open(self.path, "ab")
+        return self._file
+
+    def append(self, entry: dict[str, Any]) -> None:
+        """Дописывает одну запись (одна строка JSON, атомарно относительно других писателей)."""
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            f = self._open()
+            with file_lock(f):
+                f.write(data)
+                f.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _migrate_legacy(self) -> None:
+        """Переносит записи из старого homework_results.json (список) в JSONL один раз."""
+        if self._migrated:
+            return
+        self._migrated = True
+        legacy = self.legacy_path
+        if legacy is None or not legacy.exists() or self.path.exists():
+            return
+        # Процессы-обработчики (--workers N) переносят одновременно: переносит первый, остальные
+        # под блокировкой видят готовый JSONL
+        with open(self.path.with_suffix(".jsonl.lock"), "a", encoding="utf-8") as lock, file_lock(lock):
+            if legacy.exists() and not self.path.exists():
+                self._move_legacy(legacy)
+
+    def _move_legacy(self, legacy: Path) -> None:
+        try:
+            with open(legacy, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Не удалось прочитать %s для переноса: %s", legacy, e)
+            return
+        tmp = self.path.with_suffix(".jsonl.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(tmp, self.path)
+        legacy.rename(legacy.with_suffix(".json.bak"))
+        logger.info("Результаты ДЗ перенесены: %s -> %s (%s записей)", legacy, self.path, len(entries))
+
+    # ---------- Чтение ----------
+
+    def _refresh_index(self) -> None:
+        """Дочитывает в индекс строки, добавленные после прошлого обращения (в т.ч. другими процессами)."""
+        if not self.path.exists():
+            return
+        touched: set[Any] = set()
+        with open(self.path, "rb") as f:
+            f.seek(self._indexed_size)
+            offset = self._indexed_size
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # строка ещё дописывается
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Повреждённая строка в %s (смещение %s) пропущена", self.path, offset)
+                else:
+                    key = (str(entry.get("datetime", "")), offset)
+                    self._by_datetime.append(key)
+                    self._by_prompt.setdefault(entry.get("prompt_id"), []).append(key)
+                    touched.add(entry.get("prompt_id"))
+                offset += len(line)
+            self._indexed_size = offset
+        if touched:
+            # Строки почти всегда идут по возрастанию datetime — timsort это почти O(n)
+            self._by_datetime.sort()
+            for prompt_id in touched:
+                self._by_prompt[prompt_id].sort()
+
+    def _read_at(self, f: IO[bytes], offset: int) -> dict[str, Any]:
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def find(
+        self,
+        prompt_id: Any = None,
+        since: str | None = None,
+        until: str | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Записи по prompt_id (None — все) в интервале datetime [since, until]
+        (строки "%Y-%m-%d %H:%M:%S", можно префикс — например "2025-01-31").
+        """
+        with self._lock:
+            if self._file is None:
+                self._migrate_legacy()
+            self._refresh_index()
+            keys = self._by_datetime if prompt_id is None else self._by_prompt.get(prompt_id, [])
+            lo = bisect.bisect_left(keys, (since, -1)) if since else 0
+            hi = bisect.bisect_right(keys, (until + "\uffff", -1)) if until else len(keys)
+            offsets = [offset for _, offset in keys[lo:hi]]
+        if not offsets:
+            return []
+        with open(self.path, "rb") as f:
+            return [self._read_at(f, offset) for offset in offsets]
+
+    def load_results(self) -> list[dict[str, Any]]:
+        """Все записи в порядке добавления — как прежний список из homework_results.json."""
+        with self._lock:
+            if self._file is None:
+                self._migrate_legacy()
+        if not self.path.exists():
+            return []
+        results = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.endswith("\n"):
+                    try:
+                        results.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+        return results
+
+    def export_json(self, path: Path) -> int:
+        """Выгружает все записи в файл прежнего формата (JSON-список, indent=2). Возвращает число записей."""
+        results = self.load_results()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        return len(results)
+
+
+_store: HomeworkResultsStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_results_store() -> HomeworkResultsStore:
+    """Общее хранилище результатов ДЗ процесса (logs/ в текущей папке)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                logs_dir = Path.cwd() / "logs"
+                _store = HomeworkResultsStore(logs_dir / RESULTS_FILENAME, logs_dir / LEGACY_FILENAME)
+    return _store
+
+
+def configure_results_store(path: Path, legacy_path: Path | None = None) -> HomeworkResultsStore:
+    """Заменяет общее хранилище (другой путь — для бенчмарков и отдельных прогонов)."""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+        _store = HomeworkResultsStore(path, legacy_path)
+    return _store
@@ -1,9 +1,63 @@
 """
 Точка входа: запуск Telegram-бота.
+Режим — BOT_MODE в config ("polling" или "webhook"), можно переопределить флагом:
+  python main.py --webhook
+  python main.py --polling
+Несколько процессов-обработчиков (BOT_WORKERS, пользователи делятся между ними по user_id):
+  python main.py --workers 4
+Отчёт о времени запуска (импорты, этапы): python main.py --profile-startup [--webhook]
+Конфиг проверяется до импорта aiogram и SDK openai: без BOT_TOKEN бот завершается сразу.
 """
+import argparse
 import asyncio
+import sys
+
+from config import BOT_MODE, BOT_WORKERS, validate_config
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Telegram-бот с OpenAI")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--webhook", dest="mode", action="store_const", const="webhook", help="aiohttp-сервер для webhook")
+    mode.add_argument("--polling", dest="mode", action="store_const", const="polling", help="long polling")
+    parser.add_argument(
+        "--workers", type=int, default=BOT_WORKERS,
+        help="процессов-обработчиков (по умолчанию BOT_WORKERS; 1 — всё в одном процессе)",
+    )
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="не запускать бота, а показать время запуска: этапы и самые долгие импорты",
+    )
+    return parser.parse_args(argv)
+
+
+def run(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    args = parse_args(argv)
+    if args.profile_startup:
+        from startup_profile import print_report
+
+        print_report("main", [a for a in argv if a != "--profile-startup"])
+        return
+    mode_name = args.mode or BOT_MODE
+    try:
+        validate_config()
+    except ValueError as e:
+        raise SystemExit(f"Ошибка конфигурации: {e}")
+
+    if args.workers > 1:
+        from shards import run_sharded
+
+        run_sharded(mode_name, args.workers)
+    elif mode_name == "webhook":
+        from webhook import run_webhook
+
+        run_webhook()
+    else:
+        from bot import main
+
+        asyncio.run(main())
 
-from bot import main
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()
@@ -0,0 +1,256 @@
+"""
+Метрики пути запроса: длительность этапов (контекст, OpenAI, usage-лог, Telegram),
+счётчики (токены, ошибки) и показатели, которые снимаются с модулей в момент экспорта
+(пользователи в памяти, запросы в полёте, повторы, попадания в кэш).
+
+Включается METRICS_ENABLED. Выключенные метрики почти ничего не стоят: timer()
+возвращает общий пустой контекстный менеджер, inc()/observe() сразу выходят.
+Экспорт: HTTP в формате Prometheus (METRICS_PORT, GET /metrics) и/или периодический
+JSON-снимок (METRICS_JSON_PATH раз в METRICS_DUMP_INTERVAL_SECONDS).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+from config import (
+    METRICS_DUMP_INTERVAL_SECONDS,
+    METRICS_ENABLED,
+    METRICS_JSON_PATH,
+    METRICS_PORT,
+    METRICS_PREFIX,
+)
+from percentiles import summarize
+
+logger = logging.getLogger(__name__)
+
+PREFIX = METRICS_PREFIX
+# Границы корзин гистограмм длительности, секунды
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_SAMPLES = 1024
+
+
+class _Histogram:
+    """Корзины для Prometheus + последние значения для перцентилей в JSON."""
+
+    __slots__ = ("counts", "total", "count", "recent")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.recent: deque[float] = deque(maxlen=_SAMPLES)
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+        self.recent.append(value)
+
+
+class _NoopTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopTimer":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        return False
+
+
+class _Timer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> bool:
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+_NOOP = _NoopTimer()
+_enabled = METRICS_ENABLED
+_lock = threading.Lock()
+_stages: dict[str, _Histogram] = {}
+_counters: dict[str, float] = {}
+# имя -> функция, возвращающая {метрика: значение} в момент экспорта
+_collectors: dict[str, Callable[[], dict[str, float]]] = {}
+_started_at = time.time()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def configure_metrics(enabled: bool) -> None:
+    """Включает/выключает сбор (например, в бенчмарках); накопленное сбрасывается."""
+    global _enabled
+    with _lock:
+        _enabled = enabled
+        _stages.clear()
+        _counters.clear()
+
+
+def timer(stage: str) -> _Timer | _NoopTimer:
+    """with metrics.timer("openai_call"): ... — длительность этапа."""
+    return _Timer(stage) if _enabled else _NOOP
+
+
+def observe(stage: str, seconds: float) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        hist = _stages.get(stage)
+        if hist is None:
+            hist = _stages[stage] = _Histogram()
+        hist.observe(seconds)
+
+
+def inc(name: str, value: float = 1) -> None:
+    """Увеличивает счётчик (имя без префикса и суффикса _total)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def register_collector(name: str, collect: Callable[[], dict[str, float]]) -> None:
+    """Показатели, которые модуль уже считает сам: снимаются только при экспорте."""
+    _collectors[name] = collect
+
+
+def _collected() -> dict[str, float]:
+    values: dict[str, float] = {}
+    for name, collect in list(_collectors.items()):
+        try:
+            values.update(collect())
+        except Exception as e:
+            logger.debug("Сборщик метрик %s не сработал: %s", name, e)
+    return values
+
+
+def snapshot() -> dict[str, Any]:
+    """Все метрики одним словарём (для JSON-снимка и отладки)."""
+    with _lock:
+        stages = {
+            stage: {"count": h.count, "sum_s": h.total, **summarize(h.recent)}
+            for stage, h in sorted(_stages.items())
+        }
+        counters = dict(sorted(_counters.items()))
+    return {
+        "timestamp": time.time(),
+        "uptime_s": time.time() - _started_at,
+        "stages": stages,
+        "counters": counters,
+        "gauges": _collected(),
+    }
+
+
+def render_prometheus() -> str:
+    """Текстовый формат Prometheus 0.0.4."""
+    lines: list[str] = []
+    with _lock:
+        if _stages:
+            name = f"{PREFIX}stage_duration_seconds"
+            lines.append(f"# HELP {name} Длительность этапов обработки запроса")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, h in sorted(_stages.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {h.total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+        for counter, value in sorted(_counters.items()):
+            lines.append(f"# TYPE {PREFIX}{counter}_total counter")
+            lines.append(f"{PREFIX}{counter}_total {value:g}")
+    for gauge, value in sorted(_collected().items()):
+        kind = "counter" if gauge.endswith("_total") else "gauge"
+        lines.append(f"# TYPE {PREFIX}{gauge} {kind}")
+        lines.append(f"{PREFIX}{gauge} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- Экспорт ----------
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def do_GET(self) -> None:  # noqa: N802
+        if self.path.rstrip("/") not in ("/metrics", ""):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_http_server(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """GET /metrics в фоновом потоке."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Метрики Prometheus: http://%s:%s/metrics", host, server.server_address[1])
+    return server
+
+
+def dump_json(path: Path) -> None:
+    """Атомарно записывает снимок метрик в JSON."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def start_json_dump(path: Path, interval: float) -> threading.Thread:
+    """Раз в interval секунд пишет снимок метрик в path."""
+
+    def loop() -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                dump_json(path)
+            except OSError as e:
+                logger.warning("Не удалось записать метрики в %s: %s", path, e)
+
+    thread = threading.Thread(target=loop, name="metrics-json", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_exporters(shard: int | None = None) -> None:
+    """
+    Запускает экспорт по настройкам config (если метрики включены).
+    shard — номер процесса-обработчика (main.py --workers N): порт METRICS_PORT + 1 + shard,
+    JSON-снимок в <имя>.shard<N>.json; процесс-маршрутизатор экспортирует на METRICS_PORT.
+    """
+    if not _enabled:
+        return
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT if shard is None else METRICS_PORT + 1 + shard)
+    if METRICS_JSON_PATH:
+        path = Path(METRICS_JSON_PATH)
+        if shard is not None:
+            path = path.with_name(f"{path.stem}.shard{shard}{path.suffix}")
+        start_json_dump(path, METRICS_DUMP_INTERVAL_SECONDS)
@@ -0,0 +1,119 @@
+"""
+Кэш возможностей моделей: какие параметры запроса (сейчас — temperature) модель
+не принимает. Выясняется один раз неудачным запросом, дальше запрос сразу строится
+без параметра — без лишнего обращения к API и двойной задержки.
+
+Хранится в памяти процесса; при заданном MODEL_CAPABILITIES_PATH — ещё и в JSON-файле,
+чтобы не пробовать заново после перезапуска. Счётчики — в stats().
+"""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+from config import MODEL_CAPABILITIES_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class ModelCapabilities:
+    """model -> {параметр: поддерживается ли}. Неизвестная модель считается поддерживающей параметр."""
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._known: dict[str, dict[str, bool]] = {}
+        # hits — ответ взят из кэша, misses — модель ещё не проверена (запрос станет пробой)
+        self.probe_hits = 0
+        self.probe_misses = 0
+        self.unsupported_found = 0
+        if path is not None:
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Не удалось прочитать %s: %s", self.path, e)
+            return
+        self._known = {
+            str(model): {str(k): bool(v) for k, v in params.items()}
+            for model, params in data.items()
+            if isinstance(params, dict)
+        }
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._known, f, ensure_ascii=False, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning("Не удалось сохранить %s: %s", self.path, e)
+
+    def supports(self, model: str, param: str) -> bool:
+        """Отправлять ли параметр этой модели (True, пока не выяснено обратное)."""
+        with self._lock:
+            known = self._known.get(model, {}).get(param)
+            if known is None:
+                self.probe_misses += 1
+                return True
+            self.probe_hits += 1
+            return known
+
+    def _mark(self, model: str, param: str, supported: bool) -> None:
+        with self._lock:
+            params = self._known.setdefault(model, {})
+            if params.get(param) == supported:
+                return
+            params[param] = supported
+            if not supported:
+                self.unsupported_found += 1
+            self._save()
+
+    def mark_supported(self, model: str, param: str) -> None:
+        self._mark(model, param, True)
+
+    def mark_unsupported(self, model: str, param: str) -> None:
+        logger.info("Модель %s не поддерживает %s — запомнено", model, param)
+        self._mark(model, param, False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._known.clear()
+            self._save()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "probe_hits": self.probe_hits,
+                "probe_misses": self.probe_misses,
+                "unsupported_found": self.unsupported_found,
+                "models": {model: dict(params) for model, params in self._known.items()},
+            }
+
+
+_capabilities: ModelCapabilities | None = None
+
+
+def get_model_capabilities() -> ModelCapabilities:
+    """Общий кэш возможностей моделей процесса."""
+    global _capabilities
+    if _capabilities is None:
+        _capabilities = ModelCapabilities(Path(MODEL_CAPABILITIES_PATH) if MODEL_CAPABILITIES_PATH else None)
+    return _capabilities
+
+
+def configure_model_capabilities(path: Path | None = None) -> ModelCapabilities:
+    """Заменяет общий кэш (другой файл или только память) — например, для бенчмарков."""
+    global _capabilities
+    _capabilities = ModelCapabilities(path)
+    return _capabilities
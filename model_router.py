@@ -0,0 +1,285 @@
+"""
+Выбор модели для запроса и статистика моделей для хеджирования.
+
+Маршрут — по типу задачи и оценке длины промпта: "chat" (короткий ход диалога),
+"chat_long" (промпт длиннее OPENAI_ROUTE_SMALL_PROMPT_TOKENS) и "homework" (ответ в JSON).
+У маршрута — модели в порядке предпочтения (OPENAI_ROUTES); берётся первая «здоровая»:
+доля ошибок и p95 времени ответа за последние OPENAI_ROUTE_STATS_WINDOW_SECONDS
+в пределах порогов. Если здоровых нет — модель с наименьшей долей ошибок.
+Старые замеры выпадают из окна, и модель, которую обходили, через время снова пробуется.
+
+Хеджирование (OPENAI_HEDGE_ENABLED): если ответа нет дольше p95 модели, уходит запасной
+запрос к той же модели, если ответ — ошибка 429/5xx — к следующей модели маршрута;
+используется первый ответ, второй запрос отменяется. Запасных — не больше
+OPENAI_HEDGE_MAX_SHARE от запросов.
+
+В статистику идут все запросы: время ответа с повторами планировщика (у потоковых — время
+до первого куска ответа), ошибки — только 429/5xx/сетевые (ошибка запроса, например 400, — не вина модели).
+Отменённый запрос не учитывается, кроме основного, проигравшего запасному: он учитывается
+временем до отмены (иначе самые медленные ответы выпадали бы из p95).
+"""
+import threading
+import time
+from collections import deque
+from types import TracebackType
+from typing import Any
+
+from config import (
+    OPENAI_HEDGE_DELAY_SECONDS,
+    OPENAI_HEDGE_MAX_SHARE,
+    OPENAI_HEDGE_MIN_DELAY_SECONDS,
+    OPENAI_MODEL,
+    OPENAI_ROUTE_MAX_ERROR_RATE,
+    OPENAI_ROUTE_MAX_P95_SECONDS,
+    OPENAI_ROUTE_MIN_SAMPLES,
+    OPENAI_ROUTE_SMALL_PROMPT_TOKENS,
+    OPENAI_ROUTE_STATS_WINDOW_SECONDS,
+    OPENAI_ROUTES,
+    OPENAI_ROUTING_ENABLED,
+)
+import metrics
+from percentiles import percentile
+
+_MAX_SAMPLES = 1000  # замеров на модель в окне
+_HEDGE_BUDGET_FLOOR = 1  # запасных запросов сверх доли (первые запросы)
+
+
+class ModelStats:
+    """Замеры одной модели за окно: (время, секунды, ошибка ли)."""
+
+    __slots__ = ("samples", "requests", "errors")
+
+    def __init__(self) -> None:
+        self.samples: deque[tuple[float, float, bool]] = deque(maxlen=_MAX_SAMPLES)
+        self.requests = 0
+        self.errors = 0
+
+    def trim(self, oldest: float) -> None:
+        while self.samples and self.samples[0][0] < oldest:
+            self.samples.popleft()
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, _, error in self.samples if error) / len(self.samples)
+
+    def latencies(self) -> list[float]:
+        return sorted(seconds for _, seconds, error in self.samples if not error)
+
+
+class _Tracker:
+    """with router.track(model): ... — замер запроса к модели."""
+
+    __slots__ = ("router", "model", "started")
+
+    def __init__(self, router: "ModelRouter", model: str) -> None:
+        self.router = router
+        self.model = model
+        self.started = 0.0
+
+    def __enter__(self) -> "_Tracker":
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(
+        self, exc_type: type[BaseException] | None, exc: BaseException | None, tb: TracebackType | None
+    ) -> bool:
+        elapsed = time.monotonic() - self.started
+        if exc is None:
+            self.router.observe(self.model, elapsed, error=False)
+        elif isinstance(exc, Exception) and _is_model_error(exc):
+            self.router.observe(self.model, elapsed, error=True)
+        return False
+
+
+def _is_model_error(error: Exception) -> bool:
+    from request_scheduler import is_retryable
+
+    return is_retryable(error)
+
+
+class ModelRouter:
+    """
+    choose(task, prompt_tokens) -> (маршрут, модель); hedge_model / hedge_delay / allow_hedge —
+    для запасного запроса. Статистика по моделям — stats().
+    """
+
+    def __init__(
+        self,
+        routes: dict[str, tuple[str, ...]] = OPENAI_ROUTES,
+        small_prompt_tokens: int = OPENAI_ROUTE_SMALL_PROMPT_TOKENS,
+        window_seconds: float = OPENAI_ROUTE_STATS_WINDOW_SECONDS,
+        min_samples: int = OPENAI_ROUTE_MIN_SAMPLES,
+        max_error_rate: float = OPENAI_ROUTE_MAX_ERROR_RATE,
+        max_p95: float = OPENAI_ROUTE_MAX_P95_SECONDS,
+        hedge_delay: float = OPENAI_HEDGE_DELAY_SECONDS,
+        hedge_min_delay: float = OPENAI_HEDGE_MIN_DELAY_SECONDS,
+        hedge_max_share: float = OPENAI_HEDGE_MAX_SHARE,
+    ) -> None:
+        self.routes = {name: tuple(models) for name, models in routes.items()}
+        self.small_prompt_tokens = small_prompt_tokens
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_p95 = max_p95
+        self.hedge_delay_default = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_share = hedge_max_share
+        self._lock = threading.Lock()
+        self._models: dict[str, ModelStats] = {}
+        self.routed: dict[str, int] = {}
+        self.fallbacks = 0
+        self.hedge_candidates = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.hedges_denied = 0
+
+    def _stats(self, model: str) -> ModelStats:
+        stats = self._models.get(model)
+        if stats is None:
+            stats = self._models[model] = ModelStats()
+        stats.trim(time.monotonic() - self.window_seconds)
+        return stats
+
+    def _healthy(self, stats: ModelStats) -> bool:
+        if len(stats.samples) < self.min_samples:
+            return True
+        if stats.error_rate() > self.max_error_rate:
+            return False
+        if self.max_p95 > 0:
+            latencies = stats.latencies()
+            if len(latencies) >= self.min_samples and percentile(latencies, 95) > self.max_p95:
+                return False
+        return True
+
+    def route_for(self, task: str, prompt_tokens: int) -> str:
+        if task == "chat" and prompt_tokens > self.small_prompt_tokens:
+            return "chat_long"
+        return task
+
+    def choose(self, task: str, prompt_tokens: int) -> tuple[str, str]:
+        """Маршрут и модель для запроса (первая здоровая модель маршрута)."""
+        route = self.route_for(task, prompt_tokens)
+        candidates = self.routes.get(route) or (OPENAI_MODEL,)
+        with self._lock:
+            stats = [(model, self._stats(model)) for model in candidates]
+            model = next((m for m, s in stats if self._healthy(s)), None)
+            if model is None:
+                model = min(stats, key=lambda item: item[1].error_rate())[0]
+            if model != candidates[0]:
+                self.fallbacks += 1
+            self.routed[model] = self.routed.get(model, 0) + 1
+        return route, model
+
+    def hedge_model(self, route: str | None, model: str, failed: bool) -> str:
+        """
+        Модель для запасного запроса. Медленный ответ здоровой модели — обычно случайный хвост,
+        запасной идёт к ней же; после ошибки или если модель нездорова — к следующей здоровой
+        в маршруте (если такой нет — к той же).
+        """
+        with self._lock:
+            if not failed and self._healthy(self._stats(model)):
+                return model
+            for other in self.routes.get(route) or ():
+                if other != model and self._healthy(self._stats(other)):
+                    return other
+        return model
+
+    def hedge_delay(self, model: str) -> float:
+        """Через сколько секунд без ответа отправлять запасной запрос: p95 модели за окно."""
+        with self._lock:
+            latencies = self._stats(model).latencies()
+        if len(latencies) < self.min_samples:
+            return self.hedge_delay_default
+        return max(self.hedge_min_delay, percentile(latencies, 95))
+
+    def allow_hedge(self) -> bool:
+        """Списывает запасной запрос из бюджета (доля от запросов, которые можно было хеджировать)."""
+        with self._lock:
+            if self.hedges >= self.hedge_max_share * self.hedge_candidates + _HEDGE_BUDGET_FLOOR:
+                self.hedges_denied += 1
+                return False
+            self.hedges += 1
+        return True
+
+    def count_hedge_candidate(self) -> None:
+        with self._lock:
+            self.hedge_candidates += 1
+
+    def count_hedge_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def track(self, model: str) -> _Tracker:
+        return _Tracker(self, model)
+
+    def observe(self, model: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            stats = self._stats(model)
+            stats.samples.append((time.monotonic(), seconds, error))
+            stats.requests += 1
+            stats.errors += error
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            models = {}
+            for model in sorted(self._models):
+                stats = self._stats(model)
+                latencies = stats.latencies()
+                models[model] = {
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "window_samples": len(stats.samples),
+                    "error_rate": stats.error_rate(),
+                    "p50_s": percentile(latencies, 50),
+                    "p95_s": percentile(latencies, 95),
+                    "healthy": self._healthy(stats),
+                }
+            return {
+                "models": models,
+                "routed": dict(self.routed),
+                "fallbacks": self.fallbacks,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "hedges_denied": self.hedges_denied,
+            }
+
+
+_router: ModelRouter | None = None
+
+
+def get_model_router() -> ModelRouter:
+    """Общий маршрутизатор процесса (маршруты и пороги из config)."""
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
+
+
+def configure_model_router(**kwargs: Any) -> ModelRouter:
+    """Заменяет общий маршрутизатор (сброс статистики, другие маршруты) — например, для бенчмарков."""
+    global _router
+    _router = ModelRouter(**kwargs)
+    return _router
+
+
+def describe_models() -> str:
+    """Модель для логов запуска: OPENAI_MODEL или маршруты с моделями."""
+    if not OPENAI_ROUTING_ENABLED:
+        return OPENAI_MODEL
+    return "; ".join(f"{route}: {', '.join(models)}" for route, models in OPENAI_ROUTES.items())
+
+
+def _collect_metrics() -> dict[str, float]:
+    if _router is None:
+        return {}
+    stats = _router.stats()
+    return {
+        "openai_route_fallbacks_total": stats["fallbacks"],
+        "openai_hedges_total": stats["hedges"],
+        "openai_hedge_wins_total": stats["hedge_wins"],
+        "openai_hedges_denied_total": stats["hedges_denied"],
+    }
+
+
+metrics.register_collector("model_router", _collect_metrics)
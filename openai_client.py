@@ -1,80 +1,258 @@
 """
 Клиент для общения с OpenAI API.
+SDK openai импортируется и клиент создаётся при первом запросе, а не при импорте модуля:
+CLI и бот стартуют без этой загрузки (~0.5–1 с).
 """
-import csv
-import json
+import asyncio
 import logging
+import time
 from datetime import datetime
-from pathlib import Path
-from typing import Any
-
-from openai import BadRequestError, OpenAI
+from collections.abc import AsyncIterator, Callable, Iterator
+from typing import TYPE_CHECKING, Any
 
+from completion_cache import get_completion_cache, make_cache_key
 from config import (
-    OPENAI_API_KEY,
+    COMPLETION_CACHE_ENABLED,
+    OPENAI_BASE_URL,
+    OPENAI_COALESCE_REQUESTS,
+    OPENAI_HEDGE_ENABLED,
     OPENAI_MAX_TOKENS,
     OPENAI_MODEL,
+    OPENAI_ROUTING_ENABLED,
     OPENAI_SYSTEM_MESSAGE,
     OPENAI_TEMPERATURE,
 )
+import metrics
+from homework_store import get_results_store
+from model_capabilities import get_model_capabilities
+from model_router import get_model_router
+from prompt_registry import PromptEntry, get_prompt_registry
+from request_scheduler import get_request_scheduler, is_retryable
+from single_flight import get_single_flight
+from structured_output import StructuredOutput, parse_structured, record_outcome, repair_messages, retry_allowed
+from token_counter import count_message_tokens
+from usage_logger import record_usage
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, BadRequestError, OpenAI
 
 logger = logging.getLogger(__name__)
 
-_client: OpenAI | None = None
-_usage_run_counter = 0
-_usage_log_path: Path | None = None
+_client: "OpenAI | None" = None
+_async_client: "AsyncOpenAI | None" = None
+
+
+def _get_client() -> "OpenAI":
+    global _client
+    if _client is None:
+        from openai import OpenAI
+
+        from config import OPENAI_API_KEY  # читает .env при первом обращении
+
+        # Повторы и паузы при 429/5xx делает request_scheduler, а не SDK
+        _client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+    return _client
 
 
-def _get_usage_log_path() -> Path:
-    """Путь к usage.csv: папка, откуда запущен процесс (cwd)/logs/."""
-    global _usage_log_path
-    if _usage_log_path is None:
-        _usage_log_path = Path.cwd() / "logs" / "usage.csv"
-    return _usage_log_path
+def _get_async_client() -> "AsyncOpenAI":
+    """
+    Общий AsyncOpenAI-клиент для бота: один пул HTTP-соединений на процесс,
+    соединения переиспользуются между запросами разных пользователей.
+    """
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI
 
+        from config import OPENAI_API_KEY
 
-def _log_usage_to_file(
+        _async_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+    return _async_client
+
+
+async def close_async_client() -> None:
+    """Закрывает общий AsyncOpenAI-клиент (при остановке бота)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+def _prepare_request(
+    messages: list[dict[str, Any]],
+    model: str | None,
+    temperature: float | None,
+    max_tokens: int | None,
+    system_message: str | None,
+    task: str,
+) -> tuple[str | None, str, float, int, list[dict[str, Any]]]:
+    """
+    Подставляет значения по умолчанию и добавляет system-сообщение (если есть).
+    Возвращает (маршрут, модель, temperature, max_tokens, messages); модель не задана
+    и OPENAI_ROUTING_ENABLED — выбирает model_router по задаче и длине промпта.
+    """
+    temp = float(temperature if temperature is not None else OPENAI_TEMPERATURE)
+    max_tok = max_tokens if max_tokens is not None else OPENAI_MAX_TOKENS
+    system = (system_message if system_message is not None else OPENAI_SYSTEM_MESSAGE) or ""
+
+    # Как в примере: system (если есть) + остальные сообщения
+    if system.strip():
+        messages = [{"role": "system", "content": system.strip()}] + list(messages)
+    else:
+        messages = list(messages)
+    route = None
+    if model is None and OPENAI_ROUTING_ENABLED:
+        route, model = get_model_router().choose(task, sum(count_message_tokens(m) for m in messages))
+    return route, model or OPENAI_MODEL, temp, max_tok, messages
+
+
+def _build_kwargs(
     model: str,
-    temperature_used: str | float,
-    usage: dict[str, int],
-) -> None:
-    """Пишет одну строку в logs/usage.csv для отчёта по использованию."""
-    global _usage_run_counter
-    _usage_run_counter += 1
-    path = _get_usage_log_path()
+    messages: list[dict[str, Any]],
+    temp: float,
+    max_tok: int,
+    include_temperature: bool,
+    stream: bool = False,
+) -> dict[str, Any]:
+    k: dict[str, Any] = {"model": model, "messages": messages}
+    if include_temperature:
+        k["temperature"] = temp
+    if max_tok > 0:
+        k["max_completion_tokens"] = max_tok
+    if stream:
+        # usage приходит последним чанком (с пустым choices)
+        k["stream"] = True
+        k["stream_options"] = {"include_usage": True}
+    return k
+
+
+def _estimate_tokens(messages: list[dict[str, Any]], max_tok: int) -> int:
+    """Оценка токенов запроса для лимита TPM (промпт + max_tokens); 0, если лимит не задан."""
+    if not get_request_scheduler().limits_tokens:
+        return 0
+    return sum(count_message_tokens(m) for m in messages) + max(0, max_tok)
+
+
+def _is_unsupported_temperature(e: "BadRequestError") -> bool:
+    err_msg = (getattr(e, "message", None) or str(e)).lower()
+    return "temperature" in err_msg and "unsupported" in err_msg
+
+
+def _temperature_probe(send_temperature: bool) -> Callable[[Exception], bool] | None:
+    """Для планировщика: отказ модели от temperature — не сбой, запрос повторится без параметра."""
+    if not send_temperature:
+        return None
+    from openai import BadRequestError
+
+    return lambda e: isinstance(e, BadRequestError) and _is_unsupported_temperature(e)
+
+
+def _temperature_rejected(e: "BadRequestError", model: str, sent_temperature: bool) -> bool:
+    """
+    True, если модель отклонила temperature (это запоминается, следующие запросы
+    к ней сразу идут без параметра). Иначе ошибку нужно пробросить дальше.
+    """
+    if not sent_temperature or not _is_unsupported_temperature(e):
+        return False
+    get_model_capabilities().mark_unsupported(model, "temperature")
+    return True
+
+
+def _temperature_accepted(model: str, sent_temperature: bool) -> None:
+    if sent_temperature:
+        get_model_capabilities().mark_supported(model, "temperature")
+
+
+def _parse_response(response: Any) -> tuple[str, dict[str, int]]:
+    """Достаёт текст ответа и usage из ответа Chat Completions."""
+    content = response.choices[0].message.content
+    text = (content or "").strip()
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+    if response.usage:
+        usage = _usage_from(response.usage)
+    return text, usage
+
+
+def _usage_from(raw_usage: Any) -> dict[str, int]:
+    """usage ответа; cached_tokens — часть prompt_tokens, взятая из кэша промптов провайдера."""
+    details = getattr(raw_usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(raw_usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(raw_usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(raw_usage, "total_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+    }
+
+
+def _chunk_delta(chunk: Any) -> str:
+    """Текст из чанка потокового ответа (пустая строка, если его нет)."""
+    if not chunk.choices:
+        return ""
+    return getattr(chunk.choices[0].delta, "content", None) or ""
+
+
+def _record_usage(model: str, temperature_used: str | float, usage: dict[str, int]) -> None:
+    """Ставит usage в очередь записи (logs/usage.csv пишется пачками в фоне)."""
+    metrics.inc("prompt_tokens", usage.get("prompt_tokens", 0))
+    metrics.inc("completion_tokens", usage.get("completion_tokens", 0))
+    metrics.inc("cached_prompt_tokens", usage.get("cached_tokens", 0))
     try:
-        path.parent.mkdir(parents=True, exist_ok=True)
-        file_exists = path.exists()
-        with open(path, "a", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow([
-                    "run_id", "datetime", "model", "temperature",
-                    "prompt_tokens", "completion_tokens", "total_tokens",
-                ])
-            writer.writerow([
-                _usage_run_counter,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                model,
-                temperature_used,
-                usage.get("prompt_tokens", 0),
-                usage.get("completion_tokens", 0),
-                usage.get("total_tokens", 0),
-            ])
-        if not file_exists:
-            print(f"[Usage] Лог создан: {path.absolute()}", flush=True)
-        logger.info("Usage записан: %s (run_id=%s)", path, _usage_run_counter)
+        with metrics.timer("usage_log"):
+            run_id = record_usage(model, temperature_used, usage)
+        logger.debug("Usage поставлен в очередь (run_id=%s)", run_id)
     except Exception as e:
-        import sys
-        print(f"[Usage] Ошибка записи лога: {e}", file=sys.stderr, flush=True)
-        logger.warning("Не удалось записать usage в файл: %s", e, exc_info=True)
+        metrics.inc("usage_log_errors")
+        logger.warning("Не удалось записать usage: %s", e, exc_info=True)
 
 
-def _get_client() -> OpenAI:
-    global _client
-    if _client is None:
-        _client = OpenAI(api_key=OPENAI_API_KEY)
-    return _client
+def _use_answer(
+    model: str, temperature_used: str | float, usage: dict[str, int], text: str, cache_key: str | None
+) -> None:
+    """Ответ модели отдаётся вызывающему: usage — в лог, текст — в кэш ответов (если он включён)."""
+    _record_usage(model, temperature_used, usage)
+    if cache_key is not None and text:
+        get_completion_cache().put(cache_key, text, usage)
+
+
+def _cache_lookup(
+    use_cache: bool | None,
+    model: str,
+    messages: list[dict[str, Any]],
+    temp: float,
+    max_tok: int,
+) -> tuple[str | None, tuple[str, dict[str, int]] | None]:
+    """
+    Возвращает (ключ кэша, результат). Ключ None — кэш не используется.
+    При попадании в usage пишется запрос с нулевыми токенами (в API не ходили).
+    """
+    if not (COMPLETION_CACHE_ENABLED if use_cache is None else use_cache):
+        return None, None
+    key = make_cache_key(model, messages, temp, max_tok)
+    cached = get_completion_cache().get(key)
+    if cached is None:
+        return key, None
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+    logger.debug("Ответ взят из кэша (model=%s)", model)
+    _record_usage(model, temp, usage)
+    return key, (cached[0], usage)
+
+
+def _coalescing(use_cache: bool | None) -> bool:
+    """Объединять ли запрос с одинаковыми в полёте: use_cache=False просит свой ответ (выборки ДЗ)."""
+    return OPENAI_COALESCE_REQUESTS and use_cache is not False
+
+
+def _shared_usage(model: str, temperature_used: str | float, leader_usage: dict[str, int]) -> dict[str, int]:
+    """
+    usage вызова, получившего чужой ответ: вызывающему — usage запроса, сделавшего его,
+    с пометкой coalesced; в лог — строка с нулями и coalesced=1 (токены уже учтены у того
+    запроса, а usage-report не считает её попаданием в кэш).
+    """
+    metrics.inc("openai_coalesced")
+    _record_usage(
+        model, temperature_used,
+        {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0, "coalesced": 1},
+    )
+    return {**leader_usage, "coalesced": 1}
 
 
 def chat_completion(
@@ -83,71 +261,402 @@ def chat_completion(
     temperature: float | None = None,
     max_tokens: int | None = None,
     system_message: str | None = None,
+    use_cache: bool | None = None,
+    task: str = "chat",
 ) -> tuple[str, dict[str, int]]:
     """
     Отправляет запрос в OpenAI Chat Completions.
     Возвращает (текст ответа, использование токенов).
     usage: {"prompt_tokens": int, "completion_tokens": int, "total_tokens": int}
+    use_cache: брать ответ из кэша (None — по COMPLETION_CACHE_ENABLED); при попадании usage нулевой.
+    Одинаковые одновременные запросы объединяются (OPENAI_COALESCE_REQUESTS): к модели
+    уходит один, остальные получают его ответ и usage с "coalesced": 1.
+    use_cache=False — всегда свой запрос: без кэша и без объединения.
+    task: тип запроса для выбора модели, если model не задана ("chat" или "homework", см. model_router).
     """
-    model = model or OPENAI_MODEL
-    temp = float(temperature if temperature is not None else OPENAI_TEMPERATURE)
-    max_tok = max_tokens if max_tokens is not None else OPENAI_MAX_TOKENS
-    system = (system_message if system_message is not None else OPENAI_SYSTEM_MESSAGE) or ""
-    usage_default = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+    route, model, temp, max_tok, messages = _prepare_request(
+        messages, model, temperature, max_tokens, system_message, task
+    )
+    cache_key, cached = _cache_lookup(use_cache, model, messages, temp, max_tok)
+    if cached is not None:
+        return cached
+    if not _coalescing(use_cache):
+        text, usage, _ = _request(model, messages, temp, max_tok, cache_key)
+        return text, usage
+    key = cache_key or make_cache_key(model, messages, temp, max_tok)
+    (text, usage, temperature_used), shared = get_single_flight().run(
+        key, lambda: _request(model, messages, temp, max_tok, cache_key)
+    )
+    return (text, _shared_usage(model, temperature_used, usage)) if shared else (text, usage)
+
+
+def _request(
+    model: str,
+    messages: list[dict[str, Any]],
+    temp: float,
+    max_tok: int,
+    cache_key: str | None,
+) -> tuple[str, dict[str, int], str | float]:
+    """Запрос к модели для chat_completion: (текст, usage, temperature_used)."""
     client = _get_client()
+    from openai import BadRequestError  # SDK уже загружен клиентом
+
+    scheduler = get_request_scheduler()
+    reserved = _estimate_tokens(messages, max_tok)
+    send_temperature = get_model_capabilities().supports(model, "temperature")
+
+    with get_model_router().track(model):
+        try:
+            response = scheduler.run(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=send_temperature)
+                ),
+                reserved,
+                handled=_temperature_probe(send_temperature),
+            )
+        except BadRequestError as e:
+            if not _temperature_rejected(e, model, send_temperature):
+                raise
+            logger.warning("Модель %s не поддерживает temperature=%s, запрос без temperature", model, temp)
+            response = scheduler.run(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=False)
+                ),
+                reserved,
+            )
+            send_temperature = False
+        else:
+            _temperature_accepted(model, send_temperature)
+    temperature_used: str | float = temp if send_temperature else "default"
 
-    # Как в примере: system (если есть) + остальные сообщения
-    if system.strip():
-        messages = [{"role": "system", "content": system.strip()}] + list(messages)
-    else:
-        messages = list(messages)
+    text, usage = _parse_response(response)
+    scheduler.settle(reserved, usage["total_tokens"])
+    _use_answer(model, temperature_used, usage, text, cache_key)
+    return text, usage, temperature_used
+
+
+async def async_chat_completion(
+    messages: list[dict[str, Any]],
+    model: str | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    system_message: str | None = None,
+    use_cache: bool | None = None,
+    task: str = "chat",
+) -> tuple[str, dict[str, int]]:
+    """
+    Асинхронный вариант chat_completion для бота: не блокирует event loop aiogram,
+    пока модель генерирует ответ. Параметры и результат — как у chat_completion.
+    С OPENAI_HEDGE_ENABLED долгий запрос дублируется запасным (см. _async_call).
+    """
+    route, model, temp, max_tok, messages = _prepare_request(
+        messages, model, temperature, max_tokens, system_message, task
+    )
+    cache_key, cached = _cache_lookup(use_cache, model, messages, temp, max_tok)
+    if cached is not None:
+        return cached
+    if not _coalescing(use_cache):
+        text, usage, _ = await _async_call(route, model, messages, temp, max_tok, cache_key)
+        return text, usage
+    key = cache_key or make_cache_key(model, messages, temp, max_tok)
+    (text, usage, temperature_used), shared = await get_single_flight().arun(
+        key, lambda: _async_call(route, model, messages, temp, max_tok, cache_key)
+    )
+    return (text, _shared_usage(model, temperature_used, usage)) if shared else (text, usage)
+
+
+async def _async_call(
+    route: str | None,
+    model: str,
+    messages: list[dict[str, Any]],
+    temp: float,
+    max_tok: int,
+    cache_key: str | None,
+) -> tuple[str, dict[str, int], str | float]:
+    """
+    _async_request с хеджированием (OPENAI_HEDGE_ENABLED): нет ответа дольше p95 модели
+    или ответ — ошибка 429/5xx — уходит запасной запрос (модель — ModelRouter.hedge_model).
+    Берётся первый успешный ответ, другой запрос отменяется; обе ошибки — ошибка основного.
+    usage и кэш ответов пишутся только для ответа, который используется (ключ кэша —
+    по модели, которая ответила).
+    """
+    if not OPENAI_HEDGE_ENABLED:
+        return await _async_request(model, messages, temp, max_tok, cache_key)
+    router = get_model_router()
+    router.count_hedge_candidate()
+    delay = router.hedge_delay(model)
+    started = time.monotonic()
+    primary = asyncio.ensure_future(_async_request(model, messages, temp, max_tok, cache_key, record=False))
+    # Задача -> (модель, ключ кэша)
+    tasks = {primary: (model, cache_key)}
+
+    def use(task: asyncio.Future) -> tuple[str, dict[str, int], str | float]:
+        text, usage, temperature_used = task.result()
+        task_model, task_key = tasks[task]
+        _use_answer(task_model, temperature_used, usage, text, task_key)
+        return text, usage, temperature_used
+
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done and (primary.exception() is None or not is_retryable(primary.exception())):
+            return use(primary)
+        if not router.allow_hedge():
+            await primary
+            return use(primary)
+        backup_model = router.hedge_model(route, model, failed=bool(done))
+        logger.info(
+            "Запасной запрос к %s: %s %s", backup_model, model,
+            "ответил ошибкой" if done else f"не ответил за {delay:.2f} с",
+        )
+        backup_key = cache_key
+        if cache_key is not None and backup_model != model:
+            backup_key = make_cache_key(backup_model, messages, temp, max_tok)
+        backup = asyncio.ensure_future(
+            _async_request(backup_model, messages, temp, max_tok, backup_key, record=False)
+        )
+        tasks[backup] = (backup_model, backup_key)
+        pending = {task for task in tasks if not task.done()}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Если оба успели ответить, берётся основной
+            for task in sorted(done, key=lambda t: t is not primary):
+                if task.exception() is None:
+                    if task is not primary:
+                        router.count_hedge_win()
+                        if not primary.done():  # основной не дождались — его время не меньше этого
+                            router.observe(model, time.monotonic() - started, error=False)
+                    return use(task)
+        return use(primary)
+    finally:
+        # Проигравший запрос отменяется; его токены (если модель успела их потратить) в usage не попадут
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def _async_request(
+    model: str,
+    messages: list[dict[str, Any]],
+    temp: float,
+    max_tok: int,
+    cache_key: str | None,
+    record: bool = True,
+) -> tuple[str, dict[str, int], str | float]:
+    """
+    Запрос к модели для async_chat_completion: (текст, usage, temperature_used).
+    record=False — usage и кэш ответов не трогаются (решает _async_call, когда запросов два).
+    """
+    client = _get_async_client()
+    from openai import BadRequestError  # SDK уже загружен клиентом
+
+    scheduler = get_request_scheduler()
+    reserved = _estimate_tokens(messages, max_tok)
+    send_temperature = get_model_capabilities().supports(model, "temperature")
+
+    with get_model_router().track(model):
+        try:
+            response = await scheduler.arun(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=send_temperature)
+                ),
+                reserved,
+                handled=_temperature_probe(send_temperature),
+            )
+        except BadRequestError as e:
+            if not _temperature_rejected(e, model, send_temperature):
+                raise
+            logger.warning("Модель %s не поддерживает temperature=%s, запрос без temperature", model, temp)
+            response = await scheduler.arun(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=False)
+                ),
+                reserved,
+            )
+            send_temperature = False
+        else:
+            _temperature_accepted(model, send_temperature)
+    temperature_used: str | float = temp if send_temperature else "default"
 
-    temperature_used: str | float = temp
+    text, usage = _parse_response(response)
+    scheduler.settle(reserved, usage["total_tokens"])
+    if record:
+        _use_answer(model, temperature_used, usage, text, cache_key)
+    return text, usage, temperature_used
 
-    def _build_kwargs(include_temperature: bool) -> dict[str, Any]:
-        k: dict[str, Any] = {"model": model, "messages": messages}
-        if include_temperature:
-            k["temperature"] = temp
-        if max_tok > 0:
-            k["max_completion_tokens"] = max_tok
-        return k
 
+def stream_chat_completion(
+    messages: list[dict[str, Any]],
+    model: str | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    system_message: str | None = None,
+    use_cache: bool | None = None,
+    usage_out: dict[str, int] | None = None,
+    task: str = "chat",
+) -> Iterator[str]:
+    """
+    Потоковый вариант chat_completion: отдаёт куски текста по мере генерации.
+    После исчерпания генератора usage записан в лог и (если передан) в usage_out.
+    """
+    route, model, temp, max_tok, messages = _prepare_request(
+        messages, model, temperature, max_tokens, system_message, task
+    )
+    cache_key, cached = _cache_lookup(use_cache, model, messages, temp, max_tok)
+    if cached is not None:
+        if usage_out is not None:
+            usage_out.update(cached[1])
+        yield cached[0]
+        return
+    client = _get_client()
+    from openai import BadRequestError  # SDK уже загружен клиентом
+
+    scheduler = get_request_scheduler()
+    reserved = _estimate_tokens(messages, max_tok)
+    send_temperature = get_model_capabilities().supports(model, "temperature")
+
+    with get_model_router().track(model):
+        try:
+            stream, release = scheduler.open_stream(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=send_temperature, stream=True)
+                ),
+                reserved,
+                handled=_temperature_probe(send_temperature),
+            )
+        except BadRequestError as e:
+            if not _temperature_rejected(e, model, send_temperature):
+                raise
+            logger.warning("Модель %s не поддерживает temperature=%s, запрос без temperature", model, temp)
+            stream, release = scheduler.open_stream(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=False, stream=True)
+                ),
+                reserved,
+            )
+            send_temperature = False
+        else:
+            _temperature_accepted(model, send_temperature)
+        # В статистику модели — время до первого куска ответа и ошибки при его получении
+        chunks = iter(stream)
+        try:
+            chunk = next(chunks, None)
+        except BaseException:
+            release()
+            raise
+    temperature_used: str | float = temp if send_temperature else "default"
+
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+    parts: list[str] = []
     try:
-        response = client.chat.completions.create(**_build_kwargs(include_temperature=True))
-    except BadRequestError as e:
-        err_msg = (getattr(e, "message", None) or str(e)).lower()
-        if "temperature" in err_msg and "unsupported" in err_msg:
-            logger.warning("Модель не поддерживает temperature=%s, запрос без temperature", temp)
-            response = client.chat.completions.create(**_build_kwargs(include_temperature=False))
-            temperature_used = "default"
+        while chunk is not None:
+            if getattr(chunk, "usage", None):
+                usage = _usage_from(chunk.usage)
+            delta = _chunk_delta(chunk)
+            if delta:
+                parts.append(delta)
+                yield delta
+            chunk = next(chunks, None)
+    finally:
+        release()
+        # Поток прерван до чанка usage — оставляем резерв как есть
+        scheduler.settle(reserved, usage["total_tokens"] or reserved)
+
+    _record_usage(model, temperature_used, usage)
+    if usage_out is not None:
+        usage_out.update(usage)
+    text = "".join(parts).strip()
+    if cache_key is not None and text:
+        get_completion_cache().put(cache_key, text, usage)
+
+
+async def async_stream_chat_completion(
+    messages: list[dict[str, Any]],
+    model: str | None = None,
+    temperature: float | None = None,
+    max_tokens: int | None = None,
+    system_message: str | None = None,
+    use_cache: bool | None = None,
+    usage_out: dict[str, int] | None = None,
+    task: str = "chat",
+) -> AsyncIterator[str]:
+    """Асинхронный вариант stream_chat_completion (для бота)."""
+    route, model, temp, max_tok, messages = _prepare_request(
+        messages, model, temperature, max_tokens, system_message, task
+    )
+    cache_key, cached = _cache_lookup(use_cache, model, messages, temp, max_tok)
+    if cached is not None:
+        if usage_out is not None:
+            usage_out.update(cached[1])
+        yield cached[0]
+        return
+    client = _get_async_client()
+    from openai import BadRequestError  # SDK уже загружен клиентом
+
+    scheduler = get_request_scheduler()
+    reserved = _estimate_tokens(messages, max_tok)
+    send_temperature = get_model_capabilities().supports(model, "temperature")
+
+    with get_model_router().track(model):
+        try:
+            stream, release = await scheduler.aopen_stream(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=send_temperature, stream=True)
+                ),
+                reserved,
+                handled=_temperature_probe(send_temperature),
+            )
+        except BadRequestError as e:
+            if not _temperature_rejected(e, model, send_temperature):
+                raise
+            logger.warning("Модель %s не поддерживает temperature=%s, запрос без temperature", model, temp)
+            stream, release = await scheduler.aopen_stream(
+                lambda: client.chat.completions.create(
+                    **_build_kwargs(model, messages, temp, max_tok, include_temperature=False, stream=True)
+                ),
+                reserved,
+            )
+            send_temperature = False
         else:
+            _temperature_accepted(model, send_temperature)
+        # В статистику модели — время до первого куска ответа и ошибки при его получении
+        chunks = aiter(stream)
+        try:
+            chunk = await anext(chunks, None)
+        except BaseException:
+            release()
             raise
+    temperature_used: str | float = temp if send_temperature else "default"
 
-    content = response.choices[0].message.content
-    text = (content or "").strip()
-    if response.usage:
-        usage_default = {
-            "prompt_tokens": getattr(response.usage, "prompt_tokens", 0) or 0,
-            "completion_tokens": getattr(response.usage, "completion_tokens", 0) or 0,
-            "total_tokens": getattr(response.usage, "total_tokens", 0) or 0,
-        }
+    usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cached_tokens": 0}
+    parts: list[str] = []
     try:
-        _log_usage_to_file(model, temperature_used, usage_default)
-    except Exception as e:
-        logger.warning("Не удалось записать usage в файл: %s", e, exc_info=True)
-    return text, usage_default
+        while chunk is not None:
+            if getattr(chunk, "usage", None):
+                usage = _usage_from(chunk.usage)
+            delta = _chunk_delta(chunk)
+            if delta:
+                parts.append(delta)
+                yield delta
+            chunk = await anext(chunks, None)
+    finally:
+        release()
+        # Поток прерван до чанка usage — оставляем резерв как есть
+        scheduler.settle(reserved, usage["total_tokens"] or reserved)
+
+    _record_usage(model, temperature_used, usage)
+    if usage_out is not None:
+        usage_out.update(usage)
+    text = "".join(parts).strip()
+    if cache_key is not None and text:
+        get_completion_cache().put(cache_key, text, usage)
 
 
 # ---------- ДЗ: работа с prompts.json ----------
 
-_PROMPTS_PATH = Path(__file__).resolve().parent / "prompts.json"
-_HOMEWORK_RESULTS_PATH = Path.cwd() / "logs" / "homework_results.json"
-
 
 def load_prompts() -> dict[str, Any]:
-    """Читает и возвращает содержимое prompts.json."""
-    with open(_PROMPTS_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
+    """Возвращает содержимое prompts.json (из кэша реестра, перечитывается при изменении файла)."""
+    return get_prompt_registry().data
 
 
 def _save_homework_result(
@@ -156,9 +665,10 @@ def _save_homework_result(
     usage: dict[str, int],
     parsed: bool = True,
     raw_text: str | None = None,
+    repairs: list[str] | None = None,
+    retries: int = 0,
 ) -> None:
-    """Сохраняет результат запуска домашнего промпта в logs/homework_results.json."""
-    _HOMEWORK_RESULTS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    """Дописывает результат запуска домашнего промпта в logs/homework_results.jsonl."""
     entry = {
         "prompt_id": prompt_id,
         "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -168,65 +678,94 @@ def _save_homework_result(
     }
     if raw_text is not None:
         entry["raw_text"] = raw_text
-    data: list[dict[str, Any]] = []
-    if _HOMEWORK_RESULTS_PATH.exists():
-        with open(_HOMEWORK_RESULTS_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    data.append(entry)
-    with open(_HOMEWORK_RESULTS_PATH, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    if repairs:
+        entry["repairs"] = repairs
+    if retries:
+        entry["retries"] = retries
+    get_results_store().append(entry)
 
 
-def run_homework_prompt(prompt_id: int) -> dict[str, Any]:
-    """
-    Запускает промпт из prompts.json по id.
-    Возвращает словарь с ключами: result (распарсенный JSON или raw), usage, parsed (bool), error (если был).
-    Результат сохраняется в logs/homework_results.json.
-    """
-    data = load_prompts()
-    prompt = None
-    for p in data.get("prompts", []):
-        if p.get("id") == prompt_id:
-            prompt = p
-            break
+def _get_homework_prompt(prompt_id: int) -> PromptEntry:
+    """Находит промпт по id (с заранее собранными system, messages и схемой ответа)."""
+    prompt = get_prompt_registry().get(prompt_id)
     if not prompt:
         raise ValueError(f"Промпт с id={prompt_id} не найден в prompts.json")
+    return prompt
 
-    system = (prompt.get("role") or "").strip()
-    fmt = (prompt.get("format") or "").strip()
-    if fmt:
-        system = f"{system}\n\n{fmt}" if system else fmt
 
-    user_parts = [
-        "Контекст: " + (prompt.get("context") or ""),
-        "\n\nЗадача: " + (prompt.get("question") or ""),
-    ]
-    if "example" in prompt and prompt["example"] is not None:
-        user_parts.append("\n\nОбразец ответа:\n" + json.dumps(prompt["example"], ensure_ascii=False, indent=2))
-    user_content = "".join(user_parts)
+def _add_usage(total: dict[str, int], extra: dict[str, int]) -> dict[str, int]:
+    return {k: total.get(k, 0) + extra.get(k, 0) for k in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens")}
 
-    messages = [{"role": "user", "content": user_content}]
-    text, usage = chat_completion(messages, model=OPENAI_MODEL, system_message=system)
 
-    parsed = True
-    result: dict[str, Any] = {}
-    try:
-        result = json.loads(text)
-    except json.JSONDecodeError as e:
-        parsed = False
-        result = {"error": f"Не удалось распарсить JSON: {e}", "raw": text}
-        logger.warning("Ответ не является валидным JSON: %s", e)
+def _finish_homework_run(
+    prompt_id: int, text: str, usage: dict[str, int], outcome: StructuredOutput, retries: int
+) -> dict[str, Any]:
+    """Сохраняет результат (исправленный JSON или ошибку с исходным текстом) и возвращает его."""
+    record_outcome(outcome, retries)
+    if outcome.ok:
+        result: dict[str, Any] = outcome.value or {}
+        if outcome.repairs or retries:
+            logger.info("Ответ на промпт #%s исправлен: %s, повторов: %s", prompt_id, outcome.repairs, retries)
+    else:
+        result = {"error": f"Ответ не прошёл проверку JSON: {'; '.join(outcome.errors)}", "raw": text}
+        logger.warning("Ответ на промпт #%s не прошёл проверку JSON: %s", prompt_id, outcome.errors)
 
     _save_homework_result(
         prompt_id=prompt_id,
         result=result,
         usage=usage,
-        parsed=parsed,
-        raw_text=text if not parsed else None,
+        parsed=outcome.ok,
+        raw_text=text if not outcome.ok else None,
+        repairs=outcome.repairs,
+        retries=retries,
     )
 
     return {
         "result": result,
         "usage": usage,
-        "parsed": parsed,
+        "parsed": outcome.ok,
+        "repairs": outcome.repairs,
+        "retries": retries,
     }
+
+
+def run_homework_prompt(prompt_id: int, use_cache: bool | None = None) -> dict[str, Any]:
+    """
+    Запускает промпт из prompts.json по id.
+    Возвращает словарь с ключами: result (JSON по схеме или ошибка с raw), usage (с учётом повторов),
+    parsed (bool), repairs (что исправлено локально), retries (повторных запросов к модели).
+    Результат сохраняется в logs/homework_results.jsonl.
+    use_cache=False — всегда новый запрос к модели (например, для пакетных прогонов).
+    """
+    prompt = _get_homework_prompt(prompt_id)
+    text, usage = chat_completion(prompt.messages, system_message=prompt.system, use_cache=use_cache, task="homework")
+    outcome = parse_structured(text, prompt.schema)
+    retries = 0
+    while not outcome.ok and retry_allowed(retries + 1):
+        retries += 1
+        text, retry_usage = chat_completion(
+            repair_messages(prompt.messages, text, outcome),
+            system_message=prompt.system, use_cache=False, task="homework",
+        )
+        usage = _add_usage(usage, retry_usage)
+        outcome = parse_structured(text, prompt.schema)
+    return _finish_homework_run(prompt_id, text, usage, outcome, retries)
+
+
+async def async_run_homework_prompt(prompt_id: int, use_cache: bool | None = None) -> dict[str, Any]:
+    """Асинхронный вариант run_homework_prompt (для бота и пакетных прогонов)."""
+    prompt = _get_homework_prompt(prompt_id)
+    text, usage = await async_chat_completion(
+        prompt.messages, system_message=prompt.system, use_cache=use_cache, task="homework"
+    )
+    outcome = parse_structured(text, prompt.schema)
+    retries = 0
+    while not outcome.ok and retry_allowed(retries + 1):
+        retries += 1
+        text, retry_usage = await async_chat_completion(
+            repair_messages(prompt.messages, text, outcome),
+            system_message=prompt.system, use_cache=False, task="homework",
+        )
+        usage = _add_usage(usage, retry_usage)
+        outcome = parse_structured(text, prompt.schema)
+    return _finish_homework_run(prompt_id, text, usage, outcome, retries)
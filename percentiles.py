@@ -0,0 +1,70 @@
+"""
+Перцентили и сводки по числовым рядам (задержки, токены) для отчётов и бенчмарков.
+"""
+import math
+from collections.abc import Iterable
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """Перцентиль p (0–100) отсортированного ряда с линейной интерполяцией; 0 для пустого ряда."""
+    if not sorted_values:
+        return 0.0
+    if len(sorted_values) == 1:
+        return float(sorted_values[0])
+    rank = (len(sorted_values) - 1) * p / 100
+    lo = math.floor(rank)
+    hi = math.ceil(rank)
+    if lo == hi:
+        return float(sorted_values[lo])
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (rank - lo)
+
+
+def summarize(values: Iterable[float], ps: tuple[float, ...] = (50, 95, 99)) -> dict[str, float]:
+    """{"count", "mean", "min", "max", "p50", "p95", "p99"} для ряда значений."""
+    data = sorted(values)
+    summary: dict[str, float] = {
+        "count": len(data),
+        "mean": sum(data) / len(data) if data else 0.0,
+        "min": float(data[0]) if data else 0.0,
+        "max": float(data[-1]) if data else 0.0,
+    }
+    for p in ps:
+        summary[f"p{p:g}"] = percentile(data, p)
+    return summary
+
+
+def percentile_from_counts(counts: dict[int, int], p: float) -> float:
+    """
+    Перцентиль p ряда, заданного гистограммой {значение: сколько раз}, — то же, что
+    percentile() по развёрнутому ряду, но без его построения (токены — целые, различных мало).
+    """
+    total = sum(counts.values())
+    if not total:
+        return 0.0
+    rank = (total - 1) * p / 100
+    lo_rank = math.floor(rank)
+    hi_rank = math.ceil(rank)
+    lo = hi = None
+    seen = 0
+    for value in sorted(counts):
+        seen += counts[value]
+        if lo is None and seen > lo_rank:
+            lo = value
+        if seen > hi_rank:
+            hi = value
+            break
+    return lo + (hi - lo) * (rank - lo_rank)
+
+
+def summarize_counts(counts: dict[int, int], ps: tuple[float, ...] = (50, 95, 99)) -> dict[str, float]:
+    """summarize() для гистограммы {значение: сколько раз}."""
+    total = sum(counts.values())
+    summary: dict[str, float] = {
+        "count": total,
+        "mean": sum(v * n for v, n in counts.items()) / total if total else 0.0,
+        "min": float(min(counts)) if total else 0.0,
+        "max": float(max(counts)) if total else 0.0,
+    }
+    for p in ps:
+        summary[f"p{p:g}"] = percentile_from_counts(counts, p)
+    return summary
@@ -0,0 +1,151 @@
+"""
+Реестр промптов ДЗ из prompts.json: читается один раз, индексируется по id,
+строки запроса (system, user), текст для показа в боте и схема ответа (из "format")
+собираются заранее. Неизменная часть (роль, формат, образец) — в system, в начале запроса.
+Файл перечитывается только если изменились его mtime/размер
+(проверка не чаще раза в PROMPTS_RELOAD_CHECK_SECONDS).
+"""
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from config import PROMPTS_RELOAD_CHECK_SECONDS
+from structured_output import schema_from_format
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_PATH = Path(__file__).resolve().parent / "prompts.json"
+
+
+def build_system_message(prompt: dict[str, Any]) -> str:
+    """
+    System-сообщение запроса ДЗ: роль, требования к формату и образец ответа (если есть) —
+    всё, что не меняется от запуска к запуску. Оно идёт первым и совпадает побайтно,
+    поэтому провайдер берёт этот префикс из кэша промптов (usage cached_tokens).
+    """
+    parts = [(prompt.get("role") or "").strip(), (prompt.get("format") or "").strip()]
+    if prompt.get("example") is not None:
+        parts.append("Образец ответа:\n" + json.dumps(prompt["example"], ensure_ascii=False, indent=2))
+    return "\n\n".join(part for part in parts if part)
+
+
+def build_user_message(prompt: dict[str, Any]) -> str:
+    """User-сообщение запроса ДЗ: контекст и задача — изменчивая часть в конце запроса."""
+    return "Контекст: " + (prompt.get("context") or "") + "\n\nЗадача: " + (prompt.get("question") or "")
+
+
+def build_display_text(prompt: dict[str, Any]) -> str:
+    """
+    Собирает текст промпта для отображения в боте (role, context, question, format, example; Markdown).
+    Без обрезки: длинный текст делит на сообщения telegram_output.split_message.
+    """
+    role = (prompt.get("role") or "").strip()
+    context = (prompt.get("context") or "").strip()
+    question = (prompt.get("question") or "").strip()
+    fmt = (prompt.get("format") or "").strip()
+    parts = []
+    if role:
+        parts.append(f"*Роль:*\n{role}")
+    if fmt:
+        parts.append(f"*Формат:*\n{fmt}")
+    parts.append(f"*Контекст:*\n{context}")
+    parts.append(f"*Задача:*\n{question}")
+    if prompt.get("example") is not None:
+        ex = json.dumps(prompt["example"], ensure_ascii=False, indent=2)
+        parts.append(f"*Пример:*\n```json\n{ex}\n```")
+    return "\n\n".join(parts)
+
+
+class PromptEntry:
+    """Промпт из prompts.json с заранее собранными строками."""
+
+    __slots__ = ("id", "name", "raw", "system", "user_content", "display_text", "schema")
+
+    def __init__(self, raw: dict[str, Any]) -> None:
+        self.id = raw.get("id")
+        self.name: str = raw.get("name", "")
+        self.raw = raw
+        self.system = build_system_message(raw)
+        self.user_content = build_user_message(raw)
+        self.display_text = build_display_text(raw)
+        self.schema = schema_from_format(raw.get("format") or "")
+
+    @property
+    def messages(self) -> list[dict[str, Any]]:
+        return [{"role": "user", "content": self.user_content}]
+
+
+class PromptRegistry:
+    """Кэш prompts.json с индексом по id и перечитыванием при изменении файла."""
+
+    def __init__(self, path: Path = PROMPTS_PATH, check_interval: float = PROMPTS_RELOAD_CHECK_SECONDS) -> None:
+        self.path = path
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._signature: tuple[int, int] | None = None
+        self._checked_at = 0.0
+        self._data: dict[str, Any] = {}
+        self._prompts: list[PromptEntry] = []
+        self._by_id: dict[Any, PromptEntry] = {}
+
+    def _file_signature(self) -> tuple[int, int]:
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self, signature: tuple[int, int]) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        prompts = [PromptEntry(p) for p in data.get("prompts", [])]
+        self._data = data
+        self._prompts = prompts
+        self._by_id = {p.id: p for p in prompts}
+        self._signature = signature
+        self.reloads += 1
+        logger.info("Промпты загружены из %s: %s шт.", self.path, len(prompts))
+
+    def _ensure_fresh(self) -> None:
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if self._signature is not None and now - self._checked_at < self.check_interval:
+                return
+            signature = self._file_signature()
+            if signature != self._signature:
+                self._load(signature)
+            self._checked_at = now
+
+    @property
+    def data(self) -> dict[str, Any]:
+        """Содержимое prompts.json (общий объект — не изменять)."""
+        self._ensure_fresh()
+        return self._data
+
+    @property
+    def homework_task(self) -> str:
+        self._ensure_fresh()
+        return self._data.get("homework_task", "")
+
+    def prompts(self) -> list[PromptEntry]:
+        self._ensure_fresh()
+        return self._prompts
+
+    def get(self, prompt_id: Any) -> PromptEntry | None:
+        self._ensure_fresh()
+        return self._by_id.get(prompt_id)
+
+
+_registry: PromptRegistry | None = None
+
+
+def get_prompt_registry() -> PromptRegistry:
+    """Общий реестр промптов процесса (prompts.json рядом с кодом)."""
+    global _registry
+    if _registry is None:
+        _registry = PromptRegistry()
+    return _registry
@@ -0,0 +1,390 @@
+"""
+Планировщик запросов к OpenAI: лимиты запросов и токенов в минуту (token bucket),
+ограничение одновременных запросов (лишние ждут в очереди, а не падают) и повторы
+при 429/5xx/сетевых ошибках с экспоненциальной задержкой и разбросом; Retry-After
+из ответа сервера учитывается и приостанавливает отправку всех запросов.
+
+Лимиты — в config (OPENAI_RPM_LIMIT, OPENAI_TPM_LIMIT, OPENAI_MAX_IN_FLIGHT, ...).
+Токены резервируются по оценке до запроса (промпт + max_tokens) и уточняются
+по usage ответа (settle); неудачная попытка возвращает свой резерв.
+Глубина очереди и время ожидания — в stats().
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from email.utils import parsedate_to_datetime
+from typing import Any, TypeVar
+
+from config import (
+    OPENAI_MAX_IN_FLIGHT,
+    OPENAI_MAX_RETRIES,
+    OPENAI_RETRY_BASE_SECONDS,
+    OPENAI_RETRY_MAX_SECONDS,
+    OPENAI_RPM_LIMIT,
+    OPENAI_TPM_LIMIT,
+)
+import metrics
+from percentiles import summarize
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Коды ответа, при которых запрос имеет смысл повторить
+_RETRYABLE_STATUSES = {408, 409, 429}
+_WAIT_SAMPLES = 1000
+
+
+class TokenBucket:
+    """
+    Ведро на rate_per_minute единиц в минуту. reserve() списывает сразу (баланс может
+    уйти в минус) и возвращает, сколько секунд подождать: очередь обслуживается по порядку.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None) -> None:
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._balance = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._balance = min(self.capacity, self._balance + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        self._refill(now)
+        self._balance -= min(amount, self.capacity)
+        return 0.0 if self._balance >= 0 else -self._balance / self.rate
+
+    def refund(self, amount: float) -> None:
+        self._balance = min(self.capacity, self._balance + amount)
+
+
+def retry_after_seconds(error: Exception) -> float | None:
+    """Задержка из заголовков retry-after-ms / retry-after ответа (секунды или HTTP-дата)."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    raw_ms = headers.get("retry-after-ms")
+    if raw_ms:
+        try:
+            return max(0.0, float(raw_ms) / 1000)
+        except ValueError:
+            pass
+    raw = headers.get("retry-after")
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(raw).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """429, 5xx, 408/409 и сетевые ошибки (в том числе таймаут) — повторяем; остальное — нет."""
+    from openai import APIConnectionError, APIStatusError  # к этому моменту SDK уже загружен клиентом
+
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in _RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+class RequestScheduler:
+    """
+    Общий для процесса планировщик. run()/arun() выполняют вызов с повторами;
+    open_stream()/aopen_stream() — то же для потоковых ответов, место в лимите
+    одновременных запросов держится до вызова release().
+    Лимит 0 — без ограничения.
+    """
+
+    def __init__(
+        self,
+        rpm: int = OPENAI_RPM_LIMIT,
+        tpm: int = OPENAI_TPM_LIMIT,
+        max_in_flight: int = OPENAI_MAX_IN_FLIGHT,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        base_delay: float = OPENAI_RETRY_BASE_SECONDS,
+        max_delay: float = OPENAI_RETRY_MAX_SECONDS,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._lock = threading.Lock()
+        self._rpm = TokenBucket(rpm) if rpm > 0 else None
+        self._tpm = TokenBucket(tpm) if tpm > 0 else None
+        self._paused_until = 0.0
+        # Слоты одновременных запросов: отдельно для потоков и для event loop
+        self._thread_slots = threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        self._async_slots: asyncio.Semaphore | None = None
+        self._async_loop: asyncio.AbstractEventLoop | None = None
+        self._rng = random.Random()
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self._waits: deque[float] = deque(maxlen=_WAIT_SAMPLES)
+
+    @property
+    def limits_tokens(self) -> bool:
+        """Нужна ли оценка токенов запроса (задан OPENAI_TPM_LIMIT)."""
+        return self._tpm is not None
+
+    # ---------- Очередь ----------
+
+    def _enter_queue(self) -> float:
+        with self._lock:
+            self.queue_depth += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        return time.monotonic()
+
+    def _leave_queue(self, entered: float) -> None:
+        waited = time.monotonic() - entered
+        with self._lock:
+            self.queue_depth -= 1
+            self.in_flight += 1
+            self.requests += 1
+            self._waits.append(waited)
+        metrics.observe("openai_queue_wait", waited)
+
+    def _reserve(self, tokens: int) -> float:
+        """Резервирует запрос и токены в вёдрах; возвращает, сколько ждать до отправки."""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self._paused_until - now)
+            if self._rpm is not None:
+                wait = max(wait, self._rpm.reserve(1, now))
+            if self._tpm is not None and tokens > 0:
+                wait = max(wait, self._tpm.reserve(tokens, now))
+            return wait
+
+    def _async_semaphore(self) -> asyncio.Semaphore | None:
+        if self.max_in_flight <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._async_slots is None or self._async_loop is not loop:
+            self._async_slots = asyncio.Semaphore(self.max_in_flight)
+            self._async_loop = loop
+        return self._async_slots
+
+    def _acquire(self, tokens: int) -> Callable[[], None]:
+        entered = self._enter_queue()
+        try:
+            if self._thread_slots is not None:
+                self._thread_slots.acquire()
+            try:
+                wait = self._reserve(tokens)
+                if wait > 0:
+                    time.sleep(wait)
+            except BaseException:
+                self._refund(tokens)
+                if self._thread_slots is not None:
+                    self._thread_slots.release()
+                raise
+        except BaseException:
+            with self._lock:
+                self.queue_depth -= 1
+            raise
+        self._leave_queue(entered)
+        return self._release_thread_slot
+
+    async def _aacquire(self, tokens: int) -> Callable[[], None]:
+        entered = self._enter_queue()
+        semaphore = self._async_semaphore()
+        try:
+            if semaphore is not None:
+                await semaphore.acquire()
+            try:
+                wait = self._reserve(tokens)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            except BaseException:
+                # Отмена во время ожидания — резерв токенов возвращается в ведро
+                self._refund(tokens)
+                if semaphore is not None:
+                    semaphore.release()
+                raise
+        except BaseException:
+            with self._lock:
+                self.queue_depth -= 1
+            raise
+        self._leave_queue(entered)
+
+        def release() -> None:
+            with self._lock:
+                self.in_flight -= 1
+            if semaphore is not None:
+                semaphore.release()
+
+        return release
+
+    def _release_thread_slot(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        if self._thread_slots is not None:
+            self._thread_slots.release()
+
+    # ---------- Повторы ----------
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float | None:
+        """Задержка перед повтором или None, если повторять не нужно."""
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        # «Полный разброс»: равномерно от 0 до экспоненциальной границы
+        delay = self._rng.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        with self._lock:
+            self.retries += 1
+            if getattr(error, "status_code", None) == 429:
+                self.rate_limited += 1
+                retry_after = retry_after_seconds(error)
+                if retry_after is not None:
+                    delay = max(delay, min(retry_after, self.max_delay))
+                    # Лимит общий для ключа — притормаживаем и остальные запросы
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning("Запрос к OpenAI не удался (%s), повтор %s через %.2f с", error, attempt + 1, delay)
+        return delay
+
+    def _failed_attempt(
+        self, error: Exception, attempt: int, tokens: int, handled: Callable[[Exception], bool] | None
+    ) -> float | None:
+        """
+        Неудачная попытка: токены резерва возвращаются в ведро (повтор резервирует их заново),
+        затем — задержка повтора. Без повтора ошибка считается отказом, кроме тех,
+        что вызывающий обработает сам (handled — например, модель не принимает temperature).
+        """
+        self._refund(tokens)
+        delay = self._retry_delay(error, attempt)
+        if delay is None and not (handled is not None and handled(error)):
+            with self._lock:
+                self.failures += 1
+        return delay
+
+    def _refund(self, tokens: int) -> None:
+        if self._tpm is None or tokens <= 0:
+            return
+        with self._lock:
+            self._tpm.refund(tokens)
+
+    def run(
+        self, fn: Callable[[], T], tokens: int = 0, handled: Callable[[Exception], bool] | None = None
+    ) -> T:
+        """Выполняет fn() в рамках лимитов, повторяя при временных ошибках."""
+        result, release = self.open_stream(fn, tokens, handled)
+        release()
+        return result
+
+    def open_stream(
+        self, fn: Callable[[], T], tokens: int = 0, handled: Callable[[Exception], bool] | None = None
+    ) -> tuple[T, Callable[[], None]]:
+        """Как run(), но слот остаётся занят до вызова release() (после чтения потока)."""
+        attempt = 0
+        while True:
+            release = self._acquire(tokens)
+            try:
+                return fn(), release
+            except Exception as e:
+                release()
+                delay = self._failed_attempt(e, attempt, tokens, handled)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def arun(
+        self, fn: Callable[[], Awaitable[T]], tokens: int = 0, handled: Callable[[Exception], bool] | None = None
+    ) -> T:
+        """Асинхронный вариант run(): fn возвращает корутину (вызывается заново на каждую попытку)."""
+        result, release = await self.aopen_stream(fn, tokens, handled)
+        release()
+        return result
+
+    async def aopen_stream(
+        self, fn: Callable[[], Awaitable[T]], tokens: int = 0, handled: Callable[[Exception], bool] | None = None
+    ) -> tuple[T, Callable[[], None]]:
+        """Асинхронный вариант open_stream()."""
+        attempt = 0
+        while True:
+            release = await self._aacquire(tokens)
+            try:
+                return await fn(), release
+            except Exception as e:
+                release()
+                delay = self._failed_attempt(e, attempt, tokens, handled)
+                if delay is None:
+                    raise
+            except BaseException:
+                # Отмена (например, отменённый запасной запрос или отключившийся клиент) —
+                # слот освобождается, резерв токенов возвращается в ведро
+                release()
+                self._refund(tokens)
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def settle(self, reserved_tokens: int, used_tokens: int) -> None:
+        """Возвращает в ведро токенов разницу между оценкой и фактическим usage ответа."""
+        if reserved_tokens > 0:
+            self._refund(reserved_tokens - used_tokens)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            waits = list(self._waits)
+            return {
+                "in_flight": self.in_flight,
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "requests": self.requests,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "failures": self.failures,
+                "wait_s": summarize(waits),
+            }
+
+
+_scheduler: RequestScheduler | None = None
+
+
+def get_request_scheduler() -> RequestScheduler:
+    """Общий планировщик процесса (лимиты из config)."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler()
+    return _scheduler
+
+
+def configure_request_scheduler(**kwargs: Any) -> RequestScheduler:
+    """Заменяет общий планировщик (другие лимиты) — например, для нагрузочных тестов."""
+    global _scheduler
+    _scheduler = RequestScheduler(**kwargs)
+    return _scheduler
+
+
+def _collect_metrics() -> dict[str, float]:
+    if _scheduler is None:
+        return {}
+    stats = _scheduler.stats()
+    return {
+        "openai_in_flight": stats["in_flight"],
+        "openai_queue_depth": stats["queue_depth"],
+        "openai_requests_total": stats["requests"],
+        "openai_retries_total": stats["retries"],
+        "openai_rate_limited_total": stats["rate_limited"],
+        "openai_failures_total": stats["failures"],
+    }
+
+
+metrics.register_collector("request_scheduler", _collect_metrics)
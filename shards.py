@@ -0,0 +1,354 @@
+"""
+Несколько процессов-обработчиков (python main.py --workers N): один процесс-маршрутизатор
+получает апдейты (long polling или webhook) и раздаёт их N процессам по user_id.
+
+Все апдейты одного пользователя попадают в один процесс (shard_for), поэтому его
+контекст (context_manager), очередь сообщений (KeyedLimiter) и кэши живут в одном месте;
+разбор апдейтов aiogram, контекст, запросы к OpenAI и логирование идут параллельно
+на разных ядрах. Маршрутизатор только читает JSON и перекладывает апдейт в очередь
+процесса (multiprocessing, не больше BOT_WORKER_QUEUE_SIZE): при переполнении webhook
+отвечает 503, а polling не запрашивает новые апдейты, пока место не освободится.
+
+Общие файлы пишутся безопасно из всех процессов: usage.csv/jsonl и homework_results.jsonl —
+под блокировкой файла, SQLite (usage, контекст, кэш ответов) — транзакциями.
+Лимиты OPENAI_* (RPM/TPM, одновременные запросы) и MAX_CONTEXT_USERS действуют в каждом
+процессе отдельно.
+
+Упавший процесс-обработчик маршрутизатор перезапускает (проверка раз в WORKER_CHECK_INTERVAL_SECONDS)
+с новой очередью: старая могла остаться заблокированной упавшим процессом, апдейты из неё
+теряются (их число — "lost" в stats()). Если процесс упал быстрее WORKER_MIN_UPTIME_SECONDS
+после запуска (ошибка настройки, импорта), перезапуск не поможет — маршрутизатор
+останавливается (SIGTERM себе), как при обычной остановке.
+
+Остановка: маршрутизатор перестаёт принимать апдейты и отправляет процессам метку конца;
+каждый дорабатывает свою очередь (не дольше WEBHOOK_DRAIN_TIMEOUT_SECONDS) и закрывает логи.
+SIGINT процессы-обработчики игнорируют — Ctrl+C в терминале получает вся группа,
+а останавливает их маршрутизатор.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from collections.abc import Callable
+from typing import Any
+
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+
+import metrics
+from config import (
+    BOT_WORKER_QUEUE_SIZE,
+    WEBHOOK_DRAIN_TIMEOUT_SECONDS,
+    WEBHOOK_ENQUEUE_TIMEOUT_SECONDS,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_URL,
+    validate_config,
+)
+from model_router import describe_models
+
+logger = logging.getLogger(__name__)
+
+POLLING_TIMEOUT_SECONDS = 30  # long polling getUpdates в маршрутизаторе
+WORKER_CHECK_INTERVAL_SECONDS = 1.0  # как часто маршрутизатор проверяет, живы ли процессы-обработчики
+WORKER_MIN_UPTIME_SECONDS = 30.0  # процесс, упавший быстрее, не перезапускается — бот останавливается
+
+# Поля апдейта, в которых Telegram передаёт пользователя (message.from, poll_answer.user, ...)
+_USER_FIELDS = ("from", "user")
+
+
+def update_user_id(update: dict[str, Any]) -> int:
+    """user_id автора апдейта (для апдейтов без пользователя — id чата, иначе 0)."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        for field in _USER_FIELDS:
+            user = value.get(field)
+            if isinstance(user, dict) and isinstance(user.get("id"), int):
+                return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and isinstance(chat.get("id"), int):
+            return chat["id"]
+    return 0
+
+
+def shard_for(user_id: int, shards: int) -> int:
+    """
+    Номер процесса для пользователя. Остаток от деления, а не hash(): одинаков во всех
+    процессах и между перезапусками (hash строк рандомизирован), id Telegram распределены равномерно.
+    """
+    return user_id % shards
+
+
+class ShardRouter:
+    """
+    Процессы-обработчики и их очереди. Интерфейс как у webhook.UpdateQueue
+    (start / put / drain / stats), поэтому подставляется в webhook.make_app.
+    """
+
+    def __init__(
+        self,
+        shards: int,
+        maxsize: int = BOT_WORKER_QUEUE_SIZE,
+        enqueue_timeout: float | None = WEBHOOK_ENQUEUE_TIMEOUT_SECONDS,
+        worker_init: Callable[[int], None] | None = None,
+    ) -> None:
+        """worker_init(shard) вызывается в процессе-обработчике до импорта bot (настройка путей, заглушек)."""
+        self.shards = max(1, shards)
+        self.maxsize = max(1, maxsize)
+        self.enqueue_timeout = enqueue_timeout
+        self.worker_init = worker_init
+        # spawn: обработчики не наследуют потоки и сокеты маршрутизатора; одинаково на всех ОС
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queues: list[Any] = []
+        self._done: list[Any] = []
+        self._processes: list[Any] = []
+        self.accepted = [0] * self.shards
+        self.lost = [0] * self.shards
+        self.restarts = [0] * self.shards
+        self.rejected = 0
+        self._started: list[float] = [0.0] * self.shards
+        self._watchdog: asyncio.Task | None = None
+
+    def _spawn(self, shard: int) -> Any:
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(shard, self.shards, self._queues[shard], self._done[shard], self.worker_init),
+            name=f"bot-shard-{shard}",
+        )
+        process.start()
+        self._started[shard] = time.monotonic()
+        return process
+
+    def start(self) -> None:
+        """Запускает процессы-обработчики и (внутри цикла событий) проверку, что они живы."""
+        self._queues = [self._ctx.Queue(self.maxsize) for _ in range(self.shards)]
+        # Счётчики доработанных апдейтов пишет только свой обработчик — без блокировки
+        self._done = [self._ctx.Value("q", 0, lock=False) for _ in range(self.shards)]
+        self._processes = [self._spawn(shard) for shard in range(self.shards)]
+        logger.info("Запущено процессов-обработчиков: %s (pid %s)", self.shards, [p.pid for p in self._processes])
+        self._watchdog = asyncio.get_running_loop().create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL_SECONDS)
+            for shard, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                uptime = time.monotonic() - self._started[shard]
+                if uptime < WORKER_MIN_UPTIME_SECONDS:
+                    logger.error(
+                        "Процесс %s завершился с кодом %s через %.1f с после запуска — останавливаем бота",
+                        process.name, process.exitcode, uptime,
+                    )
+                    self._watchdog = None
+                    os.kill(os.getpid(), signal.SIGTERM)
+                    return
+                self._restart(shard, process)
+
+    def _restart(self, shard: int, process: Any) -> None:
+        """Перезапускает упавший процесс с новой очередью (старую мог оставить заблокированной он)."""
+        process.join(0)
+        lost = self.accepted[shard] - self.lost[shard] - self._done[shard].value
+        self.lost[shard] += lost
+        self.restarts[shard] += 1
+        old = self._queues[shard]
+        self._queues[shard] = self._ctx.Queue(self.maxsize)
+        old.cancel_join_thread()
+        old.close()
+        self._processes[shard] = self._spawn(shard)
+        logger.error(
+            "Процесс %s завершился с кодом %s — перезапущен (pid %s), потеряно апдейтов: %s",
+            process.name, process.exitcode, self._processes[shard].pid, lost,
+        )
+
+    async def put(self, update: dict[str, Any]) -> bool:
+        """
+        Передаёт апдейт процессу его пользователя; False — очередь процесса полна
+        дольше enqueue_timeout секунд (None — ждать места сколько угодно).
+        """
+        shard = shard_for(update_user_id(update), self.shards)
+        deadline = None if self.enqueue_timeout is None else time.monotonic() + self.enqueue_timeout
+        while True:
+            try:
+                # Очередь берётся заново: пока ждали места, процесс могли перезапустить с новой
+                self._queues[shard].put_nowait(update)
+                break
+            except queue.Full:
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.rejected += 1
+                    return False
+                await asyncio.sleep(0.01)
+        self.accepted[shard] += 1
+        return True
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT_SECONDS) -> bool:
+        """Отправляет обработчикам метку конца и ждёт, пока они доработают очереди и завершатся."""
+        if self._watchdog is not None:
+            self._watchdog.cancel()
+            self._watchdog = None
+        for target in self._queues:
+            await asyncio.to_thread(target.put, None)
+        deadline = time.monotonic() + timeout + 10  # запас на закрытие клиентов и логов
+        for process in self._processes:
+            await asyncio.to_thread(process.join, max(0.0, deadline - time.monotonic()))
+        drained = True
+        for process in self._processes:
+            if process.is_alive():
+                logger.warning("Процесс %s не завершился за %s с — останавливаем", process.name, timeout)
+                process.terminate()
+                process.join(5)
+                drained = False
+            elif process.exitcode != 0:
+                logger.warning("Процесс %s завершился с кодом %s", process.name, process.exitcode)
+                drained = False
+        for target in self._queues:
+            target.close()
+        self._processes = []
+        return drained
+
+    def stats(self) -> dict[str, Any]:
+        done = [value.value for value in self._done]
+        return {
+            "shards": self.shards,
+            "accepted": sum(self.accepted),
+            "rejected": self.rejected,
+            "processed": sum(done),
+            "failed": 0,  # ошибки обработки считаются внутри процессов (лог, метрики)
+            "lost": sum(self.lost),
+            "restarts": sum(self.restarts),
+            "queue_depth": sum(a - lost - d for a, lost, d in zip(self.accepted, self.lost, done)),
+            "per_shard": [
+                {"accepted": a, "processed": d, "restarts": r, "alive": p.is_alive()}
+                for a, d, r, p in zip(self.accepted, done, self.restarts, self._processes)
+            ],
+        }
+
+
+# ---------- Процесс-обработчик ----------
+
+def _worker_main(
+    shard: int,
+    shards: int,
+    updates: Any,
+    done: Any,
+    worker_init: Callable[[int], None] | None,
+) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if worker_init is not None:
+        worker_init(shard)
+    asyncio.run(_serve_shard(shard, shards, updates, done))
+
+
+def _forward(updates: Any, loop: asyncio.AbstractEventLoop, local: Any, stopped: asyncio.Event) -> None:
+    """Поток: из очереди multiprocessing в очередь цикла событий (ждёт, пока в ней есть место)."""
+    while True:
+        update = updates.get()
+        if update is None:
+            loop.call_soon_threadsafe(stopped.set)
+            return
+        asyncio.run_coroutine_threadsafe(local.put(update), loop).result()
+
+
+async def _serve_shard(shard: int, shards: int, updates: Any, done: Any) -> None:
+    from bot import close_resources, dp, get_bot
+    from webhook import UpdateQueue
+
+    bot = get_bot()
+
+    async def handle(update: dict[str, Any]) -> None:
+        try:
+            await dp.feed_raw_update(bot, update)
+        finally:
+            done.value += 1
+
+    metrics.start_exporters(shard=shard)
+    local = UpdateQueue(handle, maxsize=BOT_WORKER_QUEUE_SIZE, enqueue_timeout=None)
+    local.start()
+    await dp.emit_startup(bot=bot)
+    stopped = asyncio.Event()
+    reader = threading.Thread(
+        target=_forward, args=(updates, asyncio.get_running_loop(), local, stopped),
+        name=f"shard-{shard}-reader", daemon=True,
+    )
+    reader.start()
+    logger.info("Обработчик %s/%s запущен (pid %s)", shard + 1, shards, os.getpid())
+    try:
+        await stopped.wait()
+    finally:
+        await local.drain()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        await close_resources()
+        logger.info("Обработчик %s/%s остановлен, апдейтов: %s", shard + 1, shards, local.stats()["processed"])
+
+
+# ---------- Маршрутизатор ----------
+
+async def _poll(router: ShardRouter) -> None:
+    """
+    getUpdates напрямую через HTTP: апдейты нужны маршрутизатору как JSON, разбирать их
+    в объекты aiogram здесь незачем — это работа процессов-обработчиков.
+    """
+    from bot import dp, get_bot
+
+    bot = get_bot()
+    url = bot.session.api.api_url(token=bot.token, method="getUpdates")
+    allowed_updates = dp.resolve_used_update_types()
+    offset: int | None = None
+    async with ClientSession(timeout=ClientTimeout(total=POLLING_TIMEOUT_SECONDS + 10)) as session:
+        while True:
+            params: dict[str, Any] = {"timeout": POLLING_TIMEOUT_SECONDS, "allowed_updates": allowed_updates}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with session.post(url, json=params) as resp:
+                    data = await resp.json()
+            except (ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning("getUpdates: %s — повтор через 1 с", e)
+                await asyncio.sleep(1)
+                continue
+            if not data.get("ok"):
+                logger.warning("getUpdates: %s — повтор через 1 с", data.get("description"))
+                await asyncio.sleep(1)
+                continue
+            for update in data["result"]:
+                await router.put(update)
+                offset = update["update_id"] + 1
+
+
+async def _run_polling(router: ShardRouter) -> None:
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    if task is not None and os.name != "nt":
+        loop.add_signal_handler(signal.SIGTERM, task.cancel)
+    router.start()
+    try:
+        await _poll(router)
+    finally:
+        logger.info("Остановка: дорабатываем очереди процессов")
+        await router.drain()
+
+
+def run_sharded(mode: str, workers: int, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT) -> None:
+    """Запускает маршрутизатор (mode "polling" или "webhook") и workers процессов-обработчиков."""
+    validate_config()
+    logger.info("Бот запущен (%s, процессов-обработчиков: %s), модель: %s", mode, workers, describe_models())
+    metrics.start_exporters()
+    if mode == "webhook":
+        from bot import dp, get_bot
+        from webhook import make_app
+
+        if not WEBHOOK_URL:
+            logger.info("WEBHOOK_URL не задан: setWebhook не вызывается (локальный режим)")
+        logger.info("Webhook: http://%s:%s%s", host, port, WEBHOOK_PATH)
+        web.run_app(make_app(get_bot(), dp, ShardRouter(workers)), host=host, port=port, print=None)
+    else:
+        try:
+            asyncio.run(_run_polling(ShardRouter(workers, enqueue_timeout=None)))
+        except KeyboardInterrupt:
+            pass
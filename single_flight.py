@@ -0,0 +1,135 @@
+"""
+Объединение одинаковых запросов в полёте (single-flight).
+
+Если несколько пользователей одновременно запускают один и тот же промпт ДЗ, запросы
+к модели совпадают полностью (model, messages, temperature, max_tokens — ключ
+completion_cache.make_cache_key). Первый вызов с ключом (ведущий) делает запрос,
+остальные, пришедшие до его завершения, ждут и получают тот же результат или ту же
+ошибку. После завершения ключ освобождается — это не кэш: следующий запрос снова идёт
+к модели (для хранения ответов — completion_cache).
+
+Асинхронный запрос выполняется отдельной задачей: отмена одного из ожидающих
+(например, ведущего) не прерывает запрос для остальных.
+"""
+import asyncio
+import threading
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+
+class _Call:
+    """Синхронный запрос в полёте: ожидающие потоки ждут done."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    run(key, fn) / await arun(key, fn) -> (результат, shared): shared=True, если результат
+    получен от чужого запроса с тем же ключом (свой вызов fn не делался).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        # Задачи привязаны к event loop: ключ — (id цикла, ключ запроса)
+        self._tasks: dict[tuple[int, str], asyncio.Future] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def run(self, key: str, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Синхронный вариант (запросы из нескольких потоков)."""
+        with self._lock:
+            call = self._calls.get(key)
+            shared = call is not None
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+        if shared:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    async def arun(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        """Асинхронный вариант: fn() выполняется задачей, общей для всех ожидающих."""
+        slot = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(slot)
+        shared = task is not None
+        if task is None:
+            task = self._tasks[slot] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(slot, done))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task), shared
+
+    def _finish(self, slot: tuple[int, str], task: asyncio.Future) -> None:
+        self._tasks.pop(slot, None)
+        if not task.cancelled():
+            task.exception()  # ошибку получили ожидающие; если их не осталось — не логировать как потерянную
+
+    def in_flight(self) -> int:
+        return len(self._calls) + len(self._tasks)
+
+    def stats(self) -> dict[str, Any]:
+        calls = self.leaders + self.followers
+        return {
+            "leaders": self.leaders,
+            "followers": self.followers,
+            "shared_rate": self.followers / calls if calls else 0.0,
+            "in_flight": self.in_flight(),
+        }
+
+
+_single_flight: SingleFlight | None = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Общий объект процесса для запросов к OpenAI."""
+    global _single_flight
+    if _single_flight is None:
+        _single_flight = SingleFlight()
+    return _single_flight
+
+
+def configure_single_flight() -> SingleFlight:
+    """Заменяет общий объект (сброс счётчиков) — например, для прогонов и бенчмарков."""
+    global _single_flight
+    _single_flight = SingleFlight()
+    return _single_flight
+
+
+def _collect_metrics() -> dict[str, float]:
+    if _single_flight is None:
+        return {}
+    stats = _single_flight.stats()
+    return {
+        "openai_coalesced_leaders_total": stats["leaders"],
+        "openai_coalesced_followers_total": stats["followers"],
+        "openai_coalesced_in_flight": stats["in_flight"],
+    }
+
+
+metrics.register_collector("single_flight", _collect_metrics)
@@ -0,0 +1,167 @@
+"""
+Отчёт о времени запуска: python main.py --profile-startup, python cli.py --profile-startup
+(остальные аргументы — как при обычном запуске, например --webhook или batch).
+
+Точка входа проходится заново в дочернем процессе с python -X importtime: импорт модуля,
+проверка конфига, импорт bot.py / webhook.py, создание Bot и клиента OpenAI — без сети,
+без polling и без ввода. Печатается общее время, время этапов (ошибка этапа, например
+не заданный BOT_TOKEN, показывается и не прерывает отчёт), самые дорогие пакеты с учётом
+вложенных импортов и модули по собственному времени импорта.
+"""
+import importlib
+import json
+import sys
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+_MARKER = "STARTUP_PROFILE "  # строка с JSON этапов в stdout дочернего процесса
+_TOP = 12  # строк в таблицах пакетов и модулей
+
+Phase = tuple[str, Callable[[], Any]]
+
+
+def _import(name: str) -> Callable[[], Any]:
+    return lambda: importlib.import_module(name)
+
+
+def _main_phases(argv: list[str]) -> list[Phase]:
+    import main
+    from config import BOT_MODE, validate_config
+
+    args = main.parse_args(argv)
+    mode = args.mode or BOT_MODE
+    phases: list[Phase] = [("validate_config", validate_config)]
+    if args.workers > 1:
+        phases.append(("import shards", _import("shards")))
+    if mode == "webhook":
+        phases.append(("import webhook", _import("webhook")))
+    phases += [
+        ("import bot (aiogram, обработчики)", _import("bot")),
+        ("Bot()", lambda: importlib.import_module("bot").get_bot()),
+        ("клиент OpenAI (SDK)", lambda: importlib.import_module("openai_client")._get_async_client()),
+    ]
+    return phases
+
+
+def _cli_phases(argv: list[str]) -> list[Phase]:
+    import cli
+    from config import validate_config_openai
+
+    args = cli.parse_args(argv)
+    if args.command == "usage-report":
+        return [("import usage_report", _import("usage_report"))]
+    phases: list[Phase] = [("validate_config_openai", validate_config_openai)]
+    if args.command == "batch":
+        phases.append(("import homework_batch", _import("homework_batch")))
+    phases += [
+        ("контекст (select_context)", lambda: cli.select_context(cli.CLI_USER_ID)),
+        ("клиент OpenAI (SDK)", lambda: importlib.import_module("openai_client")._get_client()),
+    ]
+    return phases
+
+
+_ENTRY_POINTS: dict[str, Callable[[list[str]], list[Phase]]] = {"main": _main_phases, "cli": _cli_phases}
+
+
+def _run_phase(name: str, fn: Callable[[], Any], phases: list[dict[str, Any]]) -> None:
+    start = time.perf_counter()
+    error = ""
+    try:
+        fn()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    phases.append({"name": name, "seconds": time.perf_counter() - start, "error": error})
+
+
+def _child(entry: str, argv: list[str], spawned_at: float) -> None:
+    """Дочерний процесс: этапы запуска точки входа entry ("main" или "cli"), JSON — в stdout."""
+    phases = [{"name": "интерпретатор", "seconds": time.time() - spawned_at, "error": ""}]
+    steps: list[Phase] = []
+    _run_phase(f"import {entry}", lambda: steps.extend(_ENTRY_POINTS[entry](argv)), phases)
+    for name, fn in steps:
+        _run_phase(name, fn, phases)
+    print(_MARKER + json.dumps(phases, ensure_ascii=False), flush=True)
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """Строки -X importtime -> [(модуль, собственное мкс, с вложенными мкс)] в порядке импорта."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # заголовок таблицы
+        rows.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+    return rows
+
+
+def profile(entry: str, argv: list[str]) -> dict[str, Any]:
+    """Запускает этапы точки входа в отдельном процессе с -X importtime и собирает отчёт."""
+    import subprocess
+
+    code = f"import startup_profile; startup_profile._child({entry!r}, {argv!r}, {time.time()!r})"
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=Path(__file__).resolve().parent,
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    phases = []
+    for line in proc.stdout.splitlines():
+        if line.startswith(_MARKER):
+            phases = json.loads(line[len(_MARKER):])
+    if proc.returncode != 0 or not phases:
+        tail = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError("профилирование запуска не удалось:\n" + "\n".join(tail[-20:]))
+    rows = parse_importtime(proc.stderr)
+    packages: dict[str, int] = {}
+    for name, _, cumulative in rows:
+        if "." not in name:
+            packages[name] = max(packages.get(name, 0), cumulative)
+    return {
+        "entry": entry,
+        "argv": argv,
+        "wall_seconds": wall,
+        "import_seconds": sum(own for _, own, _ in rows) / 1e6,
+        "modules_imported": len(rows),
+        "phases": phases,
+        "packages": sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:_TOP],
+        "modules": sorted(((name, own) for name, own, _ in rows), key=lambda kv: kv[1], reverse=True)[:_TOP],
+    }
+
+
+def format_report(report: dict[str, Any]) -> str:
+    names = [p["name"] for p in report["phases"]] + [n for n, _ in report["packages"] + report["modules"]]
+    width = max(map(len, names), default=0) + 2
+    lines = [
+        f"Запуск: python {report['entry']}.py {' '.join(report['argv'])}".rstrip(),
+        f"Всего: {report['wall_seconds'] * 1000:.0f} мс, из них импорт {report['modules_imported']} модулей "
+        f"{report['import_seconds'] * 1000:.0f} мс",
+        "",
+        "Этапы:",
+    ]
+    for phase in report["phases"]:
+        line = f"  {phase['name']:<{width}} {phase['seconds'] * 1000:8.1f} мс"
+        if phase["error"]:
+            line += f"  ошибка: {phase['error']}"
+        lines.append(line)
+    lines += ["", "Пакеты (с вложенными импортами):"]
+    lines += [f"  {name:<{width}} {us / 1000:8.1f} мс" for name, us in report["packages"]]
+    lines += ["", "Модули (собственное время импорта):"]
+    lines += [f"  {name:<{width}} {us / 1000:8.1f} мс" for name, us in report["modules"]]
+    return "\n".join(lines)
+
+
+def print_report(entry: str, argv: list[str]) -> None:
+    """Обработчик флага --profile-startup: argv — аргументы точки входа без этого флага."""
+    try:
+        report = profile(entry, argv)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    print(format_report(report))
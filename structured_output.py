@@ -0,0 +1,245 @@
+"""
+Проверка и дешёвое исправление JSON-ответов модели для промптов ДЗ.
+
+Схема берётся из шаблона в поле "format" промпта (prompts.json), например
+{"title": "...", "steps": ["...", "..."], "notes": ["...", "..."]}: ключи и типы значений.
+Ответ сначала исправляется локально, без запроса к модели:
+- fences — снимаются ```json ... ```;
+- extracted — берётся первый сбалансированный объект {...} (текст до и после отбрасывается);
+- trailing_commas — убираются запятые перед } и ];
+- coerced — строка вместо списка строк оборачивается в список, числа в списке строк — в строки.
+Повторный запрос к модели — только если локально исправить не удалось, и не чаще бюджета
+повторов (STRUCTURED_OUTPUT_MAX_RETRIES на прогон, STRUCTURED_OUTPUT_RETRY_BUDGET от числа
+прогонов). repair_stats() — доля ответов, исправленных локально, повторов и неудач.
+"""
+import json
+import re
+import threading
+from typing import Any
+
+import metrics
+from config import STRUCTURED_OUTPUT_MAX_RETRIES, STRUCTURED_OUTPUT_RETRY_BUDGET
+
+# Первые повторы разрешены, пока прогонов мало и доля от них ещё меньше одного
+_RETRY_BUDGET_FLOOR = 3
+_FENCE_RE = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)\n?\s*```", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_MAX_ECHO_CHARS = 4000  # сколько неверного ответа возвращать модели в запросе исправления
+
+
+class StructuredOutput:
+    """Результат разбора: value (dict или None), errors (пусто — ответ валиден), repairs (что исправлено)."""
+
+    __slots__ = ("value", "errors", "repairs")
+
+    def __init__(self, value: dict[str, Any] | None, errors: list[str], repairs: list[str]) -> None:
+        self.value = value
+        self.errors = errors
+        self.repairs = repairs
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+def first_balanced_object(text: str) -> str | None:
+    """Первый сбалансированный объект {...} в тексте (скобки внутри строк не считаются)."""
+    start = text.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch == "{":
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
+
+
+def schema_from_format(fmt: str) -> dict[str, Any] | None:
+    """
+    Схема из шаблона JSON в тексте "format": ключ -> тип значения (str, list, dict, ...),
+    для списков — ("list", тип элементов). None — шаблона нет (годится любой объект).
+    """
+    candidate = first_balanced_object(fmt or "")
+    if candidate is None:
+        return None
+    try:
+        template = json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(template, dict) or not template:
+        return None
+    schema: dict[str, Any] = {}
+    for key, sample in template.items():
+        if isinstance(sample, list):
+            schema[key] = ("list", type(sample[0]) if sample else None)
+        else:
+            schema[key] = type(sample)
+    return schema
+
+
+def _loads_object(text: str) -> dict[str, Any] | None:
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def _extract(text: str, repairs: list[str]) -> dict[str, Any] | None:
+    text = text.strip()
+    value = _loads_object(text)
+    if value is not None:
+        return value
+    fenced = _FENCE_RE.search(text)
+    if fenced:
+        repairs.append("fences")
+        text = fenced.group(1).strip()
+        value = _loads_object(text)
+        if value is not None:
+            return value
+    candidate = first_balanced_object(text)
+    if candidate is None:
+        return None
+    if candidate != text:
+        repairs.append("extracted")
+        value = _loads_object(candidate)
+        if value is not None:
+            return value
+    fixed = _TRAILING_COMMA_RE.sub(r"\1", candidate)
+    if fixed != candidate:
+        repairs.append("trailing_commas")
+        return _loads_object(fixed)
+    return None
+
+
+def _check(value: dict[str, Any], schema: dict[str, Any], repairs: list[str]) -> list[str]:
+    errors = []
+    for key, expected in schema.items():
+        if key not in value:
+            errors.append(f"нет ключа {key!r}")
+            continue
+        item = value[key]
+        if isinstance(expected, tuple):
+            item_type = expected[1]
+            if isinstance(item, str) and item_type is str:
+                value[key] = [item]
+                repairs.append("coerced")
+                continue
+            if not isinstance(item, list):
+                errors.append(f"{key!r} должен быть списком")
+                continue
+            if item_type is str and any(not isinstance(x, str) for x in item):
+                if all(isinstance(x, (str, int, float)) and not isinstance(x, bool) for x in item):
+                    value[key] = [str(x) for x in item]
+                    repairs.append("coerced")
+                else:
+                    errors.append(f"элементы {key!r} должны быть строками")
+        elif not isinstance(item, expected):
+            errors.append(f"{key!r} должен быть {expected.__name__}")
+    return errors
+
+
+def parse_structured(text: str, schema: dict[str, Any] | None) -> StructuredOutput:
+    """Извлекает JSON-объект из ответа модели, исправляет локально и проверяет по схеме."""
+    repairs: list[str] = []
+    value = _extract(text, repairs)
+    if value is None:
+        return StructuredOutput(None, ["ответ не содержит JSON-объекта"], repairs)
+    errors = _check(value, schema, repairs) if schema else []
+    return StructuredOutput(value, errors, list(dict.fromkeys(repairs)))
+
+
+def repair_messages(messages: list[dict[str, Any]], text: str, outcome: StructuredOutput) -> list[dict[str, Any]]:
+    """Сообщения повторного запроса: исходные + неверный ответ + что именно не так."""
+    return [
+        *messages,
+        {"role": "assistant", "content": text[:_MAX_ECHO_CHARS]},
+        {
+            "role": "user",
+            "content": (
+                f"Ответ не прошёл проверку формата: {'; '.join(outcome.errors)}. "
+                "Верни только один JSON-объект в формате из инструкции, без текста до или после."
+            ),
+        },
+    ]
+
+
+# ---------- Бюджет повторов и статистика ----------
+
+_stats = {"runs": 0, "valid": 0, "repaired": 0, "retries": 0, "retried_ok": 0, "failed": 0, "budget_exhausted": 0}
+_stats_lock = threading.Lock()
+
+
+def retry_allowed(attempt: int) -> bool:
+    """
+    Можно ли повторить запрос к модели (attempt — номер повтора в прогоне, с 1).
+    Повтор сразу списывается из бюджета.
+    """
+    if attempt > STRUCTURED_OUTPUT_MAX_RETRIES:
+        return False
+    with _stats_lock:
+        if _stats["retries"] >= STRUCTURED_OUTPUT_RETRY_BUDGET * _stats["runs"] + _RETRY_BUDGET_FLOOR:
+            _stats["budget_exhausted"] += 1
+            return False
+        _stats["retries"] += 1
+    return True
+
+
+def record_outcome(outcome: StructuredOutput, retries: int) -> None:
+    """Учитывает итог прогона: валиден сразу, исправлен локально, после повтора или не удался."""
+    with _stats_lock:
+        _stats["runs"] += 1
+        if not outcome.ok:
+            _stats["failed"] += 1
+        elif retries:
+            _stats["retried_ok"] += 1
+        elif outcome.repairs:
+            _stats["repaired"] += 1
+        else:
+            _stats["valid"] += 1
+
+
+def repair_stats() -> dict[str, Any]:
+    """Счётчики и доли: repaired_rate — исправлено локально, retry_rate — повторов на прогон."""
+    with _stats_lock:
+        stats: dict[str, Any] = dict(_stats)
+    runs = stats["runs"]
+    stats["repaired_rate"] = stats["repaired"] / runs if runs else 0.0
+    stats["retry_rate"] = stats["retries"] / runs if runs else 0.0
+    stats["failed_rate"] = stats["failed"] / runs if runs else 0.0
+    return stats
+
+
+def reset_repair_stats() -> None:
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+
+def _collect_metrics() -> dict[str, float]:
+    with _stats_lock:
+        return {
+            "structured_output_runs_total": _stats["runs"],
+            "structured_output_repaired_total": _stats["repaired"],
+            "structured_output_retries_total": _stats["retries"],
+            "structured_output_failed_total": _stats["failed"],
+        }
+
+
+metrics.register_collector("structured_output", _collect_metrics)
@@ -0,0 +1,484 @@
+"""
+Отправка ответов в Telegram: деление длинного текста на части и очередь отправки на чат.
+
+split_message() делит текст на части не длиннее TELEGRAM_MESSAGE_LIMIT (в единицах UTF-16,
+как считает Telegram): по абзацам, строкам, предложениям, словам. Блок кода ``` не
+разрывается молча: если часть кончается внутри блока, он закрывается и открывается заново
+(с тем же языком) в следующей части. Для parse_mode="Markdown" граница не ставится внутри
+*жирного*, _курсива_ и `кода`, чтобы Telegram смог разобрать разметку каждой части.
+
+ChatSender — очередь сообщений на чат с фоновой отправкой по порядку:
+- лимиты Telegram: общий (TELEGRAM_GLOBAL_RATE_PER_SECOND) и на чат
+  (TELEGRAM_CHAT_RATE_PER_MINUTE, для групп — TELEGRAM_GROUP_RATE_PER_MINUTE) — ведра токенов,
+  правки сообщений расходуют те же токены;
+- 429 (TelegramRetryAfter): чат ставится на паузу retry_after, сообщение отправляется повторно;
+- сообщения, скопившиеся в очереди чата, уходят одним (если вместе укладываются в лимит и
+  у них один parse_mode), статус, за которым в очереди уже есть новый статус, не отправляется;
+- не разобранная разметка (can't parse entities) — повтор той же части без parse_mode.
+Ошибки отправки логируются, а не пробрасываются: submit()/send() возвращают отправленное
+сообщение или None.
+"""
+import asyncio
+import bisect
+import logging
+import re
+import time
+from collections import deque
+from typing import Any
+
+import metrics
+from config import (
+    TELEGRAM_CHAT_BURST,
+    TELEGRAM_CHAT_RATE_PER_MINUTE,
+    TELEGRAM_GLOBAL_RATE_PER_SECOND,
+    TELEGRAM_GROUP_RATE_PER_MINUTE,
+    TELEGRAM_MESSAGE_LIMIT,
+    TELEGRAM_SEND_MAX_RETRIES,
+)
+from request_scheduler import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+_FENCE = "```"
+_FENCE_CLOSE = "\n```"
+# Где резать, по убыванию предпочтения; часть короче половины лимита не делаем
+_SEPARATORS = ("\n\n", "\n", ". ", " ")
+_MARKUP = re.compile(r"[*_`\\]")  # inline-разметка Markdown (legacy) и экранирование
+_JOINER = "\n\n"  # между сообщениями, объединёнными в очереди
+_PRUNE_CHATS = 1024  # сколько чатов держать до чистки простаивающих
+_IDLE_SECONDS = 60.0  # за это время ведро любого чата успевает наполниться
+
+
+# ---------- Деление на части ----------
+
+def tg_len(text: str) -> int:
+    """Длина в единицах UTF-16 — так Telegram считает лимит (эмодзи вне BMP — за две)."""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _fit(text: str, budget: int) -> str:
+    """Самое длинное начало text, которое укладывается в budget единиц UTF-16."""
+    prefix = text[:budget]
+    excess = tg_len(prefix) - budget
+    while excess > 0:
+        prefix = prefix[:len(prefix) - excess]
+        excess = tg_len(prefix) - budget
+    return prefix
+
+
+def _scan(text: str, markdown: bool) -> tuple[list[tuple[int, int]], list[tuple[int, int]], str | None]:
+    """
+    Где в text нельзя резать: (marks, fences, открытый блок). Граница e запрещена, если
+    s < e <= t для отрезка (s, t): marks — открытая inline-разметка (только для Markdown),
+    fences — блок кода вместе со строками ```. Третье значение — строка, открывшая
+    блок кода, если он не закрыт к концу text.
+    """
+    marks: list[tuple[int, int]] = []
+    fences: list[tuple[int, int]] = []
+    fence: str | None = None
+    fence_start = mark_start = 0
+    mark = ""  # открытая inline-разметка; в Markdown (legacy) они не вкладываются
+    skip = 0  # символ после \ экранирован
+    pos = 0
+    for line in text.split("\n"):
+        end = pos + len(line)
+        if line.startswith(_FENCE):
+            if fence is None:
+                fence, fence_start = line.strip(), pos
+            else:
+                fences.append((fence_start, end))
+                fence = None
+        elif markdown and fence is None:
+            for found in _MARKUP.finditer(text, pos, end):
+                i = found.start()
+                if i < skip:
+                    continue
+                ch = text[i]
+                if ch == "\\":
+                    if mark != "`":
+                        skip = i + 2
+                elif mark:
+                    if ch == mark:
+                        marks.append((mark_start, i))
+                        mark = ""
+                else:
+                    mark, mark_start = ch, i
+        pos = end + 1
+    if fence is not None:
+        fences.append((fence_start, len(text)))
+    if mark:
+        marks.append((mark_start, len(text)))
+    return marks, fences, fence
+
+
+def _blocked(spans: list[tuple[int, int]], end: int) -> bool:
+    """Попадает ли граница end внутрь одного из отрезков _scan (отрезки не пересекаются)."""
+    i = bisect.bisect_left(spans, (end,)) - 1
+    return i >= 0 and end <= spans[i][1]
+
+
+def _cut(window: str, head: str, markdown: bool) -> tuple[int, int]:
+    """
+    Граница части внутри window (после заголовка head): (конец части, начало остатка).
+    Сначала ищется граница вне блоков кода, затем — внутри (блок будет закрыт и открыт заново).
+    """
+    marks, fences, _ = _scan(head + window, markdown)
+    offset = len(head)
+    floor = len(window) // 2
+    for inside_ok in (False, True):
+        for sep in _SEPARATORS:
+            keep = 1 if sep == ". " else 0  # точка остаётся в части
+            pos = window.rfind(sep)
+            while pos >= floor:
+                end = offset + pos + keep
+                if not _blocked(marks, end) and (inside_ok or not _blocked(fences, end)):
+                    return pos + keep, pos + len(sep)
+                pos = window.rfind(sep, 0, pos)
+    return len(window), len(window)
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT, parse_mode: str | None = None) -> list[str]:
+    """
+    Делит текст на части не длиннее limit без потери символов. Для пустого текста — [].
+    Разметка учитывается для parse_mode "Markdown"/"MarkdownV2"; блоки ``` — всегда.
+    """
+    text = text.strip()
+    markdown = bool(parse_mode) and parse_mode.lower().startswith("markdown")
+    parts: list[str] = []
+    fence: str | None = None  # блок кода, продолжающийся из предыдущей части
+    while text:
+        head = f"{fence}\n" if fence else ""
+        if tg_len(head) + tg_len(text) <= limit:
+            parts.append(head + text)
+            break
+        window = _fit(text, limit - tg_len(head) - len(_FENCE_CLOSE))
+        end, rest = _cut(window, head, markdown)
+        part = head + window[:end].rstrip()
+        fence = _scan(part, False)[2]
+        parts.append(part + _FENCE_CLOSE if fence else part)
+        text = text[rest:].lstrip("\n")
+    return parts
+
+
+# ---------- Очередь отправки ----------
+
+class _Pending:
+    __slots__ = ("message", "text", "parse_mode", "status", "merge", "future")
+
+    def __init__(
+        self,
+        message: Any,
+        text: str,
+        parse_mode: str | None,
+        status: bool,
+        merge: bool,
+        future: asyncio.Future,
+    ) -> None:
+        self.message = message
+        self.text = text
+        self.parse_mode = parse_mode
+        self.status = status
+        self.merge = merge
+        self.future = future
+
+
+class _ChatState:
+    __slots__ = ("pending", "bucket", "paused_until", "last_used", "task")
+
+    def __init__(self, bucket: TokenBucket | None) -> None:
+        self.pending: deque[_Pending] = deque()
+        self.bucket = bucket
+        self.paused_until = 0.0
+        self.last_used = 0.0
+        self.task: asyncio.Task | None = None
+
+
+class ChatSender:
+    """
+    submit(message, text) — в очередь чата message.chat.id (текст делится на части),
+    отправка — message.answer(...) в фоновой задаче чата; await send(...) — дождаться.
+    Части одного вызова и вызовы одного чата уходят в порядке постановки.
+    Лимит 0 — без ограничения.
+    """
+
+    def __init__(
+        self,
+        global_per_second: float = TELEGRAM_GLOBAL_RATE_PER_SECOND,
+        chat_per_minute: float = TELEGRAM_CHAT_RATE_PER_MINUTE,
+        group_per_minute: float = TELEGRAM_GROUP_RATE_PER_MINUTE,
+        burst: int = TELEGRAM_CHAT_BURST,
+        max_retries: int = TELEGRAM_SEND_MAX_RETRIES,
+        limit: int = TELEGRAM_MESSAGE_LIMIT,
+    ) -> None:
+        self.chat_per_minute = chat_per_minute
+        self.group_per_minute = group_per_minute
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.limit = limit
+        self._global = (
+            TokenBucket(global_per_second * 60, capacity=global_per_second) if global_per_second > 0 else None
+        )
+        self._chats: dict[int, _ChatState] = {}
+        self.submitted = 0
+        self.sent = 0
+        self.merged = 0
+        self.dropped_status = 0
+        self.split = 0
+        self.retry_after = 0
+        self.parse_fallbacks = 0
+        self.edits = 0
+        self.edits_skipped = 0
+        self.failed = 0
+
+    def _state(self, chat_id: int) -> _ChatState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            if len(self._chats) >= _PRUNE_CHATS:
+                self._prune()
+            # id групп и каналов отрицательные
+            rate = self.group_per_minute if chat_id < 0 else self.chat_per_minute
+            state = self._chats[chat_id] = _ChatState(
+                TokenBucket(rate, capacity=min(self.burst, rate)) if rate > 0 else None
+            )
+        return state
+
+    def _prune(self) -> None:
+        """Забывает чаты без очереди, в которые давно ничего не отправлялось."""
+        idle_since = time.monotonic() - _IDLE_SECONDS
+        for chat_id in [
+            chat_id for chat_id, state in self._chats.items()
+            if state.task is None and not state.pending and max(state.last_used, state.paused_until) < idle_since
+        ]:
+            del self._chats[chat_id]
+
+    # ---------- Лимиты ----------
+
+    async def _wait_turn(self, state: _ChatState) -> None:
+        """Ждёт паузы после 429, токена чата и общего токена (в таком порядке)."""
+        pause = state.paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+        if state.bucket is not None:
+            delay = state.bucket.reserve(1, time.monotonic())
+            if delay:
+                await asyncio.sleep(delay)
+        if self._global is not None:
+            delay = self._global.reserve(1, time.monotonic())
+            if delay:
+                await asyncio.sleep(delay)
+        state.last_used = time.monotonic()
+
+    def _try_turn(self, state: _ChatState) -> bool:
+        """Токены чата и общий без ожидания; False — лимит исчерпан (ничего не списано)."""
+        now = time.monotonic()
+        if state.paused_until > now:
+            return False
+        if state.bucket is not None and state.bucket.reserve(1, now):
+            state.bucket.refund(1)
+            return False
+        if self._global is not None and self._global.reserve(1, now):
+            self._global.refund(1)
+            if state.bucket is not None:
+                state.bucket.refund(1)
+            return False
+        state.last_used = now
+        return True
+
+    def _pause(self, state: _ChatState, retry_after: float) -> None:
+        self.retry_after += 1
+        state.paused_until = max(state.paused_until, time.monotonic() + retry_after)
+        logger.info("Telegram просит подождать %s с перед отправкой в чат", retry_after)
+
+    # ---------- Отправка ----------
+
+    def submit(
+        self,
+        message: Any,
+        text: str,
+        parse_mode: str | None = None,
+        status: bool = False,
+        merge: bool = True,
+    ) -> asyncio.Future:
+        """
+        Ставит text в очередь чата message и сразу возвращает future отправки последней части
+        (Message или None при ошибке). status=True — служебное сообщение («подожди...»): если
+        к отправке за ним в очереди уже стоит новый статус, оно не отправляется.
+        merge=False — отдельным сообщением (например, заглушка, которую потом правят).
+        """
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+        parts = split_message(text, self.limit, parse_mode)
+        if not parts:
+            future.set_result(None)
+            return future
+        if len(parts) > 1:
+            self.split += 1
+        state = self._state(message.chat.id)
+        for i, part in enumerate(parts):
+            last = i == len(parts) - 1
+            state.pending.append(
+                _Pending(message, part, parse_mode, status and last, merge, future if last else loop.create_future())
+            )
+        self.submitted += len(parts)
+        if state.task is None or state.task.done():
+            state.task = loop.create_task(self._drain(state))
+        return future
+
+    async def send(
+        self,
+        message: Any,
+        text: str,
+        parse_mode: str | None = None,
+        status: bool = False,
+        merge: bool = True,
+    ) -> Any:
+        """submit() и ожидание отправки; заодно — всего, что раньше поставлено в очередь этого чата."""
+        return await self.submit(message, text, parse_mode, status, merge)
+
+    def _take(self, state: _ChatState) -> tuple[list[_Pending], str]:
+        """Следующее сообщение: скопившиеся в очереди подряд объединяются, устаревшие статусы пропускаются."""
+        pending = state.pending
+        batch: list[_Pending] = []
+        text = ""
+        while pending:
+            item = pending[0]
+            if item.status and any(later.status for later in pending if later is not item):
+                pending.popleft()
+                item.future.set_result(None)
+                self.dropped_status += 1
+                continue
+            if batch:
+                combined = text + _JOINER + item.text
+                if (
+                    not (item.merge and batch[0].merge)
+                    or item.parse_mode != batch[0].parse_mode
+                    or tg_len(combined) > self.limit
+                ):
+                    break
+                text = combined
+                self.merged += 1
+            else:
+                text = item.text
+            batch.append(pending.popleft())
+        return batch, text
+
+    async def _drain(self, state: _ChatState) -> None:
+        try:
+            while state.pending:
+                await self._wait_turn(state)
+                batch, text = self._take(state)
+                if batch:
+                    result = await self._deliver(state, batch[0].message, text, batch[0].parse_mode)
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_result(result)
+        finally:
+            state.task = None
+
+    async def _deliver(self, state: _ChatState, message: Any, text: str, parse_mode: str | None) -> Any:
+        from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter  # aiogram уже загружен ботом
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                await self._wait_turn(state)
+            try:
+                with metrics.timer("telegram_send_message"):
+                    sent = await message.answer(text, parse_mode=parse_mode)
+            except TelegramRetryAfter as e:
+                self._pause(state, float(e.retry_after))
+                continue
+            except TelegramBadRequest as e:
+                if parse_mode and "parse" in str(e).lower():
+                    logger.info("Разметка не разобрана (%s) — отправляем без parse_mode", e)
+                    self.parse_fallbacks += 1
+                    parse_mode = None
+                    continue
+                logger.warning("Сообщение в чат %s не отправлено: %s", message.chat.id, e)
+                break
+            except Exception as e:
+                logger.warning("Сообщение в чат %s не отправлено: %s", message.chat.id, e)
+                break
+            self.sent += 1
+            return sent
+        self.failed += 1
+        return None
+
+    async def edit(self, message: Any, text: str, wait: bool = True) -> bool:
+        """
+        Правка сообщения в тех же лимитах. wait=False — пропустить правку, если лимит чата или
+        общий исчерпан (промежуточные правки потокового ответа). False — правка не сделана.
+        """
+        from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+        state = self._state(message.chat.id)
+        text = _fit(text, self.limit)
+        for attempt in range(self.max_retries + 1):
+            if wait:
+                await self._wait_turn(state)
+            elif not self._try_turn(state):
+                self.edits_skipped += 1
+                return False
+            try:
+                await message.edit_text(text)
+            except TelegramRetryAfter as e:
+                self._pause(state, float(e.retry_after))
+                if not wait:
+                    self.edits_skipped += 1
+                    return False
+                continue
+            except TelegramBadRequest as e:
+                # "message is not modified" — текст уже такой
+                logger.debug("Правка сообщения пропущена: %s", e)
+                return "not modified" in str(e)
+            self.edits += 1
+            return True
+        return False
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "merged": self.merged,
+            "dropped_status": self.dropped_status,
+            "split": self.split,
+            "retry_after": self.retry_after,
+            "parse_fallbacks": self.parse_fallbacks,
+            "edits": self.edits,
+            "edits_skipped": self.edits_skipped,
+            "failed": self.failed,
+            "queued": sum(len(state.pending) for state in self._chats.values()),
+            "chats": len(self._chats),
+        }
+
+
+_sender: ChatSender | None = None
+
+
+def get_chat_sender() -> ChatSender:
+    global _sender
+    if _sender is None:
+        _sender = ChatSender()
+    return _sender
+
+
+def configure_chat_sender(**kwargs: Any) -> ChatSender:
+    """Новая очередь отправки с заданными лимитами (для бенчмарков); счётчики — с нуля."""
+    global _sender
+    _sender = ChatSender(**kwargs)
+    return _sender
+
+
+def _collect_metrics() -> dict[str, float]:
+    stats = get_chat_sender().stats() if _sender is not None else {}
+    return {
+        "telegram_messages_sent_total": stats.get("sent", 0),
+        "telegram_messages_merged_total": stats.get("merged", 0),
+        "telegram_status_dropped_total": stats.get("dropped_status", 0),
+        "telegram_retry_after_total": stats.get("retry_after", 0),
+        "telegram_edits_skipped_total": stats.get("edits_skipped", 0),
+        "telegram_send_failed_total": stats.get("failed", 0),
+        "telegram_send_queue_depth": stats.get("queued", 0),
+    }
+
+
+metrics.register_collector("telegram_output", _collect_metrics)
@@ -0,0 +1,13 @@
+"""
+Общие настройки тестов: корень проекта в sys.path (модули лежат плоско, как у бенчмарков)
+и фиктивный ключ OpenAI, чтобы config не требовал .env.
+"""
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
@@ -0,0 +1,89 @@
+"""Кэш ответов: попадания в памяти и в SQLite после перезапуска, без запросов к API."""
+from types import SimpleNamespace
+
+import pytest
+
+import completion_cache
+import model_capabilities
+import openai_client
+import request_scheduler
+from completion_cache import CompletionCache
+from model_capabilities import ModelCapabilities
+from request_scheduler import RequestScheduler
+
+MESSAGES = [{"role": "user", "content": "Что такое LRU?"}]
+
+
+class _Client:
+    """Заглушка API: считает запросы."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs) -> SimpleNamespace:
+        self.calls += 1
+        usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15, prompt_tokens_details=None)
+        message = SimpleNamespace(content=f"ответ {self.calls}")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+@pytest.fixture
+def cached_client(monkeypatch, tmp_path):
+    monkeypatch.setattr(openai_client, "COMPLETION_CACHE_ENABLED", True)
+    monkeypatch.setattr(openai_client, "OPENAI_COALESCE_REQUESTS", False)
+    monkeypatch.setattr(openai_client, "_record_usage", lambda model, temp, usage: None)
+    monkeypatch.setattr(model_capabilities, "_capabilities", ModelCapabilities())
+    scheduler = RequestScheduler(rpm=0, tpm=0, max_in_flight=0, max_retries=0)
+    monkeypatch.setattr(request_scheduler, "_scheduler", scheduler)
+    path = tmp_path / "completion_cache.sqlite3"
+    monkeypatch.setattr(completion_cache, "_cache", CompletionCache(disk_path=path))
+    stub = _Client()
+    monkeypatch.setattr(openai_client, "_get_client", lambda: stub)
+    return stub, path
+
+
+def _ask(model: str = "gpt-4o-mini", temperature: float = 0.2) -> tuple[str, dict[str, int]]:
+    return openai_client.chat_completion(MESSAGES, model=model, temperature=temperature, system_message="")
+
+
+def test_repeat_hits_memory_then_disk_after_restart(cached_client) -> None:
+    client, path = cached_client
+    first, usage = _ask()
+    assert client.calls == 1
+    assert usage["total_tokens"] == 15
+
+    text, usage = _ask()
+    assert (text, usage["total_tokens"]) == (first, 0)
+    stats = completion_cache.get_completion_cache().stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 0, 1)
+
+    # Перезапуск: память пуста, ответ берётся из SQLite
+    completion_cache._cache = CompletionCache(disk_path=path)
+    assert _ask()[0] == first
+    assert _ask()[0] == first
+    stats = completion_cache.get_completion_cache().stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 0)
+    assert stats["hit_rate"] == 1.0
+    assert client.calls == 1
+
+
+def test_other_model_or_temperature_misses(cached_client) -> None:
+    client, _ = cached_client
+    _ask()
+    _ask(model="gpt-4o")
+    _ask(temperature=0.7)
+    assert client.calls == 3
+    stats = completion_cache.get_completion_cache().stats()
+    assert (stats["hits"], stats["misses"]) == (0, 3)
+
+    _ask(model="gpt-4o")
+    _ask(temperature=0.7)
+    assert client.calls == 3
+
+
+def test_use_cache_false_bypasses_cache(cached_client) -> None:
+    client, _ = cached_client
+    openai_client.chat_completion(MESSAGES, system_message="", use_cache=False)
+    openai_client.chat_completion(MESSAGES, system_message="", use_cache=False)
+    assert client.calls == 2
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+import context_manager
+
+
+def _summarizer(previous, messages):
+    return "Пользователя зовут Аня", {"prompt_tokens": 0, "completion_tokens": 0}
+
+
+@pytest.fixture
+def sqlite_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(context_manager, "CONTEXT_MODE", "messages")
+    monkeypatch.setattr(context_manager, "CONTEXT_PREFIX_STEP", 0)
+    monkeypatch.setattr(context_manager, "CONTEXT_SUMMARY_ENABLED", True)
+    monkeypatch.setattr(context_manager, "CONTEXT_SUMMARY_TRIGGER_MESSAGES", 8)
+    monkeypatch.setattr(context_manager, "CONTEXT_SUMMARY_TRIGGER_TOKENS", 0)
+    monkeypatch.setattr(context_manager, "CONTEXT_SUMMARY_KEEP_MESSAGES", 4)
+    context_manager.configure_summarizer(_summarizer)
+    path = tmp_path / "context.sqlite3"
+    context_manager.configure_context_backend("sqlite", path, keep_messages=6)
+    yield path
+    context_manager.configure_summarizer(None)
+    context_manager.configure_context_backend("memory")
+
+
+def _talk(user_id, first, last):
+    for turn in range(first, last):
+        context_manager.append_messages(
+            user_id, {"role": "user", "content": f"q{turn}"}, {"role": "assistant", "content": f"a{turn}"}
+        )
+        context_manager.wait_for_summaries()
+
+
+def _contents(user_id):
+    return [m["content"] for m in context_manager.select_context(user_id)]
+
+
+def test_summary_and_kept_turns_survive_reopen(sqlite_context):
+    _talk(1, 0, 6)
+    before = _contents(1)
+    assert before[0].endswith("Пользователя зовут Аня")
+    assert before[1:] == ["q4", "a4", "q5", "a5"]
+
+    # Перезапуск: новое хранилище на том же файле, память пуста
+    context_manager.configure_context_backend("sqlite", sqlite_context, keep_messages=6)
+    assert _contents(1) == before
+
+
+def test_turns_after_summary_are_not_folded_on_reopen(sqlite_context):
+    _talk(1, 0, 7)  # последний ход — после сжатия, до следующего порога
+    before = _contents(1)
+    assert before[1:] == ["q4", "a4", "q5", "a5", "q6", "a6"]
+
+    context_manager.configure_context_backend("sqlite", sqlite_context, keep_messages=6)
+    assert _contents(1) == before
+
+
+def test_clear_removes_summary(sqlite_context):
+    _talk(1, 0, 6)
+    context_manager.clear_context(1)
+    context_manager.configure_context_backend("sqlite", sqlite_context, keep_messages=6)
+    assert _contents(1) == []
+
+
+def test_failed_summary_backs_off(sqlite_context, monkeypatch):
+    monkeypatch.setattr(context_manager, "CONTEXT_SUMMARY_RETRY_SECONDS", 0.2)
+    calls = []
+
+    def flaky(previous, messages):
+        calls.append(len(messages))
+        if len(calls) == 1:
+            raise RuntimeError("модель сжатия недоступна")
+        return _summarizer(previous, messages)
+
+    context_manager.configure_summarizer(flaky)
+    errors = context_manager.get_stats()["compaction_errors"]
+    _talk(1, 0, 4)
+    assert calls == [4]
+    # Пока не вышла пауза после ошибки — ходы без новых запросов сжатия
+    _talk(1, 4, 7)
+    assert len(calls) == 1
+    assert context_manager.get_stats()["compaction_errors"] == errors + 1
+
+    time.sleep(0.25)
+    _talk(1, 7, 8)
+    assert len(calls) == 2
+    assert _contents(1)[0].endswith("Пользователя зовут Аня")
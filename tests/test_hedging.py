@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import openai_client
+from completion_cache import make_cache_key
+from model_router import configure_model_router
+
+MESSAGES = [{"role": "user", "content": "вопрос"}]
+USAGE = {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15, "cached_tokens": 0}
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_HEDGE_ENABLED", True)
+    recorded = []
+    cached = {}
+    monkeypatch.setattr(openai_client, "_record_usage", lambda model, temp, usage: recorded.append(model))
+    monkeypatch.setattr(
+        openai_client, "get_completion_cache",
+        lambda: SimpleNamespace(put=lambda key, text, usage: cached.__setitem__(key, text)),
+    )
+    configure_model_router(routes={"chat": ("slow", "fast")}, hedge_delay=0.05, hedge_max_share=1.0)
+    yield recorded, cached
+    configure_model_router()
+
+
+def _server_error():
+    response = SimpleNamespace(status_code=500, headers={}, request=None)
+    return openai.InternalServerError("ошибка", response=response, body=None)
+
+
+def test_cross_model_backup_uses_its_own_cache_key(hedging, monkeypatch):
+    recorded, cached = hedging
+    keys = {}
+
+    async def fake_request(model, messages, temp, max_tok, cache_key, record=True):
+        keys[model] = cache_key
+        if model == "slow":
+            raise _server_error()
+        return f"ответ {model}", dict(USAGE), temp
+
+    monkeypatch.setattr(openai_client, "_async_request", fake_request)
+    primary_key = make_cache_key("slow", MESSAGES, 0.2, 100)
+    text, _, _ = asyncio.run(openai_client._async_call("chat", "slow", MESSAGES, 0.2, 100, primary_key))
+
+    assert text == "ответ fast"
+    assert keys == {"slow": primary_key, "fast": make_cache_key("fast", MESSAGES, 0.2, 100)}
+    assert cached == {keys["fast"]: "ответ fast"}
+    assert recorded == ["fast"]
+
+
+def test_usage_recorded_once_when_both_requests_answer(hedging, monkeypatch):
+    recorded, cached = hedging
+    state = {}
+
+    async def fake_request(model, messages, temp, max_tok, cache_key, record=True):
+        if "released" not in state:
+            # Основной: ждёт дольше задержки хеджирования, отвечает вместе с запасным
+            state["released"] = asyncio.Event()
+            await state["released"].wait()
+            return "ответ основного", dict(USAGE), temp
+        state["released"].set()
+        return "ответ запасного", dict(USAGE), temp
+
+    monkeypatch.setattr(openai_client, "_async_request", fake_request)
+    text, _, _ = asyncio.run(openai_client._async_call("chat", "slow", MESSAGES, 0.2, 100, "key"))
+
+    assert text == "ответ основного"
+    assert recorded == ["slow"]
+    assert cached == {"key": "ответ основного"}
@@ -0,0 +1,32 @@
+import json
+import threading
+
+from homework_store import HomeworkResultsStore
+
+
+def test_concurrent_legacy_migration_moves_entries_once(tmp_path):
+    legacy = tmp_path / "homework_results.json"
+    entries = [{"prompt_id": i % 3, "datetime": f"2025-01-0{i + 1} 10:00:00"} for i in range(5)]
+    legacy.write_text(json.dumps(entries), encoding="utf-8")
+    path = tmp_path / "homework_results.jsonl"
+    stores = [HomeworkResultsStore(path, legacy) for _ in range(8)]
+    errors = []
+    start = threading.Barrier(len(stores))
+
+    def migrate(store):
+        start.wait()
+        try:
+            store.find()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=migrate, args=(store,)) for store in stores]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not legacy.exists()
+    assert (tmp_path / "homework_results.json.bak").exists()
+    assert [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] == entries
@@ -0,0 +1,95 @@
+"""Модель, не принимающая temperature: повтор без параметра, запоминание по модели."""
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import model_capabilities
+import openai_client
+import request_scheduler
+from model_capabilities import ModelCapabilities
+from request_scheduler import RequestScheduler
+
+MESSAGES = [{"role": "user", "content": "вопрос"}]
+
+
+def _response() -> SimpleNamespace:
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15, prompt_tokens_details=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ответ"))], usage=usage)
+
+
+def _temperature_error() -> openai.BadRequestError:
+    response = SimpleNamespace(status_code=400, headers={}, request=None)
+    message = "Unsupported value: 'temperature' does not support 0.2 with this model."
+    return openai.BadRequestError(message, response=response, body=None)
+
+
+class _Client:
+    """Заглушка API: модели из strict не принимают temperature; sent — (модель, была ли temperature)."""
+
+    def __init__(self, strict: set[str]) -> None:
+        self.strict = strict
+        self.sent: list[tuple[str, bool]] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs) -> SimpleNamespace:
+        self.sent.append((kwargs["model"], "temperature" in kwargs))
+        if kwargs["model"] in self.strict and "temperature" in kwargs:
+            raise _temperature_error()
+        return _response()
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(openai_client, "COMPLETION_CACHE_ENABLED", False)
+    monkeypatch.setattr(openai_client, "_record_usage", lambda model, temp, usage: None)
+    monkeypatch.setattr(model_capabilities, "_capabilities", ModelCapabilities(tmp_path / "capabilities.json"))
+    scheduler = RequestScheduler(rpm=0, tpm=0, max_in_flight=0, max_retries=0)
+    monkeypatch.setattr(request_scheduler, "_scheduler", scheduler)
+    stub = _Client(strict={"o-strict"})
+    monkeypatch.setattr(openai_client, "_get_client", lambda: stub)
+
+    async def acreate(**kwargs) -> SimpleNamespace:
+        return stub.create(**kwargs)
+
+    async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=acreate)))
+    monkeypatch.setattr(openai_client, "_get_async_client", lambda: async_client)
+    return stub
+
+
+def test_rejected_temperature_is_retried_without_it_and_remembered(client, tmp_path) -> None:
+    text, _ = openai_client.chat_completion(MESSAGES, model="o-strict", temperature=0.2, system_message="")
+    assert text == "ответ"
+    assert client.sent == [("o-strict", True), ("o-strict", False)]
+
+    # Следующий запрос к той же модели — сразу без temperature, без пробы
+    openai_client.chat_completion(MESSAGES, model="o-strict", temperature=0.2, system_message="")
+    assert client.sent[2:] == [("o-strict", False)]
+
+    stats = model_capabilities.get_model_capabilities().stats()
+    assert stats["models"]["o-strict"] == {"temperature": False}
+    assert stats["unsupported_found"] == 1
+    assert request_scheduler.get_request_scheduler().failures == 0
+
+    # Запомнено в файле: после перезапуска проба не повторяется
+    assert ModelCapabilities(tmp_path / "capabilities.json").supports("o-strict", "temperature") is False
+
+
+def test_capabilities_are_per_model(client) -> None:
+    openai_client.chat_completion(MESSAGES, model="o-strict", temperature=0.2, system_message="")
+    openai_client.chat_completion(MESSAGES, model="gpt-4o-mini", temperature=0.2, system_message="")
+    openai_client.chat_completion(MESSAGES, model="gpt-4o-mini", temperature=0.2, system_message="")
+
+    assert client.sent[2:] == [("gpt-4o-mini", True), ("gpt-4o-mini", True)]
+    models = model_capabilities.get_model_capabilities().stats()["models"]
+    assert models == {"o-strict": {"temperature": False}, "gpt-4o-mini": {"temperature": True}}
+
+
+def test_async_requests_retry_and_remember_too(client) -> None:
+    async def scenario() -> list[tuple[str, bool]]:
+        await openai_client.async_chat_completion(MESSAGES, model="o-strict", temperature=0.2, system_message="")
+        await openai_client.async_chat_completion(MESSAGES, model="o-strict", temperature=0.2, system_message="")
+        return client.sent
+
+    assert asyncio.run(scenario()) == [("o-strict", True), ("o-strict", False), ("o-strict", False)]
@@ -0,0 +1,74 @@
+"""Маршрутизатор: потоковые ответы тоже идут в статистику моделей."""
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import model_capabilities
+import openai_client
+import request_scheduler
+from model_capabilities import ModelCapabilities
+from model_router import configure_model_router
+from request_scheduler import RequestScheduler
+
+MESSAGES = [{"role": "user", "content": "вопрос"}]
+
+
+def _server_error() -> openai.InternalServerError:
+    response = SimpleNamespace(status_code=500, headers={}, request=None)
+    return openai.InternalServerError("ошибка", response=response, body=None)
+
+
+def _chunk(text: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_ROUTING_ENABLED", True)
+    monkeypatch.setattr(openai_client, "_record_usage", lambda model, temp, usage: None)
+    monkeypatch.setattr(model_capabilities, "_capabilities", ModelCapabilities())
+    monkeypatch.setattr(request_scheduler, "_scheduler", RequestScheduler(rpm=0, tpm=0, max_in_flight=0, max_retries=0))
+    router = configure_model_router(routes={"chat": ("slow", "fast")}, min_samples=3, max_error_rate=0.5)
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs["model"])
+        if kwargs["model"] == "slow":
+            raise _server_error()
+
+        async def stream():
+            yield _chunk("от")
+            yield _chunk("вет")
+
+        return stream()
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(openai_client, "_get_async_client", lambda: client)
+    yield router, calls
+    configure_model_router()
+
+
+async def _stream() -> str:
+    parts = []
+    async for part in openai_client.async_stream_chat_completion(MESSAGES, system_message="", use_cache=False):
+        parts.append(part)
+    return "".join(parts)
+
+
+def test_failing_streaming_model_is_skipped(routing) -> None:
+    router, calls = routing
+
+    async def scenario() -> str:
+        for _ in range(3):
+            with pytest.raises(openai.InternalServerError):
+                await _stream()
+        return await _stream()
+
+    assert asyncio.run(scenario()) == "ответ"
+    assert calls == ["slow", "slow", "slow", "fast"]
+    stats = router.stats()
+    assert stats["models"]["slow"]["errors"] == 3
+    assert stats["models"]["fast"]["requests"] == 1
+    assert stats["fallbacks"] == 1
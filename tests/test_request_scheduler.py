@@ -0,0 +1,186 @@
+"""Планировщик: резерв токенов при повторах и отмене, учёт отказов, ожидание по Retry-After."""
+import asyncio
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+from request_scheduler import RequestScheduler
+
+
+def _response(status: int) -> SimpleNamespace:
+    """Ответ HTTP-клиента SDK: ошибкам нужны только код, заголовки и запрос."""
+    return SimpleNamespace(status_code=status, headers={}, request=None)
+
+
+def _server_error() -> openai.InternalServerError:
+    return openai.InternalServerError("boom", response=_response(500), body=None)
+
+
+def _temperature_error() -> openai.BadRequestError:
+    message = "Unsupported value: 'temperature' does not support 0.2 with this model."
+    return openai.BadRequestError(message, response=_response(400), body=None)
+
+
+def _scheduler(**kwargs: int) -> RequestScheduler:
+    return RequestScheduler(rpm=0, tpm=6000, max_in_flight=0, base_delay=0.0, max_delay=0.0, **kwargs)
+
+
+def _flaky(failures: int):
+    calls = []
+
+    def fn() -> str:
+        calls.append(1)
+        if len(calls) <= failures:
+            raise _server_error()
+        return "ok"
+
+    return fn, calls
+
+
+def test_retries_do_not_charge_tokens_twice() -> None:
+    scheduler = _scheduler(max_retries=3)
+    fn, calls = _flaky(failures=2)
+    assert scheduler.run(fn, tokens=1000) == "ok"
+    scheduler.settle(1000, 1000)
+    assert len(calls) == 3
+    assert scheduler.retries == 2
+    # Списан один запрос на 1000 токенов, а не три
+    assert scheduler._tpm._balance == pytest.approx(5000, abs=5)
+
+
+def test_async_retries_do_not_charge_tokens_twice() -> None:
+    scheduler = _scheduler(max_retries=3)
+    fn, calls = _flaky(failures=2)
+
+    async def call() -> str:
+        return fn()
+
+    assert asyncio.run(scheduler.arun(call, tokens=1000)) == "ok"
+    scheduler.settle(1000, 1000)
+    assert scheduler._tpm._balance == pytest.approx(5000, abs=5)
+
+
+def test_final_failure_returns_reservation() -> None:
+    scheduler = _scheduler(max_retries=1)
+    fn, _ = _flaky(failures=5)
+    with pytest.raises(openai.InternalServerError):
+        scheduler.run(fn, tokens=1000)
+    assert scheduler.failures == 1
+    assert scheduler._tpm._balance == pytest.approx(6000, abs=5)
+
+
+def test_temperature_probe_is_not_a_failure() -> None:
+    scheduler = _scheduler(max_retries=3)
+
+    def fn() -> str:
+        raise _temperature_error()
+
+    handled = lambda e: isinstance(e, openai.BadRequestError)  # noqa: E731
+    with pytest.raises(openai.BadRequestError):
+        scheduler.run(fn, tokens=1000, handled=handled)
+    assert scheduler.failures == 0
+    assert scheduler.retries == 0
+    with pytest.raises(openai.BadRequestError):
+        scheduler.run(fn, tokens=1000)
+    assert scheduler.failures == 1
+
+
+class _Clock:
+    """Подмена модуля time в планировщике: sleep() не ждёт, а сдвигает часы и запоминает паузу."""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> _Clock:
+    fake = _Clock()
+    monkeypatch.setattr("request_scheduler.time", fake)
+    return fake
+
+
+def _rate_limited(headers: dict[str, str]) -> openai.RateLimitError:
+    response = SimpleNamespace(status_code=429, headers=headers, request=None)
+    return openai.RateLimitError("rate limit", response=response, body=None)
+
+
+@pytest.mark.parametrize(
+    ("headers", "expected"), [({"retry-after": "2"}, 2.0), ({"retry-after-ms": "1500"}, 1.5)]
+)
+def test_rate_limit_waits_retry_after(clock: _Clock, headers: dict[str, str], expected: float) -> None:
+    scheduler = RequestScheduler(rpm=0, tpm=0, max_in_flight=0, max_retries=3, base_delay=0.0, max_delay=30.0)
+    calls = []
+
+    def fn() -> str:
+        calls.append(1)
+        if len(calls) == 1:
+            raise _rate_limited(headers)
+        return "ok"
+
+    assert scheduler.run(fn) == "ok"
+    assert clock.sleeps == [pytest.approx(expected)]
+    assert scheduler.rate_limited == 1
+
+
+def test_rate_limit_wait_is_capped_by_max_delay(clock: _Clock) -> None:
+    scheduler = RequestScheduler(rpm=0, tpm=0, max_in_flight=0, max_retries=1, base_delay=0.0, max_delay=5.0)
+    errors = iter([_rate_limited({"retry-after": "120"})])
+
+    def limited() -> str:
+        error = next(errors, None)
+        if error is not None:
+            raise error
+        return "ok"
+
+    assert scheduler.run(limited) == "ok"
+    assert clock.sleeps == [pytest.approx(5.0)]
+
+
+def test_cancelled_wait_returns_reservation() -> None:
+    scheduler = _scheduler(max_retries=0)
+
+    async def scenario() -> None:
+        scheduler.run(lambda: "ok", tokens=6000)  # ведро пусто
+        waiting = asyncio.ensure_future(scheduler.arun(lambda: asyncio.sleep(0), tokens=3000))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+    asyncio.run(scenario())
+    assert scheduler._tpm._balance == pytest.approx(0, abs=5)
+    assert scheduler.in_flight == 0 and scheduler.queue_depth == 0
+
+
+def test_cancelled_request_returns_reservation() -> None:
+    scheduler = _scheduler(max_retries=0)
+
+    async def scenario() -> None:
+        started = asyncio.Event()
+
+        async def hang() -> str:
+            started.set()
+            await asyncio.sleep(10)
+            return "ok"
+
+        request = asyncio.ensure_future(scheduler.arun(hang, tokens=1000))
+        await started.wait()
+        request.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await request
+
+    asyncio.run(scenario())
+    assert scheduler._tpm._balance == pytest.approx(6000, abs=5)
+    assert scheduler.in_flight == 0
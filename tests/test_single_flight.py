@@ -0,0 +1,158 @@
+"""Объединение одинаковых одновременных запросов: заглушка API считает вызовы."""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import openai
+import pytest
+
+import model_capabilities
+import openai_client
+import request_scheduler
+import single_flight
+from model_capabilities import ModelCapabilities
+from request_scheduler import RequestScheduler
+
+CALLERS = 8
+MESSAGES = [{"role": "user", "content": "Задача ДЗ"}]
+
+
+def _response(text: str) -> SimpleNamespace:
+    usage = SimpleNamespace(prompt_tokens=10, completion_tokens=5, total_tokens=15, prompt_tokens_details=None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+
+def _server_error() -> openai.InternalServerError:
+    response = SimpleNamespace(status_code=500, headers={}, request=None)
+    return openai.InternalServerError("ошибка", response=response, body=None)
+
+
+class _Upstream:
+    """Заглушка chat.completions.create: считает вызовы и ждёт, пока соберутся ожидающие."""
+
+    def __init__(self, followers: int, error: Exception | None = None, hold: float = 0.0) -> None:
+        self.calls: list[str] = []
+        self.followers = followers
+        self.error = error
+        self.hold = hold  # сколько ещё держать запрос в полёте
+
+    def _answer(self, kwargs: dict) -> SimpleNamespace:
+        self.calls.append(kwargs["messages"][-1]["content"])
+        if self.error is not None:
+            raise self.error
+        return _response(f"ответ: {kwargs['messages'][-1]['content']}")
+
+    def _gathered(self) -> bool:
+        return single_flight.get_single_flight().followers >= self.followers
+
+    async def acreate(self, **kwargs) -> SimpleNamespace:
+        deadline = time.monotonic() + 2
+        while not self._gathered() and time.monotonic() < deadline:
+            await asyncio.sleep(0.001)
+        await asyncio.sleep(self.hold)
+        return self._answer(kwargs)
+
+    def create(self, **kwargs) -> SimpleNamespace:
+        deadline = time.monotonic() + 2
+        while not self._gathered() and time.monotonic() < deadline:
+            time.sleep(0.001)
+        time.sleep(self.hold)
+        return self._answer(kwargs)
+
+
+@pytest.fixture
+def coalescing(monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_COALESCE_REQUESTS", True)
+    monkeypatch.setattr(openai_client, "COMPLETION_CACHE_ENABLED", False)
+    monkeypatch.setattr(openai_client, "OPENAI_ROUTING_ENABLED", False)
+    monkeypatch.setattr(openai_client, "OPENAI_HEDGE_ENABLED", False)
+    monkeypatch.setattr(model_capabilities, "_capabilities", ModelCapabilities())
+    monkeypatch.setattr(request_scheduler, "_scheduler", RequestScheduler(rpm=0, tpm=0, max_in_flight=0, max_retries=0))
+    single_flight.configure_single_flight()
+    recorded = []
+    monkeypatch.setattr(openai_client, "_record_usage", lambda model, temp, usage: recorded.append(usage))
+
+    def use(upstream: _Upstream) -> None:
+        async_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=upstream.acreate)))
+        client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=upstream.create)))
+        monkeypatch.setattr(openai_client, "_get_async_client", lambda: async_client)
+        monkeypatch.setattr(openai_client, "_get_client", lambda: client)
+
+    return use, recorded
+
+
+def _gather(*calls):
+    async def run():
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def test_identical_requests_make_one_upstream_call(coalescing) -> None:
+    use, recorded = coalescing
+    upstream = _Upstream(followers=CALLERS - 1)
+    use(upstream)
+
+    results = _gather(*(openai_client.async_chat_completion(MESSAGES, system_message="") for _ in range(CALLERS)))
+
+    assert len(upstream.calls) == 1
+    assert {text for text, _ in results} == {"ответ: Задача ДЗ"}
+    assert sum(1 for _, usage in results if usage.get("coalesced")) == CALLERS - 1
+    assert all(usage["total_tokens"] == 15 for _, usage in results)
+    # В лог: токены — один раз, у остальных нули с пометкой coalesced
+    assert sorted(usage["total_tokens"] for usage in recorded) == [0] * (CALLERS - 1) + [15]
+    assert sum(usage.get("coalesced", 0) for usage in recorded) == CALLERS - 1
+
+
+def test_identical_requests_from_threads_make_one_upstream_call(coalescing) -> None:
+    use, recorded = coalescing
+    upstream = _Upstream(followers=CALLERS - 1)
+    use(upstream)
+
+    with ThreadPoolExecutor(CALLERS) as pool:
+        results = list(pool.map(lambda _: openai_client.chat_completion(MESSAGES, system_message=""), range(CALLERS)))
+
+    assert len(upstream.calls) == 1
+    assert {text for text, _ in results} == {"ответ: Задача ДЗ"}
+    assert sum(1 for _, usage in results if usage.get("coalesced")) == CALLERS - 1
+
+
+def test_leader_error_reaches_every_waiter(coalescing) -> None:
+    use, recorded = coalescing
+    upstream = _Upstream(followers=CALLERS - 1, error=_server_error())
+    use(upstream)
+
+    results = _gather(*(openai_client.async_chat_completion(MESSAGES, system_message="") for _ in range(CALLERS)))
+
+    assert len(upstream.calls) == 1
+    assert all(isinstance(result, openai.InternalServerError) for result in results)
+    assert recorded == []
+    assert single_flight.get_single_flight().in_flight() == 0
+
+
+def test_different_payloads_are_not_merged(coalescing) -> None:
+    use, recorded = coalescing
+    upstream = _Upstream(followers=0, hold=0.05)
+    use(upstream)
+
+    results = _gather(*(
+        openai_client.async_chat_completion([{"role": "user", "content": f"Задача {i}"}], system_message="")
+        for i in range(CALLERS)
+    ))
+
+    assert sorted(upstream.calls) == sorted(f"Задача {i}" for i in range(CALLERS))
+    assert [text for text, _ in results] == [f"ответ: Задача {i}" for i in range(CALLERS)]
+    assert not any(usage.get("coalesced") for _, usage in results)
+
+
+def test_use_cache_false_is_never_merged(coalescing) -> None:
+    use, recorded = coalescing
+    upstream = _Upstream(followers=0, hold=0.05)
+    use(upstream)
+
+    _gather(*(
+        openai_client.async_chat_completion(MESSAGES, system_message="", use_cache=False) for _ in range(CALLERS)
+    ))
+
+    assert len(upstream.calls) == CALLERS
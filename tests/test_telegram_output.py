@@ -0,0 +1,53 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram_output import ChatSender, split_message, tg_len
+
+
+def _fences_balanced(part):
+    return sum(1 for line in part.split("\n") if line.startswith("```")) % 2 == 0
+
+
+def test_split_keeps_code_fences_intact():
+    code = "\n".join(f'    "key_{i}": "значение {i}",' for i in range(200))
+    text = "Результат:\n\n```json\n{\n" + code + "\n}\n```\n\nГотово."
+    parts = split_message(text, limit=500, parse_mode="Markdown")
+
+    assert len(parts) > 2
+    assert all(tg_len(part) <= 500 for part in parts)
+    assert all(_fences_balanced(part) for part in parts)
+    # В каждой части код идёт внутри блока с тем же языком
+    for part in parts:
+        if '"key_' in part:
+            assert "```json\n" in part.split('    "key_')[0]
+    # Строки кода не теряются и не рвутся
+    lines = [line for part in parts for line in part.split("\n") if line.startswith('    "key_')]
+    assert lines == code.split("\n")
+
+
+def test_split_does_not_cut_inside_markdown_markup():
+    text = " ".join(f"*жирный {i}*" for i in range(300))
+    for part in split_message(text, limit=200, parse_mode="Markdown"):
+        assert part.count("*") % 2 == 0
+
+
+class _Message:
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.sent = []
+
+    async def answer(self, text, parse_mode=None):
+        self.sent.append((text, parse_mode))
+        return SimpleNamespace(text=text)
+
+
+def test_queued_messages_merge_only_with_same_parse_mode():
+    async def scenario():
+        sender = ChatSender(global_per_second=0, chat_per_minute=0, group_per_minute=0)
+        message = _Message()
+        sender.submit(message, "статус", status=False)
+        sender.submit(message, "*a*", parse_mode="Markdown")
+        await sender.send(message, "*b*", parse_mode="Markdown")
+        return message.sent
+
+    assert asyncio.run(scenario()) == [("статус", None), ("*a*\n\n*b*", "Markdown")]
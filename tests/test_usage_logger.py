@@ -0,0 +1,26 @@
+import json
+import multiprocessing
+
+from usage_logger import JsonlUsageSink, UsageLogger
+
+
+def _write_records(path, count):
+    logger = UsageLogger(JsonlUsageSink(path), batch_size=10, flush_interval=0.05)
+    for _ in range(count):
+        logger.record("gpt-4o-mini", 0.2, {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2})
+    logger.close()
+
+
+def test_run_ids_are_unique_across_processes(tmp_path):
+    path = tmp_path / "usage.jsonl"
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_write_records, args=(path, 50)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    run_ids = [json.loads(line)["run_id"] for line in path.read_text(encoding="utf-8").splitlines()]
+    assert len(run_ids) == 150
+    assert len(set(run_ids)) == 150
@@ -0,0 +1,49 @@
+from usage_logger import CsvUsageSink
+from usage_report import build_report, compact, default_usage_path, default_usage_paths
+
+HEADER = "run_id,datetime,model,temperature,prompt_tokens,completion_tokens,total_tokens,cached_tokens,coalesced\n"
+
+
+def test_coalesced_rows_are_not_cache_hits(tmp_path):
+    path = tmp_path / "usage.csv"
+    path.write_text(
+        HEADER
+        + "1-1,2026-01-01 10:00:00,gpt-4o-mini,0.2,100,50,150,0,0\n"  # запрос к модели
+        + "1-2,2026-01-01 10:00:01,gpt-4o-mini,0.2,0,0,0,0,1\n"  # объединённый с ним
+        + "1-3,2026-01-01 10:00:02,gpt-4o-mini,0.2,0,0,0,0,0\n",  # ответ из кэша
+        encoding="utf-8",
+    )
+    totals = build_report([path], summary_path=None)["totals"]
+    assert totals["requests"] == 3
+    assert totals["total_tokens"] == 150
+    assert totals["cache_hits"] == 1
+
+
+OLD_HEADER = "run_id,datetime,model,temperature,prompt_tokens,completion_tokens,total_tokens\n"
+
+
+def _record(n):
+    return {
+        "run_id": f"1-{n}", "datetime": "2026-01-02 10:00:00", "model": "gpt-4o-mini", "temperature": 0.2,
+        "prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15, "cached_tokens": 0, "coalesced": 0,
+    }
+
+
+def test_old_format_file_stays_in_default_report(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = default_usage_path()
+    path.parent.mkdir()
+    path.write_text(OLD_HEADER + "1,2026-01-01 10:00:00,gpt-4o-mini,0.2,100,50,150\n", encoding="utf-8")
+    summary = tmp_path / "logs" / "usage_summary.sqlite3"
+    compact([path], summary)  # старая строка уже в сводке
+
+    sink = CsvUsageSink(path)
+    sink.write_batch([_record(1), _record(2)])  # другой заголовок — старый файл переименовывается
+    sink.close()
+
+    paths = default_usage_paths()
+    assert len(paths) == 2 and paths[-1] == path
+    for summary_path in (None, summary):
+        totals = build_report(paths, summary_path=summary_path)["totals"]
+        assert totals["requests"] == 3
+        assert totals["total_tokens"] == 180
@@ -0,0 +1,93 @@
+"""
+Пачки сообщений от многих пользователей через bot.handle_text: история каждого
+упорядочена, сообщения одного пользователя не обрабатываются одновременно,
+общий лимит одновременных сообщений соблюдается.
+"""
+import asyncio
+import random
+
+import pytest
+
+from benchmarks.fake_telegram import FakeMessage, TelegramLog, use_fake_bot_token
+
+USERS = 40
+BURST = 5
+MAX_CONCURRENCY = 8
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    use_fake_bot_token()
+    import bot
+    import context_manager
+    import telegram_output
+    from user_locks import KeyedLimiter
+
+    context_manager.configure_context_backend("memory")
+    monkeypatch.setattr(
+        telegram_output, "_sender",
+        telegram_output.ChatSender(global_per_second=0, chat_per_minute=0, group_per_minute=0),
+    )
+    monkeypatch.setattr(bot, "user_limiter", KeyedLimiter(MAX_CONCURRENCY))
+    yield bot
+    context_manager.configure_context_backend("memory")
+
+
+def _fake_model(monkeypatch, bot):
+    """Заглушка потокового ответа: случайная задержка, учёт одновременных запросов."""
+    rng = random.Random(1)
+    state = {"active": 0, "max_active": 0, "users": set(), "overlaps": 0, "bad_context": 0}
+
+    async def stream(messages, usage_out=None, **kwargs):
+        question = messages[-1]["content"]
+        user_id, index = (int(part[1:]) for part in question.split("-"))
+        # Ответ на сообщение i видит всю историю до него: 2 * i сообщений
+        if len(messages) != 2 * index + 1:
+            state["bad_context"] += 1
+        if user_id in state["users"]:
+            state["overlaps"] += 1
+        state["users"].add(user_id)
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            await asyncio.sleep(rng.uniform(0, 0.01))
+            if usage_out is not None:
+                usage_out.update({"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2})
+            yield f"ответ {question}"
+        finally:
+            state["active"] -= 1
+            state["users"].discard(user_id)
+
+    monkeypatch.setattr(bot, "async_stream_chat_completion", stream)
+    monkeypatch.setattr(bot, "STREAM_RESPONSES", True)
+    return state
+
+
+def test_bursts_keep_per_user_order_and_limits(bot, monkeypatch) -> None:
+    from context_manager import get_context
+
+    state = _fake_model(monkeypatch, bot)
+    log = TelegramLog()
+
+    async def burst() -> None:
+        await asyncio.gather(*(
+            bot.handle_text(FakeMessage(f"u{user_id}-m{i}", user_id, log))
+            for user_id in range(1, USERS + 1)
+            for i in range(BURST)
+        ))
+
+    asyncio.run(burst())
+
+    assert state["overlaps"] == 0
+    assert state["bad_context"] == 0
+    assert 1 < state["max_active"] <= MAX_CONCURRENCY
+    for user_id in range(1, USERS + 1):
+        history = [m["content"] for m in get_context(user_id)]
+        expected = []
+        for i in range(BURST):
+            expected += [f"u{user_id}-m{i}", f"ответ u{user_id}-m{i}"]
+        assert history == expected
+    stats = bot.user_limiter.stats()
+    assert stats["handled"] == USERS * BURST
+    assert stats["max_active"] <= MAX_CONCURRENCY
+    assert stats["keys"] == 0
@@ -0,0 +1,65 @@
+"""
+Подсчёт токенов без сети: приближённый токенизатор по умолчанию,
+tiktoken — если установлен и выбран в config (TOKENIZER = "tiktoken").
+"""
+import logging
+import math
+import re
+from typing import Any
+
+from config import TOKENIZER
+
+logger = logging.getLogger(__name__)
+
+# Служебные токены на каждое сообщение в формате Chat Completions (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_encoding: Any = None
+_encoding_loaded = False
+
+
+def _get_encoding() -> Any:
+    """Кодировка tiktoken или None (не установлен / нет файла словаря офлайн)."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logger.warning("tiktoken недоступен (%s), используется приближённый подсчёт токенов", e)
+            _encoding = None
+    return _encoding
+
+
+def _approx_tokens(text: str) -> int:
+    """
+    Приближённая оценка в духе BPE: латиница ~4 символа на токен,
+    кириллица и прочее ~3 символа, каждый знак препинания — отдельный токен.
+    """
+    tokens = 0
+    for match in _WORD_RE.finditer(text):
+        word = match.group()
+        if word.isascii():
+            tokens += math.ceil(len(word) / 4)
+        else:
+            tokens += math.ceil(len(word) / 3)
+    return tokens
+
+
+def count_tokens(text: str) -> int:
+    """Число токенов в строке."""
+    if not text:
+        return 0
+    if TOKENIZER == "tiktoken":
+        encoding = _get_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+    return _approx_tokens(text)
+
+
+def count_message_tokens(message: dict[str, Any]) -> int:
+    """Число токенов, которое сообщение займёт в запросе (content + служебные)."""
+    return count_tokens(str(message.get("content") or "")) + MESSAGE_OVERHEAD_TOKENS
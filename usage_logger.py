@@ -0,0 +1,371 @@
+"""
+Буферизованная запись usage (токены по каждому запросу).
+
+record_usage() только кладёт запись в очередь в памяти; фоновый поток пишет
+записи пачками — по размеру пачки (USAGE_FLUSH_BATCH_SIZE) или по интервалу
+(USAGE_FLUSH_INTERVAL_SECONDS). При завершении процесса очередь дописывается
+на диск (atexit / shutdown_usage_logger). Формат по умолчанию — CSV (logs/usage.csv),
+также поддерживаются JSONL и SQLite (USAGE_LOG_FORMAT в config).
+В один файл могут писать несколько процессов-обработчиков (main.py --workers N):
+пачка CSV/JSONL дописывается одним куском под блокировкой файла, SQLite — транзакцией.
+"""
+import atexit
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import metrics
+from config import USAGE_FLUSH_BATCH_SIZE, USAGE_FLUSH_INTERVAL_SECONDS, USAGE_LOG_FORMAT
+from file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+USAGE_COLUMNS = [
+    "run_id", "datetime", "model", "temperature",
+    "prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens", "coalesced",
+]
+# Колонки, добавленные позже: в старой таблице SQLite добавляются ALTER TABLE
+_ADDED_COLUMNS = ("cached_tokens", "coalesced")
+
+_DEFAULT_FILENAMES = {"csv": "usage.csv", "jsonl": "usage.jsonl", "sqlite": "usage.sqlite3"}
+
+
+# ---------- Приёмники (sinks) ----------
+
+class CsvUsageSink:
+    """
+    logs/usage.csv: заголовок при создании файла, одна строка на запрос.
+    Файл со старым заголовком (другой набор колонок) переименовывается
+    в usage-ГГГГММДД-ЧЧММСС.csv, записи идут в новый файл; usage-report по умолчанию
+    читает и такие файлы.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._file: Any = None
+        self._header_checked = False
+
+    def _open(self) -> Any:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", newline="", encoding="utf-8")
+        return self._file
+
+    def _reopen_if_rotated(self) -> None:
+        """Файл переименован (cli.py usage-report --rotate) или удалён — следующая пачка в новый."""
+        if self._file is None:
+            return
+        try:
+            rotated = os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self._file.close()
+            self._file = None
+            self._header_checked = False
+
+    def _stale_header(self, f: Any, header: str) -> bool:
+        """Файл начат с другим заголовком (до добавления колонок). Вызывается под блокировкой."""
+        if self._header_checked or not header or os.fstat(f.fileno()).st_size == 0:
+            return False
+        try:
+            with open(self.path, "rb") as reader:
+                if os.fstat(reader.fileno()).st_ino != os.fstat(f.fileno()).st_ino:
+                    return False  # файл уже подменён — переоткроется следующей пачкой
+                first = reader.readline()
+        except FileNotFoundError:
+            return False
+        if first.rstrip(b"\r\n") == header.rstrip("\r\n").encode("utf-8"):
+            self._header_checked = True
+            return False
+        return True
+
+    def _move_stale(self, f: Any) -> None:
+        """Переименовывает файл со старым заголовком, если его ещё не переименовал другой процесс."""
+        try:
+            same_file = os.stat(self.path).st_ino == os.fstat(f.fileno()).st_ino
+        except FileNotFoundError:
+            same_file = False
+        if same_file:
+            target = self.path.with_name(
+                f"{self.path.stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}{self.path.suffix}"
+            )
+            os.replace(self.path, target)
+            print(f"[Usage] Старый формат {self.path.name} переименован в {target.name}", flush=True)
+
+    def _format(self, records: list[dict[str, Any]]) -> str:
+        buf = io.StringIO()
+        csv.writer(buf).writerows([record[c] for c in USAGE_COLUMNS] for record in records)
+        return buf.getvalue()
+
+    def _header(self) -> str:
+        buf = io.StringIO()
+        csv.writer(buf).writerow(USAGE_COLUMNS)
+        return buf.getvalue()
+
+    def write_batch(self, records: list[dict[str, Any]]) -> None:
+        data = self._format(records)
+        header = self._header()
+        self._reopen_if_rotated()
+        f = self._open()
+        if not self._header_checked:
+            with file_lock(f):
+                stale = self._stale_header(f, header)
+                if stale:
+                    self._move_stale(f)
+            if stale:
+                self._file.close()
+                self._file = None
+                f = self._open()
+        with file_lock(f):
+            if header and os.fstat(f.fileno()).st_size == 0:
+                f.write(header)
+                print(f"[Usage] Лог создан: {self.path.absolute()}", flush=True)
+            self._header_checked = True
+            f.write(data)
+            f.flush()
+
+    def sync(self) -> None:
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+            self._header_checked = False
+
+
+class JsonlUsageSink(CsvUsageSink):
+    """usage.jsonl: один JSON-объект на строку."""
+
+    def _open(self) -> Any:
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        return self._file
+
+    def _format(self, records: list[dict[str, Any]]) -> str:
+        return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+
+    def _header(self) -> str:
+        return ""
+
+
+class SqliteUsageSink:
+    """usage.sqlite3: таблица usage с теми же колонками, пачка — одна транзакция."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Соединение создаётся и используется только потоком записи
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "run_id TEXT, datetime TEXT, model TEXT, temperature TEXT, "
+                "prompt_tokens INTEGER, completion_tokens INTEGER, total_tokens INTEGER, "
+                "cached_tokens INTEGER NOT NULL DEFAULT 0, coalesced INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(usage)")}
+            for column in _ADDED_COLUMNS:
+                if column not in columns:  # таблица из версии без колонки
+                    with self._conn:
+                        self._conn.execute(f"ALTER TABLE usage ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+        return self._conn
+
+    def write_batch(self, records: list[dict[str, Any]]) -> None:
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                f"INSERT INTO usage ({', '.join(USAGE_COLUMNS)}) VALUES ({', '.join('?' * len(USAGE_COLUMNS))})",
+                ([str(r[c]) if c == "temperature" else r[c] for c in USAGE_COLUMNS] for r in records),
+            )
+
+    def sync(self) -> None:
+        pass
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+_SINKS = {"csv": CsvUsageSink, "jsonl": JsonlUsageSink, "sqlite": SqliteUsageSink}
+
+
+def make_sink(fmt: str, path: Path | None = None) -> Any:
+    """Создаёт приёмник по имени формата (csv / jsonl / sqlite)."""
+    if fmt not in _SINKS:
+        raise ValueError(f"Неизвестный формат usage-лога: {fmt!r} (ожидается csv, jsonl или sqlite)")
+    path = path or Path.cwd() / "logs" / _DEFAULT_FILENAMES[fmt]
+    return _SINKS[fmt](path)
+
+
+# ---------- Очередь и фоновая запись ----------
+
+class UsageLogger:
+    """Очередь usage-записей в памяти и фоновый поток, сбрасывающий их пачками в sink."""
+
+    def __init__(
+        self,
+        sink: Any,
+        batch_size: int = USAGE_FLUSH_BATCH_SIZE,
+        flush_interval: float = USAGE_FLUSH_INTERVAL_SECONDS,
+    ) -> None:
+        self.sink = sink
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: deque[dict[str, Any]] = deque()
+        self._run_ids = itertools.count(1)
+        self._run_id_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._closed = False
+        self.records_written = 0
+        self.batches_written = 0
+        self._thread = threading.Thread(target=self._worker, name="usage-logger", daemon=True)
+        self._thread.start()
+
+    def record(self, model: str, temperature_used: str | float, usage: dict[str, int]) -> str:
+        """
+        Ставит запись в очередь и возвращает её run_id ("pid-номер": номер растёт в пределах
+        процесса, pid отличает процессы-обработчики и перезапуски). Диск не трогает.
+        """
+        with self._run_id_lock:
+            run_id = f"{os.getpid()}-{next(self._run_ids)}"
+        self._queue.append({
+            "run_id": run_id,
+            "datetime": time.time(),  # форматируется потоком записи
+            "model": model,
+            "temperature": temperature_used,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "total_tokens": usage.get("total_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            # 1 — ответ чужого одинакового запроса (single_flight): токены записаны у него
+            "coalesced": 1 if usage.get("coalesced") else 0,
+        })
+        if len(self._queue) >= self.batch_size:
+            with self._cond:
+                self._cond.notify()
+        return run_id
+
+    def pending(self) -> int:
+        """Записей в очереди, ещё не записанных на диск."""
+        return len(self._queue)
+
+    def _drain(self) -> None:
+        with self._write_lock:
+            while self._queue:
+                batch = []
+                while self._queue and len(batch) < self.batch_size:
+                    record = self._queue.popleft()
+                    record["datetime"] = datetime.fromtimestamp(record["datetime"]).strftime("%Y-%m-%d %H:%M:%S")
+                    batch.append(record)
+                try:
+                    self.sink.write_batch(batch)
+                    self.records_written += len(batch)
+                    self.batches_written += 1
+                except Exception as e:
+                    print(f"[Usage] Ошибка записи лога: {e}", file=sys.stderr, flush=True)
+                    logger.warning("Не удалось записать usage (%s записей): %s", len(batch), e, exc_info=True)
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            self._drain()
+            if closed:
+                return
+
+    def flush(self, sync: bool = False) -> None:
+        """Синхронно дописывает очередь в sink (sync=True — ещё и fsync)."""
+        self._drain()
+        if sync:
+            with self._write_lock:
+                self.sink.sync()
+
+    def close(self) -> None:
+        """Останавливает поток записи, дописывает очередь и закрывает sink."""
+        if self._closed:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        self._drain()
+        with self._write_lock:
+            self.sink.close()
+        logger.info("Usage-лог закрыт, записано: %s", self.records_written)
+
+
+_usage_logger: UsageLogger | None = None
+_usage_logger_lock = threading.Lock()
+
+
+def get_usage_logger() -> UsageLogger:
+    """Общий UsageLogger процесса (создаётся при первом обращении)."""
+    global _usage_logger
+    if _usage_logger is None:
+        with _usage_logger_lock:
+            if _usage_logger is None:
+                _usage_logger = UsageLogger(make_sink(USAGE_LOG_FORMAT))
+                atexit.register(shutdown_usage_logger)
+    return _usage_logger
+
+
+def configure_usage_logger(fmt: str = USAGE_LOG_FORMAT, path: Path | None = None, **kwargs: Any) -> UsageLogger:
+    """Заменяет общий UsageLogger (другой формат/путь); предыдущий дописывается и закрывается."""
+    global _usage_logger
+    with _usage_logger_lock:
+        if _usage_logger is not None:
+            _usage_logger.close()
+        else:
+            atexit.register(shutdown_usage_logger)
+        _usage_logger = UsageLogger(make_sink(fmt, path), **kwargs)
+    return _usage_logger
+
+
+def record_usage(model: str, temperature_used: str | float, usage: dict[str, int]) -> str:
+    """Ставит usage одного запроса в очередь записи; возвращает run_id."""
+    return get_usage_logger().record(model, temperature_used, usage)
+
+
+def shutdown_usage_logger() -> None:
+    """Дописывает очередь на диск и закрывает лог (вызывается и при выходе из процесса)."""
+    global _usage_logger
+    with _usage_logger_lock:
+        if _usage_logger is not None:
+            _usage_logger.close()
+            _usage_logger = None
+
+
+def _collect_metrics() -> dict[str, float]:
+    if _usage_logger is None:
+        return {}
+    return {
+        "usage_log_pending": _usage_logger.pending(),
+        "usage_log_records_written_total": _usage_logger.records_written,
+    }
+
+
+metrics.register_collector("usage_logger", _collect_metrics)
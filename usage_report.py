@@ -0,0 +1,536 @@
+"""
+Отчёты по usage-логу (logs/usage.csv): запросы, токены и стоимость по модели, дню, часу
+и температуре, доля входных токенов из кэша промптов провайдера (cached_tokens),
+перцентили токенов на запрос по моделям.
+
+CSV читается потоково, кусками по CHUNK_BYTES: в памяти — только агрегаты по часам
+и гистограммы токенов по дням, а не сами строки, поэтому размер файла на память не влияет.
+В гистограммах значения округлены до двух значащих цифр (точно — до 100 токенов):
+перцентили приближённые (погрешность до 5%), зато корзин сотни, а не по числу строк.
+
+Чтобы отчёт по многогигабайтному логу строился за секунды, прочитанное можно свернуть
+в сводку SQLite (USAGE_SUMMARY_PATH, `cli.py usage-report --compact`): агрегаты по часам,
+гистограммы по дням и смещение, до которого дочитан каждый файл. Следующий отчёт берёт
+сводку и дочитывает только новый хвост CSV. --rotate после сворачивания переименовывает
+файл в usage-ГГГГММДД-ЧЧММСС.csv: бот начинает новый usage.csv со следующей пачки.
+Так же бот переименовывает usage.csv со старым набором колонок (usage_logger). По умолчанию
+отчёт читает usage.csv вместе с такими файлами рядом с ним (default_usage_paths), поэтому
+история после ротации не пропадает; уже свёрнутое в сводку повторно не считается — смещение
+файла находится и после переименования (по inode).
+
+Запуск: python cli.py usage-report --by model,day [--since 2026-01-01] [--compact]
+"""
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from config import MODEL_PRICES_PER_1M_TOKENS, USAGE_SUMMARY_PATH
+from percentiles import summarize_counts
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ("model", "day", "hour", "temperature")
+CHUNK_BYTES = 4 * 1024 * 1024
+_REQUIRED_COLUMNS = ("datetime", "model", "temperature", "prompt_tokens", "completion_tokens")
+_OPTIONAL_COLUMNS = ("cached_tokens", "coalesced")  # в старых файлах колонок нет — считаются нулём
+TOKEN_KINDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+_BUCKET_TABLE_SIZE = 1 << 17
+_ROTATED_STEM = re.compile(r".+-\d{8}-\d{6}")  # usage-ГГГГММДД-ЧЧММСС
+_bucket_table: list[int] | None = None
+
+
+def token_bucket(value: int) -> int:
+    """Значение, округлённое до двух значащих цифр (до 100 — без изменений)."""
+    if value < 100:
+        return value
+    scale = 10 ** (len(str(value)) - 2)
+    return (value + scale // 2) // scale * scale
+
+
+def _bucket_table_lookup() -> list[int]:
+    global _bucket_table
+    if _bucket_table is None:
+        _bucket_table = [token_bucket(v) for v in range(_BUCKET_TABLE_SIZE)]
+    return _bucket_table
+
+
+def default_usage_path() -> Path:
+    return Path.cwd() / "logs" / "usage.csv"
+
+
+def is_rotated(path: Path) -> bool:
+    """Файл уже переименован ротацией (usage-ГГГГММДД-ЧЧММСС.csv)."""
+    return _ROTATED_STEM.fullmatch(path.stem) is not None
+
+
+def default_usage_paths() -> list[Path]:
+    """usage.csv и переименованные рядом с ним usage-ГГГГММДД-ЧЧММСС.csv, от старых к новым."""
+    path = default_usage_path()
+    rotated = sorted(p for p in path.parent.glob(f"{path.stem}-*{path.suffix}") if is_rotated(p))
+    return [*rotated, path]
+
+
+def default_summary_path() -> Path:
+    return Path(USAGE_SUMMARY_PATH) if USAGE_SUMMARY_PATH else Path.cwd() / "logs" / "usage_summary.sqlite3"
+
+
+def price_for(model: str, prices: dict[str, tuple[float, ...]] = MODEL_PRICES_PER_1M_TOKENS) -> tuple[float, ...] | None:
+    """
+    Цена ($ за 1M токенов: вход, выход[, вход из кэша]) по самому длинному совпадающему
+    префиксу имени модели.
+    """
+    best = None
+    for name in prices:
+        if model.startswith(name) and (best is None or len(name) > len(best)):
+            best = name
+    return prices[best] if best is not None else None
+
+
+# ---------- Агрегаты ----------
+
+class UsageAggregate:
+    """
+    hourly: (час "ГГГГ-ММ-ДД ЧЧ", модель, температура) -> [запросов, вход, выход, попаданий
+    в кэш ответов, входных токенов из кэша промптов];
+    hist: (день, модель) -> три гистограммы {корзина токенов: запросов} — вход, выход, всего
+    (для перцентилей токенов на запрос).
+    """
+
+    __slots__ = ("hourly", "hist", "rows", "bad_rows", "_entries")
+
+    def __init__(self) -> None:
+        self.hourly: dict[tuple[str, str, str], list[int]] = {}
+        self.hist: dict[tuple[str, str], tuple[dict[int, int], dict[int, int], dict[int, int]]] = {}
+        self.rows = 0
+        self.bad_rows = 0
+        # (час, модель, температура) -> (суммы за час, гистограммы дня): один поиск на строку
+        self._entries: dict[tuple[str, str, str], tuple[list[int], dict[int, int], dict[int, int], dict[int, int]]] = {}
+
+    def histograms(self, day: str, model: str) -> tuple[dict[int, int], dict[int, int], dict[int, int]]:
+        hists = self.hist.get((day, model))
+        if hists is None:
+            hists = self.hist[(day, model)] = ({}, {}, {})
+        return hists
+
+    def add_lines(self, lines: list[str], columns: tuple[int, ...]) -> None:
+        i_dt, i_model, i_temp, i_prompt, i_completion, i_cached, i_coalesced = columns
+        entries = self._entries
+        table = _bucket_table_lookup()
+        size = len(table)
+        rows = bad = 0
+        for row in csv.reader(lines):
+            try:
+                key = (row[i_dt][:13], row[i_model], row[i_temp])
+                prompt = int(row[i_prompt])
+                completion = int(row[i_completion])
+                cached = int(row[i_cached]) if i_cached >= 0 else 0
+                coalesced = i_coalesced >= 0 and row[i_coalesced] == "1"
+            except (IndexError, ValueError):
+                bad += 1
+                continue
+            entry = entries.get(key)
+            if entry is None:
+                acc = self.hourly.get(key)
+                if acc is None:
+                    acc = self.hourly[key] = [0, 0, 0, 0, 0]
+                entry = entries[key] = (acc, *self.histograms(key[0][:10], key[1]))
+            acc, hist_prompt, hist_completion, hist_total = entry
+            acc[0] += 1
+            acc[1] += prompt
+            acc[2] += completion
+            acc[4] += cached
+            total = prompt + completion
+            if not total and not coalesced:
+                acc[3] += 1  # ответ из кэша пишется с нулевыми токенами (объединённый запрос — тоже, но с пометкой)
+            b = table[prompt] if prompt < size else token_bucket(prompt)
+            hist_prompt[b] = hist_prompt.get(b, 0) + 1
+            b = table[completion] if completion < size else token_bucket(completion)
+            hist_completion[b] = hist_completion.get(b, 0) + 1
+            b = table[total] if total < size else token_bucket(total)
+            hist_total[b] = hist_total.get(b, 0) + 1
+            rows += 1
+        self.rows += rows
+        self.bad_rows += bad
+
+    def merge_hourly(self, key: tuple[str, str, str], values: list[int]) -> None:
+        acc = self.hourly.get(key)
+        if acc is None:
+            self.hourly[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                acc[i] += value
+
+    def merge_hist(self, day: str, model: str, kind: int, tokens: int, count: int) -> None:
+        counts = self.histograms(day, model)[kind]
+        counts[tokens] = counts.get(tokens, 0) + count
+
+
+def _column_indexes(header_line: bytes, path: Path) -> tuple[int, ...]:
+    header = next(csv.reader([header_line.decode("utf-8-sig").strip()]), [])
+    missing = [c for c in _REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ValueError(f"{path}: в заголовке CSV нет колонок {', '.join(missing)}")
+    return tuple(header.index(c) if c in header else -1 for c in (*_REQUIRED_COLUMNS, *_OPTIONAL_COLUMNS))
+
+
+def read_usage_csv(path: Path, aggregate: UsageAggregate, offset: int = 0, chunk_bytes: int = CHUNK_BYTES) -> int:
+    """
+    Дочитывает CSV с байта offset в aggregate кусками по chunk_bytes; возвращает смещение
+    конца последней полной строки (недописанная ботом строка останется на следующий раз).
+    """
+    with open(path, "rb") as f:
+        header_line = f.readline()
+        if not header_line:
+            return 0
+        columns = _column_indexes(header_line, path)
+        offset = max(offset, f.tell())
+        f.seek(offset)
+        tail = b""
+        while True:
+            chunk = f.read(chunk_bytes)
+            if not chunk:
+                break
+            data = tail + chunk
+            cut = data.rfind(b"\n") + 1
+            if not cut:
+                tail = data
+                continue
+            tail = data[cut:]
+            aggregate.add_lines(data[:cut].decode("utf-8").splitlines(), columns)
+            offset += cut
+    return offset
+
+
+# ---------- Сводка в SQLite ----------
+
+class UsageSummaryStore:
+    """Свёрнутые агрегаты usage и смещения дочитанных файлов (одна транзакция на файл)."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS usage_hourly ("
+            "hour TEXT, model TEXT, temperature TEXT, requests INTEGER, prompt_tokens INTEGER, "
+            "completion_tokens INTEGER, cache_hits INTEGER, cached_tokens INTEGER NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (hour, model, temperature)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS usage_token_hist ("
+            "day TEXT, model TEXT, kind INTEGER, tokens INTEGER, requests INTEGER, "
+            "PRIMARY KEY (day, model, kind, tokens)) WITHOUT ROWID;"
+            "CREATE TABLE IF NOT EXISTS usage_sources ("
+            "path TEXT PRIMARY KEY, inode INTEGER, offset INTEGER, rows INTEGER, updated_at TEXT);"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(usage_hourly)")}
+        if "cached_tokens" not in columns:  # сводка из версии без колонки
+            with self._conn:
+                self._conn.execute("ALTER TABLE usage_hourly ADD COLUMN cached_tokens INTEGER NOT NULL DEFAULT 0")
+
+    def source_offset(self, path: Path) -> int:
+        """До какого байта файл уже свёрнут (0 — если файл новый, подменён или усечён)."""
+        stat = path.stat()
+        row = self._conn.execute(
+            "SELECT inode, offset FROM usage_sources WHERE path = ?", (str(path.resolve()),)
+        ).fetchone()
+        if row is None:
+            # Переименован без rename_source (бот при смене колонок) — тот же inode под другим именем
+            row = self._conn.execute(
+                "SELECT inode, offset FROM usage_sources WHERE inode = ? ORDER BY updated_at DESC LIMIT 1",
+                (stat.st_ino,),
+            ).fetchone()
+        if row is None:
+            return 0
+        inode, offset = row
+        if inode != stat.st_ino or stat.st_size < offset:
+            return 0
+        return offset
+
+    def save(self, aggregate: UsageAggregate, path: Path, offset: int) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO usage_hourly (hour, model, temperature, requests, prompt_tokens, "
+                "completion_tokens, cache_hits, cached_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (hour, model, temperature) DO UPDATE SET "
+                "requests = requests + excluded.requests, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "cache_hits = cache_hits + excluded.cache_hits, "
+                "cached_tokens = cached_tokens + excluded.cached_tokens",
+                (key + tuple(values) for key, values in aggregate.hourly.items()),
+            )
+            self._conn.executemany(
+                "INSERT INTO usage_token_hist VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (day, model, kind, tokens) DO UPDATE SET "
+                "requests = requests + excluded.requests",
+                (
+                    (day, model, kind, tokens, count)
+                    for (day, model), hists in aggregate.hist.items()
+                    for kind, counts in enumerate(hists)
+                    for tokens, count in counts.items()
+                ),
+            )
+            self._conn.execute(
+                "INSERT INTO usage_sources VALUES (?, ?, ?, ?, ?) ON CONFLICT (path) DO UPDATE SET "
+                "inode = excluded.inode, offset = excluded.offset, rows = rows + excluded.rows, "
+                "updated_at = excluded.updated_at",
+                (
+                    str(path.resolve()), path.stat().st_ino, offset, aggregate.rows,
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                ),
+            )
+
+    def rename_source(self, old: Path, new: Path) -> None:
+        """Файл переименован (ротация): смещение переезжает вместе с ним."""
+        with self._conn:
+            self._conn.execute(
+                "UPDATE usage_sources SET path = ? WHERE path = ?", (str(new.resolve()), str(old.resolve()))
+            )
+
+    def load(self, aggregate: UsageAggregate, since: str | None = None, until: str | None = None) -> None:
+        """Добавляет свёрнутые агрегаты (дни в [since, until]) в aggregate."""
+        lo, hi = since or "", until or "9999-12-31"
+        # hour — "ГГГГ-ММ-ДД ЧЧ": все часы дня hi меньше hi + " ~"
+        for hour, model, temperature, *values in self._conn.execute(
+            "SELECT hour, model, temperature, requests, prompt_tokens, completion_tokens, cache_hits, "
+            "cached_tokens FROM usage_hourly WHERE hour >= ? AND hour < ?", (lo, hi + " ~"),
+        ):
+            aggregate.merge_hourly((hour, model, temperature), values)
+        for day, model, kind, tokens, count in self._conn.execute(
+            "SELECT day, model, kind, tokens, requests FROM usage_token_hist WHERE day >= ? AND day <= ?", (lo, hi),
+        ):
+            aggregate.merge_hist(day, model, kind, tokens, count)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def rotate_usage_file(path: Path) -> Path:
+    """Переименовывает usage.csv в usage-ГГГГММДД-ЧЧММСС.csv рядом с ним."""
+    target = path.with_name(f"{path.stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}{path.suffix}")
+    os.replace(path, target)
+    return target
+
+
+def compact(paths: list[Path], summary_path: Path, rotate: bool = False) -> dict[str, Any]:
+    """
+    Сворачивает новые строки CSV в сводку; rotate=True — затем переименовывает файлы
+    (кроме уже переименованных).
+    """
+    store = UsageSummaryStore(summary_path)
+    result = {"files": 0, "rows": 0, "bad_rows": 0, "bytes": 0, "rotated": []}
+    try:
+        for path in paths:
+            if not path.exists():
+                logger.warning("Файл usage не найден: %s", path)
+                continue
+            targets = [path]
+            if rotate and not is_rotated(path):
+                # Сначала переименовываем, потом дочитываем: строки, которые бот успел
+                # дописать в старый файл до переоткрытия, тоже попадут в сводку
+                rotated = rotate_usage_file(path)
+                store.rename_source(path, rotated)
+                targets = [rotated]
+                result["rotated"].append(str(rotated))
+            for target in targets:
+                offset = store.source_offset(target)
+                aggregate = UsageAggregate()
+                end = read_usage_csv(target, aggregate, offset)
+                store.save(aggregate, target, end)
+                result["files"] += 1
+                result["rows"] += aggregate.rows
+                result["bad_rows"] += aggregate.bad_rows
+                result["bytes"] += end - offset
+    finally:
+        store.close()
+    return result
+
+
+# ---------- Отчёт ----------
+
+def _rollup(
+    aggregate: UsageAggregate,
+    by: tuple[str, ...],
+    since: str | None,
+    until: str | None,
+    prices: dict[str, tuple[float, ...]],
+) -> tuple[list[dict[str, Any]], set[str]]:
+    # Группа -> модель -> [запросов, вход, выход, из кэша, вход из кэша промптов]; стоимость — по целым суммам
+    # в конце, поэтому не зависит от порядка строк (CSV целиком или сводка + хвост)
+    groups: dict[tuple[str, ...], dict[str, list[int]]] = {}
+    for (hour, model, temperature), values in aggregate.hourly.items():
+        day = hour[:10]
+        if (since and day < since) or (until and day > until):
+            continue
+        fields = {"model": model, "day": day, "hour": hour[11:13], "temperature": temperature}
+        per_model = groups.setdefault(tuple(fields[d] for d in by), {})
+        acc = per_model.get(model)
+        if acc is None:
+            per_model[model] = list(values)
+        else:
+            for i, value in enumerate(values):
+                acc[i] += value
+
+    rows = []
+    unpriced: set[str] = set()
+    for key, per_model in sorted(groups.items()):
+        requests = prompt = completion = cache_hits = cached = 0
+        cost = 0.0
+        for model, (m_requests, m_prompt, m_completion, m_cache_hits, m_cached) in sorted(per_model.items()):
+            requests += m_requests
+            prompt += m_prompt
+            completion += m_completion
+            cache_hits += m_cache_hits
+            cached += m_cached
+            price = price_for(model, prices)
+            if price is None:
+                unpriced.add(model)
+            else:
+                cached_price = price[2] if len(price) > 2 else price[0]
+                cost += (
+                    (m_prompt - m_cached) * price[0] + m_cached * cached_price + m_completion * price[1]
+                ) / 1_000_000
+        rows.append({
+            **dict(zip(by, key)),
+            "requests": requests,
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+            "cache_hits": cache_hits,
+            "cached_tokens": cached,
+            "cached_share": cached / prompt if prompt else 0.0,
+            "cost_usd": cost,
+        })
+    return rows, unpriced
+
+
+def _token_percentiles(
+    aggregate: UsageAggregate, since: str | None, until: str | None
+) -> dict[str, dict[str, dict[str, float]]]:
+    per_model: dict[str, tuple[dict[int, int], dict[int, int], dict[int, int]]] = {}
+    for (day, model), hists in aggregate.hist.items():
+        if (since and day < since) or (until and day > until):
+            continue
+        if model not in per_model:
+            per_model[model] = ({}, {}, {})
+        for merged, counts in zip(per_model[model], hists):
+            for tokens, count in counts.items():
+                merged[tokens] = merged.get(tokens, 0) + count
+    return {
+        model: {kind: summarize_counts(counts) for kind, counts in zip(TOKEN_KINDS, hists)}
+        for model, hists in sorted(per_model.items())
+    }
+
+
+def build_report(
+    paths: list[Path],
+    by: tuple[str, ...] = ("model",),
+    since: str | None = None,
+    until: str | None = None,
+    summary_path: Path | None = None,
+    prices: dict[str, tuple[float, ...]] | None = None,
+) -> dict[str, Any]:
+    """
+    Отчёт по usage: сводка (если summary_path задан и существует) + непрочитанные
+    в неё хвосты CSV. since/until — дни "ГГГГ-ММ-ДД" включительно.
+    """
+    unknown = [d for d in by if d not in DIMENSIONS]
+    if not by or unknown:
+        raise ValueError(f"Неизвестные измерения: {', '.join(unknown)} (доступны: {', '.join(DIMENSIONS)})")
+    prices = MODEL_PRICES_PER_1M_TOKENS if prices is None else prices
+    start = time.perf_counter()
+    aggregate = UsageAggregate()
+    store = UsageSummaryStore(summary_path) if summary_path is not None and summary_path.exists() else None
+    csv_bytes = 0
+    try:
+        if store is not None:
+            store.load(aggregate, since, until)
+        for path in paths:
+            if not path.exists():
+                logger.info("Файл usage не найден: %s", path)
+                continue
+            offset = store.source_offset(path) if store is not None else 0
+            csv_bytes += read_usage_csv(path, aggregate, offset) - offset
+    finally:
+        if store is not None:
+            store.close()
+
+    groups, unpriced = _rollup(aggregate, by, since, until, prices)
+    totals = {
+        key: sum(g[key] for g in groups)
+        for key in (
+            "requests", "prompt_tokens", "completion_tokens", "total_tokens", "cache_hits", "cached_tokens", "cost_usd",
+        )
+    }
+    totals["cached_share"] = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+    return {
+        "by": list(by),
+        "since": since,
+        "until": until,
+        "groups": groups,
+        "totals": totals,
+        "percentiles": _token_percentiles(aggregate, since, until),
+        "unpriced_models": sorted(unpriced),
+        "csv_rows_read": aggregate.rows,
+        "csv_bad_rows": aggregate.bad_rows,
+        "csv_bytes_read": csv_bytes,
+        "used_summary": store is not None,
+        "elapsed_s": time.perf_counter() - start,
+    }
+
+
+def format_report(report: dict[str, Any]) -> str:
+    """Текстовая таблица отчёта для вывода в терминал."""
+    by = report["by"]
+    header = [*by, "запросов", "вход", "вход из кэша", "выход", "всего", "из кэша", "стоимость, $"]
+    rows = [
+        [*(str(g[d]) for d in by), str(g["requests"]), str(g["prompt_tokens"]),
+         f"{g['cached_tokens']} ({g['cached_share']:.0%})", str(g["completion_tokens"]),
+         str(g["total_tokens"]), str(g["cache_hits"]), f"{g['cost_usd']:.4f}"]
+        for g in report["groups"]
+    ]
+    t = report["totals"]
+    rows.append([
+        "итого", *([""] * (len(by) - 1)), str(t["requests"]), str(t["prompt_tokens"]),
+        f"{t['cached_tokens']} ({t['cached_share']:.0%})", str(t["completion_tokens"]), str(t["total_tokens"]),
+        str(t["cache_hits"]), f"{t['cost_usd']:.4f}",
+    ])
+    widths = [max(len(r[i]) for r in [header, *rows]) for i in range(len(header))]
+    lines = [" | ".join(cell.rjust(w) for cell, w in zip(row, widths)) for row in [header, *rows]]
+    lines.insert(1, "-+-".join("-" * w for w in widths))
+    lines.insert(-1, "-+-".join("-" * w for w in widths))
+
+    if report["percentiles"]:
+        lines.append("")
+        lines.append("Токены на запрос (p50 / p95 / p99 / макс):")
+        for model, stats in report["percentiles"].items():
+            parts = [
+                f"{label} {s['p50']:.0f} / {s['p95']:.0f} / {s['p99']:.0f} / {s['max']:.0f}"
+                for label, s in (
+                    ("вход", stats["prompt_tokens"]),
+                    ("выход", stats["completion_tokens"]),
+                    ("всего", stats["total_tokens"]),
+                )
+            ]
+            lines.append(f"  {model}: " + "; ".join(parts))
+    if report["unpriced_models"]:
+        lines.append("")
+        lines.append(f"Нет цены (MODEL_PRICES_PER_1M_TOKENS): {', '.join(report['unpriced_models'])}")
+    lines.append("")
+    lines.append(
+        f"Прочитано из CSV: {report['csv_rows_read']} строк ({report['csv_bytes_read'] / 1024 / 1024:.1f} МБ), "
+        f"битых: {report['csv_bad_rows']}; сводка: {'да' if report['used_summary'] else 'нет'}; "
+        f"{report['elapsed_s']:.2f} с"
+    )
+    return "\n".join(lines)
+
+
+def load_prices(path: Path) -> dict[str, tuple[float, ...]]:
+    """Цены из JSON {"модель": [вход, выход] или [вход, выход, вход из кэша]} ($ за 1M токенов)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return {model: tuple(float(x) for x in p[:3]) for model, p in json.load(f).items()}
@@ -0,0 +1,102 @@
+"""
+Последовательная обработка сообщений одного пользователя при параллельной — разных.
+
+aiogram обрабатывает апдейты параллельно: два быстрых сообщения одного пользователя
+иначе прочитали бы один и тот же контекст и дописали бы ответы вперемешку.
+KeyedLimiter даёт каждому ключу (user_id) свою очередь (asyncio.Lock, FIFO),
+а общее число одновременно обрабатываемых сообщений ограничивает семафором.
+Замок пользователя удаляется, как только у него не остаётся ни владельца, ни ожидающих.
+"""
+import asyncio
+from collections.abc import AsyncIterator, Hashable
+from contextlib import asynccontextmanager
+from typing import Any
+
+
+class _KeyState:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0  # владелец + ожидающие
+
+
+class KeyedLimiter:
+    """
+    async with limiter.hold(user_id): ... — сообщения одного ключа по очереди,
+    всего не больше max_concurrency одновременно (0 — без общего ограничения).
+    serialize=False отключает очередь по ключу (для сравнения в бенчмарках).
+    """
+
+    def __init__(self, max_concurrency: int = 0, serialize: bool = True) -> None:
+        self.max_concurrency = max_concurrency
+        self.serialize = serialize
+        self._keys: dict[Hashable, _KeyState] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.active = 0
+        self.max_active = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.handled = 0
+
+    def _global_semaphore(self) -> asyncio.Semaphore | None:
+        if self.max_concurrency <= 0:
+            return None
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        state: _KeyState | None = None
+        if self.serialize:
+            state = self._keys.get(key)
+            if state is None:
+                state = self._keys[key] = _KeyState()
+            state.users += 1
+        semaphore = self._global_semaphore()
+        locked = slotted = started = False
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            # Сначала очередь пользователя, потом общий слот: ожидающие своей очереди
+            # сообщения одного пользователя не занимают слоты других
+            if state is not None:
+                await state.lock.acquire()
+                locked = True
+            if semaphore is not None:
+                await semaphore.acquire()
+                slotted = True
+            self.waiting -= 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            started = True
+            try:
+                yield
+            finally:
+                self.active -= 1
+                self.handled += 1
+        finally:
+            if not started:
+                self.waiting -= 1
+            if slotted:
+                semaphore.release()
+            if locked:
+                state.lock.release()
+            if state is not None:
+                state.users -= 1
+                if state.users == 0:
+                    self._keys.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "keys": len(self._keys),
+            "active": self.active,
+            "max_active": self.max_active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "handled": self.handled,
+        }
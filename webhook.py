@@ -0,0 +1,231 @@
+"""
+Режим webhook: Telegram присылает апдейты POST-запросами на aiohttp-сервер вместо long polling.
+
+Обработчик запроса только читает JSON апдейта, кладёт его в ограниченную очередь и сразу
+отвечает 200 — Telegram не ждёт ответа модели. Апдейты разбирают WEBHOOK_WORKERS фоновых
+задач: это предел одновременно обрабатываемых апдейтов. Если очередь полна дольше
+WEBHOOK_ENQUEUE_TIMEOUT_SECONDS, ответ — 503, и Telegram повторит доставку позже
+(обратное давление вместо неограниченного роста задач в памяти).
+
+Остановка (SIGINT/SIGTERM): сервер перестаёт принимать запросы, очередь и начатые ответы
+дорабатываются (не дольше WEBHOOK_DRAIN_TIMEOUT_SECONDS), затем закрываются клиенты и логи.
+
+Локальная проверка без Telegram: WEBHOOK_URL = None (setWebhook не вызывается),
+`python main.py --webhook` и POST апдейта на http://127.0.0.1:8080/webhook;
+GET /healthz — состояние очереди. benchmarks/bench_webhook.py делает то же с заглушками
+OpenAI и Bot API.
+"""
+import asyncio
+import logging
+import secrets
+import time
+from collections.abc import Awaitable, Callable
+from typing import TYPE_CHECKING, Any
+
+from aiohttp import web
+
+import metrics
+from config import (
+    WEBHOOK_DRAIN_TIMEOUT_SECONDS,
+    WEBHOOK_ENQUEUE_TIMEOUT_SECONDS,
+    WEBHOOK_HOST,
+    WEBHOOK_MAX_CONNECTIONS,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+    validate_config,
+)
+from model_router import describe_models
+
+if TYPE_CHECKING:
+    from aiogram import Bot, Dispatcher  # aiogram загружается вместе с bot.py, после validate_config
+
+logger = logging.getLogger(__name__)
+
+# Поля stats() очереди → имена метрик (у shards.ShardRouter нет "active")
+_METRIC_NAMES = {
+    "queue_depth": "webhook_queue_depth",
+    "active": "webhook_active",
+    "accepted": "webhook_accepted_total",
+    "rejected": "webhook_rejected_total",
+}
+
+
+class UpdateQueue:
+    """Ограниченная очередь апдейтов и пул фоновых задач, которые их обрабатывают."""
+
+    def __init__(
+        self,
+        handle: Callable[[dict[str, Any]], Awaitable[Any]],
+        workers: int = WEBHOOK_WORKERS,
+        maxsize: int = WEBHOOK_QUEUE_SIZE,
+        enqueue_timeout: float | None = WEBHOOK_ENQUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self._handle = handle
+        self.workers = max(1, workers)
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: asyncio.Queue[tuple[float, dict[str, Any]]] = asyncio.Queue(max(0, maxsize))
+        self._tasks: list[asyncio.Task] = []
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.active = 0
+        self.max_depth = 0
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"webhook-worker-{i}") for i in range(self.workers)
+        ]
+
+    async def put(self, update: dict[str, Any]) -> bool:
+        """
+        Ставит апдейт в очередь; False — очередь полна дольше enqueue_timeout секунд
+        (None — ждать места сколько угодно).
+        """
+        item = (time.perf_counter(), update)
+        try:
+            if self.enqueue_timeout is None or self.enqueue_timeout > 0:
+                await asyncio.wait_for(self._queue.put(item), self.enqueue_timeout)
+            else:
+                self._queue.put_nowait(item)
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            enqueued_at, update = await self._queue.get()
+            metrics.observe("webhook_queue_wait", time.perf_counter() - enqueued_at)
+            self.active += 1
+            try:
+                await self._handle(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.exception("Ошибка обработки апдейта %s: %s", update.get("update_id"), e)
+            finally:
+                self.active -= 1
+                self._queue.task_done()
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT_SECONDS) -> bool:
+        """Ждёт, пока очередь и начатые апдейты доработают, затем останавливает задачи."""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+            drained = True
+        except asyncio.TimeoutError:
+            drained = False
+            logger.warning(
+                "Очередь webhook не доработала за %s с: осталось %s, в обработке %s",
+                timeout, self._queue.qsize(), self.active,
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        return drained
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "queue_depth": self._queue.qsize(),
+            "max_queue_depth": self.max_depth,
+            "active": self.active,
+            "workers": self.workers,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "processed": self.processed,
+            "failed": self.failed,
+        }
+
+
+def make_app(
+    bot: "Bot",
+    dp: "Dispatcher",
+    queue: Any = None,
+    path: str = WEBHOOK_PATH,
+    secret: str = WEBHOOK_SECRET,
+    webhook_url: str | None = WEBHOOK_URL,
+    on_closed: Callable[[], Awaitable[None]] | None = None,
+) -> web.Application:
+    """
+    aiohttp-приложение: POST path — приём апдейтов, GET /healthz — состояние очереди.
+    queue — UpdateQueue (по умолчанию) или shards.ShardRouter (несколько процессов).
+    on_closed вызывается после доработки очереди (закрытие клиентов и логов).
+    """
+    if queue is None:
+        queue = UpdateQueue(lambda update: dp.feed_raw_update(bot, update))
+
+    async def receive(request: web.Request) -> web.Response:
+        if secret and not secrets.compare_digest(
+            request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), secret
+        ):
+            return web.Response(status=401, text="Unauthorized")
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400, text="Bad JSON")
+        if not isinstance(update, dict) or not isinstance(update.get("update_id"), int):
+            return web.Response(status=400, text="Not a Telegram update")
+        if not await queue.put(update):
+            metrics.inc("webhook_rejected")
+            return web.Response(status=503, text="Busy", headers={"Retry-After": "1"})
+        return web.Response(status=200)
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response(queue.stats())
+
+    async def on_startup(app: web.Application) -> None:
+        queue.start()
+        await dp.emit_startup(bot=bot)
+        if webhook_url:
+            await bot.set_webhook(
+                webhook_url,
+                secret_token=secret or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            logger.info("Webhook зарегистрирован: %s", webhook_url)
+
+    async def on_shutdown(app: web.Application) -> None:
+        # Приём уже остановлен: дорабатываем принятые апдейты и начатые ответы
+        logger.info("Остановка webhook: дорабатываем очередь (%s апдейтов)", queue.stats()["queue_depth"])
+        await queue.drain()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        if on_closed is not None:
+            await on_closed()
+
+    def collect_metrics() -> dict[str, float]:
+        stats = queue.stats()
+        return {metric: stats[key] for key, metric in _METRIC_NAMES.items() if key in stats}
+
+    metrics.register_collector("webhook", collect_metrics)
+    app = web.Application()
+    app["update_queue"] = queue
+    app.router.add_post(path, receive)
+    app.router.add_get("/healthz", healthz)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+def run_webhook(host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT) -> None:
+    """Запускает бота в режиме webhook (блокирует до SIGINT/SIGTERM)."""
+    validate_config()
+    from bot import close_resources, dp, get_bot
+
+    logger.info(
+        "Бот запущен (webhook http://%s:%s%s), модель: %s, обработчиков: %s, очередь: %s",
+        host, port, WEBHOOK_PATH, describe_models(), WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE,
+    )
+    if not WEBHOOK_URL:
+        logger.info("WEBHOOK_URL не задан: setWebhook не вызывается (локальный режим)")
+    metrics.start_exporters()
+    app = make_app(get_bot(), dp, on_closed=close_resources)
+    web.run_app(app, host=host, port=port, print=None)